@@ -7,6 +7,7 @@ from interactions import (
     ActionRow, ComponentContext, component_callback, listen
 )
 from services.events.events import EventsService, setup_tasks
+from utils.dispatch import ANNOUNCE
 from utils.tomlIO import TomlIO
 
 
@@ -28,7 +29,21 @@ class EventsCog(Extension):
     @listen()
     async def on_startup(self):
         """ Запускает фоновую задачу после старта бота """
-        setup_tasks(self.bot, self.svc)
+        await setup_tasks(self.bot, self.svc)
+
+
+
+    @listen()
+    async def on_channel_update(self, event):
+        """ Обновляет закэшированный канал (ChannelCache) """
+        self.svc.channels.update(event.after)
+
+
+
+    @listen()
+    async def on_channel_delete(self, event):
+        """ Убирает удалённый канал из кэша (ChannelCache) """
+        self.svc.channels.evict(event.channel.id)
 
 
 
@@ -93,24 +108,25 @@ class EventsCog(Extension):
 
         try:
             mid = int(message_id)
-            event = self.svc.db.get_event(mid)
+            event = await self.svc.db.get_event(mid)
             if not event:
                 return await ctx.send("Ивент не найден", ephemeral=True)
 
 
-            self.svc.db.set_status(mid, "finished")
+            await self.svc.db.set_status(mid, "finished")
+            # Отложенная перерисовка счётчика больше не нужна
+            self.svc.coalescer.discard(mid)
 
 
-            embed = self.svc.build_event_embed(mid)
-            ids = [int(p) for p in (event["participants"].split(",") if event["participants"] else []) if p]
+            embed = await self.svc.build_event_embed(mid)
+            ids = event["participants"]
             if ids:
                 mentions = "\n".join(f"<@{pid}>" for pid in ids)
                 embed.add_field(name="Участники", value=mentions, inline=False)
 
-            channel_id = int(self.svc.cfg.get("channels.events"))
-            channel = await ctx.client.fetch_channel(channel_id)
-            msg = await channel.fetch_message(mid)
-            await msg.edit(embed=embed, components=[])
+            channel_id = self.svc.channels.channel_id("events")
+            await self.svc.renders.edit_by_id(mid, self.svc.channels.editor(ctx.client, channel_id, mid, ANNOUNCE),
+                                              embed=embed, components=[])
 
             await ctx.send("✅ Ивент завершён", ephemeral=True)
         except Exception as e:
@@ -123,12 +139,11 @@ class EventsCog(Extension):
         try:
             message_id = int(ctx.message.id)
             # Проверим текущее состояние и переключим
-            event = self.svc.db.get_event(message_id)
             user_id = int(ctx.author.id)
-            participants = [int(p) for p in (event["participants"].split(",") if event and event["participants"] else []) if p]
+            was_in = await self.svc.db.is_participant(message_id, user_id)
 
             did_join = False
-            if user_id in participants:
+            if was_in:
                 ok, cur, mx = await self.svc.leave(message_id, user_id)
                 text = "✅ Вы вышли из ивента" if ok else "❗ Ошибка выхода"
             else:
@@ -138,13 +153,8 @@ class EventsCog(Extension):
                 text = f"✅ Вы в списке участников ({cur}/{mx})"
                 did_join = True
 
-            # Обновим embed (счётчики/статус) в основном сообщении
-            updated_embed = self.svc.build_event_embed(message_id)
-            await ctx.message.edit(embed=updated_embed)
-
             # Эпhemeral кнопки с персональной надписью "Выйти"/"Присоединиться"
-            in_event = user_id in ([int(p) for p in (self.svc.db.get_event(message_id)["participants"].split(",") 
-                       if self.svc.db.get_event(message_id)["participants"] else []) if p])
+            in_event = did_join or (was_in and not ok)
             personal_row = ActionRow(
                 Button(style=ButtonStyle.DANGER if in_event else ButtonStyle.SUCCESS,
                        label="Выйти" if in_event else "Присоединиться",
@@ -155,6 +165,10 @@ class EventsCog(Extension):
                 await ctx.send(text, ephemeral=True)
             else:
                 await ctx.send(text, components=personal_row, ephemeral=True)
+
+            # Ответ уходит сразу, а сообщение ивента перерисовывается
+            # не чаще раза за окно — один раз на всю волну нажатий
+            self.svc.mark_event_dirty(ctx.client, int(ctx.channel_id), message_id)
         except Exception as e:
             await ctx.send(f"❗ Ошибка: {e}", ephemeral=True)
 
@@ -165,8 +179,7 @@ class EventsCog(Extension):
         """ Показывает список участников текущего ивента (ephemeral) """
         try:
             message_id = int(ctx.message.id)
-            event = self.svc.db.get_event(message_id)
-            ids = [int(p) for p in (event["participants"].split(",") if event and event["participants"] else []) if p]
+            ids = await self.svc.db.list_participants(message_id)
             if not ids:
                 return await ctx.send("Пока никто не присоединился", ephemeral=True)
             # Формируем список упоминаний
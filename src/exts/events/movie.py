@@ -8,6 +8,7 @@ from interactions import (
     modal_callback, ModalContext
 )
 from services.events.movie import MovieService, setup_tasks
+from utils.dispatch import ANNOUNCE
 from utils.tomlIO import TomlIO
 from typing import Dict
 
@@ -28,7 +29,7 @@ class MovieCog(Extension):
 
     @listen()
     async def on_startup(self):
-        setup_tasks(self.bot, self.svc)
+        await setup_tasks(self.bot, self.svc)
 
 
     movie = SlashCommand(
@@ -73,33 +74,31 @@ class MovieCog(Extension):
                        message_id: str):
         try:
             mid = int(message_id)
-            poll = self.svc.db.get_poll(mid)
+            poll = await self.svc.db.get_poll(mid)
             if not poll:
                 return await ctx.send("Опрос не найден", ephemeral=True)
 
-            self.svc.db.set_poll_status(mid, "closed")
+            winner = await self.svc.db.close_poll(mid)
+            self.svc.coalescer.discard(mid)
 
-            channel_id = int(self.svc.cfg.get("channels.movie_polls"))
-            channel = await ctx.client.fetch_channel(channel_id)
-            msg = await channel.fetch_message(mid)
+            channel = await self.svc.channels.get(ctx.client, "movie_polls")
 
-            embed = self.svc._build_poll_embed(mid)
-            winner = self.svc.db.pick_winner(mid)
+            embed = await self.svc._build_poll_embed(mid)
             if winner:
                 embed.add_field(name="Победитель",
-                                value=f"{winner['title']} ({self.svc.db.count_votes_by_option(mid).get(int(winner['id']), 0)} голосов)",
+                                value=f"{winner['title']} ({winner['_votes']} голосов)",
                                 inline=False)
-            await msg.edit(embed=embed, components=[])
+            await self.svc.renders.edit_by_id(mid, self.svc.channels.editor(ctx.client, int(channel.id), mid, ANNOUNCE),
+                                              embed=embed, components=[])
 
             # Объявление победителя с пингом роли movie (если есть)
-            winner = self.svc.db.pick_winner(mid)
             if winner:
                 role_id = self.svc.cfg.get("roles.movie")
                 mention = f"<@&{int(role_id)}> " if role_id else ""
                 announce = f"{mention}🎉 Голосование завершено! Сегодня смотрим: {winner['title']}"
                 if winner.get("link"):
                     announce += f"\n{winner['link']}"
-                await channel.send(announce)
+                await self.svc.dispatch.send(channel, announce)
 
             await ctx.send("✅ Опрос завершён", ephemeral=True)
         except Exception as e:
@@ -131,7 +130,7 @@ class MovieCog(Extension):
             poll_message_id = self._pending_add.get(user_id)
             if not poll_message_id:
                 # Фоллбэк: возьмём последний открытый опрос
-                latest = self.svc.db.get_latest_open_poll()
+                latest = await self.svc.db.get_latest_open_poll()
                 if not latest:
                     return await ctx.send("❗ Не найден активный опрос", ephemeral=True)
                 poll_message_id = int(latest["message_id"])
@@ -143,15 +142,8 @@ class MovieCog(Extension):
             if not ok:
                 return await ctx.send("❗ Не удалось добавить (возможно, дубликат или опрос закрыт)", ephemeral=True)
 
-            # Обновляем сообщение
-            channel_id = int(self.svc.cfg.get("channels.movie_polls"))
-            channel = await self.bot.fetch_channel(channel_id)
-            try:
-                msg = await channel.fetch_message(poll_message_id)
-                await msg.edit(embed=self.svc._build_poll_embed(poll_message_id),
-                               components=self.svc._build_vote_components(poll_message_id))
-            except Exception:
-                pass
+            # Обновляем сообщение (объединяется с другими изменениями опроса)
+            self.svc.mark_poll_dirty(self.bot, poll_message_id)
 
             await ctx.send("✅ Вариант добавлен", ephemeral=True)
         except Exception as e:
@@ -174,8 +166,10 @@ class MovieCog(Extension):
             if not ok:
                 return await ctx.send("❗ Не удалось проголосовать (возможно, опрос закрыт)", ephemeral=True)
 
-            await ctx.edit_origin(embed=self.svc._build_poll_embed(poll_message_id),
-                                  components=self.svc._build_vote_components(poll_message_id))
+            # Голос подтверждается сразу, а сообщение опроса перерисовывается
+            # не чаще раза за окно — один раз на всю волну голосов
+            await ctx.send("✅ Голос учтён", ephemeral=True)
+            self.svc.mark_poll_dirty(ctx.client, poll_message_id)
         except Exception as e:
             await ctx.send(f"❗ Ошибка: {e}", ephemeral=True)
 
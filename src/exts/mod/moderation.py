@@ -1,16 +1,24 @@
 import os
+import time
+import interactions
 from interactions import (
     SlashCommand, slash_option,
     Extension, Permissions,
     OptionType, SlashContext,
-    Member
+    Member, Embed, listen
 )
+from typing import Dict, List, Tuple
 from services.mod.moderation import ModerationService
+from services.mod.resolver import parse_ids
+from services.mod.mass import ACTIONS
+from utils.stats import snapshot
 
 
 
 from config import admin
 _moder_perms = Permissions(int(admin.get("permissions.moderation")))
+# /m mass-*: окно «пришедшие за последние N минут» не больше суток (опечатка не заденет весь сервер)
+_mass_max_minutes = int(admin.get("moderation.mass_max_minutes", 1440))
 
 
 
@@ -20,11 +28,17 @@ class ModerationCog(Extension):
         Commands:
             /m kick <member> [reason]: кинуть пользователя
             /m ban  <member> [reason]: забанить пользователя
-            /m mute <member> [reason]: замьютить пользователя
+            /m mute <member> [reason] [minutes]: замьютить пользователя (на время или бессрочно)
             /m unmute <member> [reason]: размьютить пользователя
+            /m mass-ban [members] [minutes] [reason] [delete_messages]: забанить многих
+            /m mass-kick [members] [minutes] [reason]: кикнуть многих
+            /m mass-mute [members] [minutes] [reason]: замьютить многих
+            /m purge <count> [member] [minutes] [reason]: удалить сообщения в канале
+            /m stats: очереди, задержки и кэши бота
     """
 
     def __init__(self, bot) -> None:
+        self.bot = bot
         self.svc = ModerationService()
 
         self.answers = {
@@ -40,6 +54,13 @@ class ModerationCog(Extension):
 
 
 
+    @listen()
+    async def on_startup(self):
+        """ Снимает мьюты, истёкшие за время простоя, и планирует остальные """
+        await self.svc.mutes.start(self.bot)
+
+
+
     m = SlashCommand(name="m", 
                      description="Функции модерации",
                      default_member_permissions=_moder_perms)
@@ -91,7 +112,9 @@ class ModerationCog(Extension):
     @slash_option(name="delete_messages",
                   description="Удалить сообщения пользователя (0-7 дней)",
                   opt_type=OptionType.INTEGER,
-                  required=False)
+                  required=False,
+                  min_value=0,
+                  max_value=7)
     async def cmd_ban(self, 
                       ctx: SlashContext, 
                       member: Member,
@@ -118,9 +141,9 @@ class ModerationCog(Extension):
 
 
 
-    @m.subcommand(sub_cmd_name="unban", sub_cmd_description="Разбанить пользователя")
+    @m.subcommand(sub_cmd_name="unban", sub_cmd_description="Разбанить пользователей")
     @slash_option(name="member",
-                description="ID или упоминание забаненного пользователя",
+                description="ID или упоминания забаненных пользователей (через пробел)",
                 opt_type=OptionType.STRING,
                 required=True)
     @slash_option(name="reason",
@@ -133,27 +156,27 @@ class ModerationCog(Extension):
                         reason: str = "Не указана"):
 
         """
-            Разбанивает пользователя по ID/упоминанию.
+            Разбанивает пользователей по ID/упоминаниям.
 
-            /m unban <member> <reason>
+            /m unban <member1 member2 ...> <reason>
 
             Arguments:
-                member (str): ID или упоминание (обязательное поле)
+                member (str): ID или упоминания (обязательное поле)
                 reason (str): причина (необязательное поле)
         """
 
-        try:
-            uid = int(''.join(filter(str.isdigit, member)))
-        except ValueError:
+        ids = parse_ids(member)
+        if not ids:
             return await ctx.send("❗ Неверный формат пользователя", ephemeral=True)
 
-        res = await self.svc.unban(guild=ctx.guild, 
-                                   author=ctx.author, 
-                                   user_id=uid, 
-                                   reason=reason)
+        await ctx.defer(ephemeral=True)
+        results = await self.svc.unbans(guild=ctx.guild,
+                                        author=ctx.author,
+                                        users=ids,
+                                        reason=reason)
 
-        msg = self._build_answer(res, f"<@{uid}>", "разбанен", "уже разбанен")
-        await ctx.send(msg, ephemeral=True)
+        lines = [self._build_answer(res, f"<@{uid}>", "разбанен", "уже разбанен") for uid, res in results]
+        await ctx.send("\n".join(lines)[:2000], ephemeral=True)
 
 
 
@@ -166,27 +189,37 @@ class ModerationCog(Extension):
                   description="Причина мьюта",
                   opt_type=OptionType.STRING,
                   required=False)
+    @slash_option(name="minutes",
+                  description="Срок мьюта в минутах (без срока — бессрочно)",
+                  opt_type=OptionType.INTEGER,
+                  required=False,
+                  min_value=1)
     async def cmd_mute(self,
                        ctx: SlashContext,
                        member: Member,
-                       reason: str = "Не указана"):
+                       reason: str = "Не указана",
+                       minutes: int = 0):
 
         """
             Мьютит пользователя
 
-            /m mute <member> <reason>
+            /m mute <member> <reason> <minutes>
 
             Arguments:
                 member (Member): пользователь (обязательное поле)
                 reason (str): причина (необязательное поле)
+                minutes (int): срок в минутах (необязательное поле)
         """
 
         res = await self.svc.mute(guild=ctx.guild,
                                   member=member,
                                   author=ctx.author,
-                                  reason=reason)
+                                  reason=reason,
+                                  minutes=minutes)
 
         msg = self._build_answer(res, member.mention, "замьючен", "уже замьючен")
+        if res in (1, 2) and minutes:
+            msg += f"\n⏳ Мьют снимется <t:{int(time.time()) + minutes * 60}:R>"
         await ctx.send(msg, ephemeral=True)
 
 
@@ -225,3 +258,293 @@ class ModerationCog(Extension):
                         
             
 
+
+
+    def _mass_embed(self,
+                    action: str,
+                    counts: Dict[str, int],
+                    total: int,
+                    finished: bool,
+                    problems: List[Tuple[int, str, str]] = ()) -> Embed:
+        """Прогресс / итоговый отчёт массового действия"""
+        processed = total - counts.get("pending", 0)
+        title = "✅ Готово" if finished else f"⏳ Выполняется: {processed}/{total}"
+        embed = Embed(title=f"{title} — массовый {ACTIONS[action]}",
+                      color=0x57F287 if finished else 0x5865F2)
+        embed.add_field(name="Готово", value=str(counts.get("done", 0)), inline=True)
+        embed.add_field(name="Пропущено", value=str(counts.get("skipped", 0)), inline=True)
+        embed.add_field(name="Нет прав", value=str(counts.get("forbidden", 0)), inline=True)
+        embed.add_field(name="Ошибки", value=str(counts.get("failed", 0)), inline=True)
+        if problems:
+            lines = [f"<@{uid}>: {error or status}" for uid, status, error in problems[:20]]
+            if len(problems) > 20:
+                lines.append(f"… и ещё {len(problems) - 20}")
+            embed.add_field(name="Не обработаны", value="\n".join(lines)[:1024], inline=False)
+        return embed
+
+
+
+    async def _run_mass(self,
+                        ctx: SlashContext,
+                        action: str,
+                        members: str,
+                        minutes: int,
+                        reason: str,
+                        delete_messages: int = 0):
+        """Общая часть /m mass-*: цели из списка ID и/или по времени входа, прогресс в ответе"""
+        await ctx.defer(ephemeral=True)
+
+        ids = parse_ids(members or "")
+        if minutes:
+            try:
+                ids += await self.svc.mass.joined_since(ctx.guild, minutes)
+            except ValueError as e:
+                return await ctx.send(f"❗ {e}", ephemeral=True)
+        if not ids:
+            return await ctx.send("Не найдено ни одного пользователя", ephemeral=True)
+
+        async def progress(counts: Dict[str, int], total: int, finished: bool) -> None:
+            if not finished:
+                await ctx.edit(embed=self._mass_embed(action, counts, total, False))
+
+        result = await self.svc.mass.run(ctx.guild, action, ids, ctx.author, reason,
+                                         delete_messages=delete_messages,
+                                         protected=[ctx.bot.user.id],
+                                         progress=progress)
+        await ctx.edit(embed=self._mass_embed(action, result["counts"], result["total"], True, result["problems"]))
+
+
+
+    @m.subcommand(sub_cmd_name="mass-ban", sub_cmd_description="Забанить нескольких пользователей")
+    @slash_option(name="members",
+                  description="ID или упоминания через пробел",
+                  opt_type=OptionType.STRING,
+                  required=False)
+    @slash_option(name="minutes",
+                  description="Все, кто пришёл за последние N минут",
+                  opt_type=OptionType.INTEGER,
+                  required=False,
+                  min_value=1,
+                  max_value=_mass_max_minutes)
+    @slash_option(name="reason",
+                  description="Причина бана",
+                  opt_type=OptionType.STRING,
+                  required=False)
+    @slash_option(name="delete_messages",
+                  description="Удалить сообщения пользователей (0-7 дней)",
+                  opt_type=OptionType.INTEGER,
+                  required=False,
+                  min_value=0,
+                  max_value=7)
+    async def cmd_mass_ban(self,
+                           ctx: SlashContext,
+                           members: str = "",
+                           minutes: int = 0,
+                           reason: str = "Не указана",
+                           delete_messages: int = 0):
+
+        """
+            Банит пользователей из списка и/или пришедших за последние N минут
+
+            /m mass-ban [members] [minutes] [reason] [delete_messages]
+
+            Arguments:
+                members (str): ID или упоминания (необязательное поле)
+                minutes (int): пришедшие за последние N минут (необязательное поле)
+                reason (str): причина (необязательное поле)
+                delete_messages (int): удалить сообщения за N дней (необязательное поле)
+        """
+
+        await self._run_mass(ctx, "ban", members, minutes, reason, delete_messages)
+
+
+
+    @m.subcommand(sub_cmd_name="mass-kick", sub_cmd_description="Кикнуть нескольких пользователей")
+    @slash_option(name="members",
+                  description="ID или упоминания через пробел",
+                  opt_type=OptionType.STRING,
+                  required=False)
+    @slash_option(name="minutes",
+                  description="Все, кто пришёл за последние N минут",
+                  opt_type=OptionType.INTEGER,
+                  required=False,
+                  min_value=1,
+                  max_value=_mass_max_minutes)
+    @slash_option(name="reason",
+                  description="Причина кика",
+                  opt_type=OptionType.STRING,
+                  required=False)
+    async def cmd_mass_kick(self,
+                            ctx: SlashContext,
+                            members: str = "",
+                            minutes: int = 0,
+                            reason: str = "Не указана"):
+
+        """
+            Кикает пользователей из списка и/или пришедших за последние N минут
+
+            /m mass-kick [members] [minutes] [reason]
+
+            Arguments:
+                members (str): ID или упоминания (необязательное поле)
+                minutes (int): пришедшие за последние N минут (необязательное поле)
+                reason (str): причина (необязательное поле)
+        """
+
+        await self._run_mass(ctx, "kick", members, minutes, reason)
+
+
+
+    @m.subcommand(sub_cmd_name="mass-mute", sub_cmd_description="Замьютить нескольких пользователей")
+    @slash_option(name="members",
+                  description="ID или упоминания через пробел",
+                  opt_type=OptionType.STRING,
+                  required=False)
+    @slash_option(name="minutes",
+                  description="Все, кто пришёл за последние N минут",
+                  opt_type=OptionType.INTEGER,
+                  required=False,
+                  min_value=1,
+                  max_value=_mass_max_minutes)
+    @slash_option(name="reason",
+                  description="Причина мьюта",
+                  opt_type=OptionType.STRING,
+                  required=False)
+    async def cmd_mass_mute(self,
+                            ctx: SlashContext,
+                            members: str = "",
+                            minutes: int = 0,
+                            reason: str = "Не указана"):
+
+        """
+            Мьютит пользователей из списка и/или пришедших за последние N минут
+
+            /m mass-mute [members] [minutes] [reason]
+
+            Arguments:
+                members (str): ID или упоминания (необязательное поле)
+                minutes (int): пришедшие за последние N минут (необязательное поле)
+                reason (str): причина (необязательное поле)
+        """
+
+        await self._run_mass(ctx, "mute", members, minutes, reason)
+
+
+
+    @m.subcommand(sub_cmd_name="purge", sub_cmd_description="Удалить сообщения в канале")
+    @slash_option(name="count",
+                  description="Сколько сообщений удалить (1-1000)",
+                  opt_type=OptionType.INTEGER,
+                  required=True,
+                  min_value=1,
+                  max_value=1000)
+    @slash_option(name="member",
+                  description="Только сообщения этого пользователя",
+                  opt_type=OptionType.USER,
+                  required=False)
+    @slash_option(name="minutes",
+                  description="Только сообщения за последние N минут",
+                  opt_type=OptionType.INTEGER,
+                  required=False,
+                  min_value=1)
+    @slash_option(name="reason",
+                  description="Причина очистки",
+                  opt_type=OptionType.STRING,
+                  required=False)
+    async def cmd_purge(self,
+                        ctx: SlashContext,
+                        count: int,
+                        member: Member = None,
+                        minutes: int = 0,
+                        reason: str = "Не указана"):
+
+        """
+            Удаляет последние сообщения в текущем канале
+
+            /m purge <count> [member] [minutes] [reason]
+
+            Arguments:
+                count (int): сколько сообщений удалить (обязательное поле)
+                member (Member): только сообщения пользователя (необязательное поле)
+                minutes (int): только за последние N минут (необязательное поле)
+                reason (str): причина (необязательное поле)
+        """
+
+        await ctx.defer(ephemeral=True)
+
+        async def progress(stats: Dict[str, int]) -> None:
+            await ctx.edit(content=f"⏳ Удалено сообщений: {stats['deleted']} (старые удаляются по одному)")
+
+        try:
+            res = await self.svc.purge(channel=ctx.channel,
+                                       author=ctx.author,
+                                       count=count,
+                                       member_id=int(member.id) if member is not None else None,
+                                       minutes=minutes,
+                                       reason=reason,
+                                       progress=progress)
+        except interactions.errors.Forbidden:
+            return await ctx.send("❌ Недостаточно прав для очистки канала", ephemeral=True)
+        except ValueError as e:
+            return await ctx.send(f"❗ {e}", ephemeral=True)
+
+        msg = f"✅ Удалено сообщений: {res['deleted']}"
+        if res["failed"]:
+            msg += f"\n❗ Не удалось удалить: {res['failed']}"
+        if res["old_skipped"]:
+            msg += (f"\n⚠️ Сообщения старше 14 дней удаляются не больше {self.svc.purge_old_limit} за раз, "
+                    "остальные пропущены — повторите команду")
+        await ctx.edit(content=msg)
+
+
+
+    @m.subcommand(sub_cmd_name="stats", sub_cmd_description="Состояние очередей и кэшей бота")
+    async def cmd_stats(self, ctx: SlashContext):
+
+        """
+            Показывает очередь запросов к Discord (глубина и ожидание по приоритетам),
+            планировщик дедлайнов, задачи, очередь логов и кэши
+
+            /m stats
+        """
+
+        data = snapshot()
+        d = data["dispatch"]
+        embed = Embed(title="📈 Состояние бота", color=0x5865F2)
+
+        queue_lines = []
+        for name, depth in d["depth"].items():
+            wait = d["wait"].get(name)
+            line = f"{name}: в очереди {depth}"
+            if wait and wait["count"]:
+                line += f", ожидание ср. {wait['avg'] * 1000:.0f} мс / макс. {wait['max'] * 1000:.0f} мс"
+            queue_lines.append(line)
+        queue_lines.append(f"выполняется {d['running']}, отправлено {d['sent']}, ошибок {d['failed']}, "
+                           f"заменено {d['coalesced']}, приторможено {d['throttled']}")
+        embed.add_field(name="Запросы к Discord", value="\n".join(queue_lines)[:1024], inline=False)
+
+        s = data["scheduler"]
+        embed.add_field(name="Дедлайны",
+                        value=f"ожидают {s['pending']}, сработало {s['fired']}, "
+                              f"опоздание ср. {s['lag_avg']:.2f} с / макс. {s['lag_max']:.2f} с",
+                        inline=False)
+
+        j = data["jobs"]
+        embed.add_field(name="Задачи",
+                        value=f"выполнено {j['done']}, повторов {j['retried']}, провалено {j['failed']}",
+                        inline=False)
+
+        lg = data["log"]
+        embed.add_field(name="Логи",
+                        value=f"в очереди {lg['queued']}, отброшено {lg['dropped']}",
+                        inline=False)
+
+        cache_lines = [f"{c['name']}: {c['entries']} записей, попаданий {c['hit_rate']:.0%}"
+                       for c in data["cache"].values()]
+        r, ch, mb = data["renders"], data["channels"], data["members"]
+        cache_lines.append(f"правки: отправлено {r['sent']}, пропущено {r['skipped']}")
+        cache_lines.append(f"каналы: {ch['channels']}, попаданий {ch['hits']}, промахов {ch['misses']}")
+        cache_lines.append(f"участники: {mb['members']} на {mb['guilds']} серверах")
+        embed.add_field(name="Кэши", value="\n".join(cache_lines)[:1024], inline=False)
+
+        await ctx.send(embed=embed, ephemeral=True)
@@ -3,9 +3,11 @@ from interactions import (
     SlashCommand, slash_option,
     Extension, Permissions,
     OptionType, SlashContext,
-    Member, Role, Embed
+    Member, Role, Embed, listen
 )
 from services.mod.role import RoleService
+from services.mod.resolver import parse_ids
+from typing import Dict, List, Optional
 
 
 
@@ -22,10 +24,12 @@ class RoleCog(Extension):
         /role adds   <role> <members> [reason]
         /role remove <role> <member> [reason]
         /role removes  <role> <members> [reason]
+        /role job <job_id>
         /role in <role>
     """
 
     def __init__(self, bot) -> None:
+        self.bot = bot
         self.svc = RoleService()
         self.answers = {
             1:  ("✅", "Роль {role} {action} для {user}", 0x57F287),
@@ -40,6 +44,43 @@ class RoleCog(Extension):
 
 
 
+    @listen()
+    async def on_startup(self):
+        """Строит индекс ролей серверов и продолжает массовые задания, прерванные перезапуском"""
+        for guild in self.bot.guilds:
+            await self.svc.index.build(guild)
+        await self.svc.bulk.resume(self.bot)
+
+
+
+    @listen()
+    async def on_member_add(self, event):
+        """Новый участник — в индекс ролей"""
+        self.svc.index.add(event.guild_id, event.member)
+
+
+
+    @listen()
+    async def on_member_update(self, event):
+        """Изменились роли участника — обновляем индекс"""
+        self.svc.index.update(event.guild_id, event.after)
+
+
+
+    @listen()
+    async def on_member_remove(self, event):
+        """Участник ушёл — убираем из индекса"""
+        self.svc.index.remove(event.guild_id, event.member.id)
+
+
+
+    @listen()
+    async def on_role_delete(self, event):
+        """Роль удалена — убираем из индекса"""
+        self.svc.index.remove_role(event.guild_id, event.id)
+
+
+
     role = SlashCommand(
         name="role",
         description="Управление ролями",
@@ -122,10 +163,64 @@ class RoleCog(Extension):
 
 
 
-    @staticmethod
-    def _parse_user_list(raw: str) -> list[int]:
-        import re
-        return [int(x) for x in re.findall(r'\d+', raw)]
+    def _bulk_embed(self,
+                    job_id: int,
+                    role_name: str,
+                    action: str,
+                    counts: Dict[str, int],
+                    total: int,
+                    finished: bool,
+                    problems: Optional[List[Dict]] = None) -> Embed:
+        """Прогресс / итоговый отчёт задания массовой выдачи (снятия) роли"""
+        processed = total - counts.get("pending", 0)
+        title = "✅ Готово" if finished else f"⏳ Выполняется: {processed}/{total}"
+        embed = Embed(
+            title=f"{title} — роль {role_name} {action}",
+            color=0x57F287 if finished else 0x5865F2
+        )
+        embed.add_field(name="Готово", value=str(counts.get("done", 0)), inline=True)
+        embed.add_field(name="Пропущено", value=str(counts.get("skipped", 0)), inline=True)
+        embed.add_field(name="Нет прав", value=str(counts.get("forbidden", 0)), inline=True)
+        embed.add_field(name="Ошибки", value=str(counts.get("failed", 0)), inline=True)
+        if problems:
+            lines = [f"<@{t['user_id']}>: {t['error'] or t['status']}" for t in problems[:20]]
+            if len(problems) > 20:
+                lines.append(f"… и ещё {len(problems) - 20}")
+            embed.add_field(name="Не обработаны", value="\n".join(lines)[:1024], inline=False)
+        embed.set_footer(text=f"Задание #{job_id}")
+        return embed
+
+
+
+    async def _run_bulk(self,
+                        ctx: SlashContext,
+                        role: Role,
+                        members: str,
+                        reason: str,
+                        action: str):
+        """Общая часть /role adds и /role removes: задание с прогрессом в ответе"""
+        ids = parse_ids(members)
+        if not ids:
+            return await ctx.send("Не найдено ни одного участника", ephemeral=True)
+
+        # Сотни целей не успеть за время ответа на взаимодействие
+        await ctx.defer(ephemeral=True)
+        label = "выдана" if action == "add" else "убрана"
+
+        async def progress(job_id: int, counts: Dict[str, int], total: int, finished: bool) -> None:
+            if not finished:
+                await ctx.edit(embed=self._bulk_embed(job_id, role.name, label, counts, total, False))
+
+        run = self.svc.adds if action == "add" else self.svc.removes
+        try:
+            job_id, _ = await run(ctx.guild, role, ids, ctx.author, reason, progress)
+        except Exception as e:
+            return await ctx.send(f"❗ Ошибка: {e}", ephemeral=True)
+
+        report = await self.svc.bulk.report(job_id)
+        # Не полученные участники остаются pending: задание продолжится при resume
+        await ctx.edit(embed=self._bulk_embed(job_id, role.name, label, report["counts"], report["total"],
+                                              report["job"]["state"] != "running", report["problems"]))
 
 
 
@@ -159,14 +254,7 @@ class RoleCog(Extension):
                 reason (str): причина (необязательное поле)
         """
 
-        ids     = self._parse_user_list(members)
-        targets = [m for m in ctx.guild.members if m.id in ids]
-        if not targets:
-            return await ctx.send("Не найдено ни одного участника", ephemeral=True)
-
-        results = await self.svc.add_many(ctx.guild, targets, role, reason)
-        lines   = [self._build_answer(code, m.mention, role.mention, "выдана", "есть") for m, code in results]
-        await ctx.send("\n".join(lines), ephemeral=True)
+        await self._run_bulk(ctx, role, members, reason, "add")
 
 
 
@@ -200,14 +288,38 @@ class RoleCog(Extension):
                 reason (str): причина (необязательное поле)
         """
 
-        ids     = self._parse_user_list(members)
-        targets = [m for m in ctx.guild.members if m.id in ids]
-        if not targets:
-            return await ctx.send("Не найдено ни одного участника", ephemeral=True)
+        await self._run_bulk(ctx, role, members, reason, "remove")
+
+
+
+    @role.subcommand(sub_cmd_name="job", sub_cmd_description="Отчёт о массовой выдаче/снятии роли")
+    @slash_option(name="job_id",
+                  description="Номер задания",
+                  opt_type=OptionType.INTEGER,
+                  required=True)
+    async def cmd_job(self,
+                      ctx: SlashContext,
+                      job_id: int):
+
+        """
+            Показывает прогресс или итог задания /role adds, /role removes
+
+            /role job <job_id>
+
+            Arguments:
+                job_id (int): номер задания (обязательное поле)
+        """
+
+        report = await self.svc.bulk.report(job_id)
+        if report is None or int(report["job"]["guild_id"]) != int(ctx.guild.id):
+            return await ctx.send("Задание не найдено", ephemeral=True)
 
-        results = await self.svc.remove_many(ctx.guild, targets, role, reason)
-        lines   = [self._build_answer(code, m.mention, role.mention, "убрана", "нет") for m, code in results]
-        await ctx.send("\n".join(lines), ephemeral=True)
+        job = report["job"]
+        role = ctx.guild.get_role(int(job["role_id"]))
+        label = "выдана" if job["action"] == "add" else "убрана"
+        embed = self._bulk_embed(job_id, role.name if role else str(job["role_id"]), label, report["counts"], report["total"],
+                                 job["state"] != "running", report["problems"])
+        await ctx.send(embed=embed, ephemeral=True)
 
 
 
@@ -1,10 +1,13 @@
+import re
 from interactions import (
     SlashCommand, slash_option,
     Extension, Permissions,
     OptionType, SlashContext,
-    Member, Embed
+    Member, Embed, Button, ButtonStyle,
+    ComponentContext, component_callback, listen
 )
-from services.mod.warn import WarnService
+from typing import Any, Dict, List
+from services.mod.warn import WarnService, setup_warn_tasks
 
 
 
@@ -21,6 +24,7 @@ class WarnCog(Extension):
         /warn remove <member> [count] [reason]: убрать предупреждения
         /warn clear <member> [reason]: очистить все предупреждения
         /warn check <member>: проверить предупреждения
+        /warn history <member>: журнал предупреждений
     """
 
     def __init__(self, bot) -> None:
@@ -28,6 +32,13 @@ class WarnCog(Extension):
 
 
 
+    @listen()
+    async def on_startup(self):
+        """ Запускает ежедневное снятие истёкших предупреждений """
+        await setup_warn_tasks(self.svc)
+
+
+
     warn = SlashCommand(
         name="warn",
         description="Система предупреждений",
@@ -165,4 +176,69 @@ class WarnCog(Extension):
         )
         embed.add_field(name="Количество предупреждений", value=str(warns), inline=True)
         
-        await ctx.send(embed=embed, ephemeral=True)
\ No newline at end of file
+        await ctx.send(embed=embed, ephemeral=True)
+
+
+
+    def _history_page(self, user_id: int, rows: List[Dict[str, Any]], first: bool) -> Dict[str, Any]:
+        """Embed и кнопка «Дальше» для страницы журнала (ключ следующей страницы — в custom_id)"""
+        embed = Embed(
+            title="📜 Журнал предупреждений",
+            description=f"Пользователь: <@{user_id}>",
+            color=0x5865F2
+        )
+        if not rows:
+            embed.add_field(name="Записи", value="Пока пусто" if first else "Больше записей нет", inline=False)
+            return {"embed": embed, "components": []}
+
+        lines = []
+        for r in rows:
+            line = f"<t:{r['ts']}:f> **{r['delta']:+d}**"
+            if r["moderator_id"]:
+                line += f" от <@{r['moderator_id']}>"
+            if r["reason"]:
+                line += f" — {r['reason']}"
+            if r["decay_at"]:
+                line += f" (истечёт <t:{r['decay_at']}:R>)"
+            lines.append(line)
+        embed.add_field(name="Записи", value="\n".join(lines)[:1024], inline=False)
+
+        components = []
+        if len(rows) >= self.svc.history_page:
+            last = rows[-1]
+            components = [Button(style=ButtonStyle.SECONDARY, label="Дальше",
+                                 custom_id=f"warn_history:{user_id}:{last['ts']}:{last['id']}")]
+        return {"embed": embed, "components": components}
+
+
+
+    @warn.subcommand(sub_cmd_name="history", sub_cmd_description="Журнал предупреждений")
+    @slash_option(name="member",
+                  description="Пользователь",
+                  opt_type=OptionType.USER,
+                  required=True)
+    async def cmd_history(self,
+                          ctx: SlashContext,
+                          member: Member):
+
+        """
+            Показывает журнал предупреждений пользователя (от новых к старым),
+            по странице за раз — следующая открывается кнопкой «Дальше»
+
+            /warn history <member>
+
+            Arguments:
+                member (Member): пользователь (обязательное поле)
+        """
+
+        rows = await self.svc.history(int(member.id))
+        await ctx.send(**self._history_page(int(member.id), rows, first=True), ephemeral=True)
+
+
+
+    @component_callback(re.compile(r"^warn_history:\d+:\d+:\d+$"))
+    async def on_history_next(self, ctx: ComponentContext):
+        """ Следующая страница журнала: продолжает с записи из custom_id """
+        _, user_id, ts, event_id = ctx.custom_id.split(":")
+        rows = await self.svc.history(int(user_id), before=(int(ts), int(event_id)))
+        await ctx.edit_origin(**self._history_page(int(user_id), rows, first=False))
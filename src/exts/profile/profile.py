@@ -6,7 +6,7 @@ from interactions import (
     ActionRow, ComponentContext, component_callback,
     Modal, ShortText, listen, modal_callback, ModalContext
 )
-from services.profile.profile import ProfileService
+from services.profile.profile import ProfileService, setup_counter_tasks
 from services.profile.birthday import BirthdayService, setup_birthday_tasks
 
 
@@ -39,8 +39,9 @@ class ProfileCog(Extension):
 
     @listen()
     async def on_startup(self):
-        """Запускает фоновую задачу после старта бота"""
-        setup_birthday_tasks(self.bot, self.birthday_svc)
+        """Запускает фоновые задачи после старта бота"""
+        await setup_birthday_tasks(self.bot, self.birthday_svc)
+        setup_counter_tasks(self.bot, self.svc)
 
     @listen()
     async def on_message_create(self, event):
@@ -55,7 +56,7 @@ class ProfileCog(Extension):
                 return
             
             # Увеличиваем счетчик сообщений
-            self.svc.db.increment_messages(event.message.author.id)
+            await self.svc.db.increment_messages(event.message.author.id)
             
         except Exception as e:
             # Логируем ошибку, но не прерываем работу бота
@@ -4,7 +4,8 @@ from dotenv import load_dotenv
 from services.events.morning import MorningService
 
 
-intents = Intents.DEFAULT | Intents.GUILD_MODERATION
+# GUILD_MEMBERS: события участников для индекса ролей (utils/members.py)
+intents = Intents.DEFAULT | Intents.GUILD_MODERATION | Intents.GUILD_MEMBERS
 bot = Client(intents=intents, sync_interactions=True,
              sync_ext=True, debug_scope="1282677851820134546",
              delete_unused_application_cmds=True)
@@ -28,7 +29,7 @@ async def on_ready():
     """Событие готовности бота"""
     print(f"Бот {bot.user} готов!")
     # Запускаем задачу ежедневных уведомлений
-    morning_service.setup_morning_task(bot)
+    await morning_service.setup_morning_task(bot)
 
 if __name__ == "__main__":
     token = os.getenv("DS_API")
@@ -1,13 +1,17 @@
 import interactions
 import os
+import time
 
-from datetime import datetime, timedelta
+from datetime import datetime
 import pytz
-from typing import List
 
 from utils.db import Events
+from utils.adb import AsyncDB
 from utils.log import log_db
-from interactions import Task, IntervalTrigger
+from utils.jobs import get_queue
+from utils.render import RenderCoalescer, get_renders
+from utils.channels import get_channels
+from utils.dispatch import REMINDER, get_dispatcher
 from config import admin
 
 
@@ -17,10 +21,19 @@ class EventsService:
 
 
     def __init__(self) -> None:
-        self.db = Events()
+        self.db = AsyncDB(Events)
+        # Последние отправленные эмбеды/компоненты: одинаковые правки не отправляются
+        self.renders = get_renders()
+        # Каналы из конфига запрашиваются у Discord один раз
+        self.channels = get_channels()
+        # Исходящие запросы к Discord — через общую очередь с приоритетами
+        self.dispatch = get_dispatcher()
         self.cfg = admin
         self.MSK = pytz.timezone("Europe/Moscow")
 
+        # Не больше одной перерисовки ивента за окно, сколько бы человек ни нажало кнопку
+        self.coalescer = RenderCoalescer(window=float(self.cfg.get("events.render_window", 2.0)))
+
 
 
     async def create(self,
@@ -44,8 +57,7 @@ class EventsService:
                 int: message_id
         """
 
-        channel_id = int(self.cfg.get("channels.events"))
-        channel = await ctx.client.fetch_channel(channel_id)
+        channel = await self.channels.get(ctx.client, "events")
 
         # Ожидаем формат "DD.MM.YY HH:MM" в MSK
         when_naive = datetime.strptime(when_str, "%d.%m.%y %H:%M")
@@ -56,10 +68,11 @@ class EventsService:
             description=description or "",
             color=0x5865F2
         )
-        embed.add_field(name="Начало", value=f"<t:{int(when_dt.timestamp())}:F>", inline=False)
+        # Относительная метка <t:..:R> отсчитывает время до начала на стороне клиента
+        embed.add_field(name="Начало", value=f"<t:{int(when_dt.timestamp())}:F> (<t:{int(when_dt.timestamp())}:R>)", inline=False)
         embed.add_field(name="Лимит", value=str(max_participants), inline=True)
         embed.add_field(name="Участники", value=f"0/{max_participants}", inline=True)
-        embed.add_field(name="Статус", value=self._compute_status(when_dt.isoformat(), db_status="planned"), inline=True)
+        embed.add_field(name="Статус", value=self._compute_status(int(when_dt.timestamp()), db_status="planned"), inline=True)
         embed.set_footer(text="Нажмите кнопки ниже, чтобы присоединиться или выйти")
 
         components = interactions.ActionRow(
@@ -67,67 +80,62 @@ class EventsService:
             interactions.Button(style=interactions.ButtonStyle.SECONDARY, label="Игроки", custom_id="event_list")
         )
 
-        msg = await channel.send(embed=embed, components=components)
+        msg = await self.dispatch.send(channel, embed=embed, components=components)
+        self.renders.remember(int(msg.id), embed=embed, components=components)
 
-        self.db.add_event(
+        await self.db.add_event(
             message_id=int(msg.id),
             title=title,
             description=description or "",
-            participants="",
             max_participants=max_participants,
             status="planned",
-            ts=when_dt.isoformat()
+            ts=int(when_dt.timestamp())
         )
 
         log_db("INFO", f"Создан ивент '{title}' ({msg.id})")
         return int(msg.id)
 
 
-    def build_event_embed(self, message_id: int) -> interactions.Embed:
+    async def build_event_embed(self, message_id: int) -> interactions.Embed:
         """ Строит актуальный embed по данным из БД """
-        e = self.db.get_event(message_id)
+        e = await self.db.get_event(message_id)
         if not e:
             return interactions.Embed(title="Ивент не найден", color=0xED4245)
 
         title: str = e["title"]
         description: str = e.get("description") or ""
         max_participants: int = int(e["max_participants"])
-        ts = e["ts"]
-        when_dt = datetime.fromisoformat(ts)
+        ts = int(e["ts"])
 
-        participants_list = [int(p) for p in (e["participants"].split(",") if e["participants"] else []) if p]
-        cur = len(participants_list)
+        cur = len(e["participants"])
 
         embed = interactions.Embed(
             title=f"🎯 {title}",
             description=description,
             color=0x5865F2
         )
-        embed.add_field(name="Начало", value=f"<t:{int(when_dt.timestamp())}:F>", inline=False)
+        embed.add_field(name="Начало", value=f"<t:{ts}:F> (<t:{ts}:R>)", inline=False)
         embed.add_field(name="Лимит", value=str(max_participants), inline=True)
         embed.add_field(name="Участники", value=f"{cur}/{max_participants}", inline=True)
-        embed.add_field(name="Статус", value=self._compute_status(when_dt.isoformat(), db_status=str(e.get("status", "planned"))), inline=True)
+        embed.add_field(name="Статус", value=self._compute_status(ts, db_status=str(e.get("status", "planned"))), inline=True)
         embed.set_footer(text="Нажмите кнопки ниже, чтобы присоединиться или выйти")
         return embed
 
 
-    def _compute_status(self, when_iso: str, db_status: str) -> str:
-        """Возвращает статус ивента.
+    def _compute_status(self, start: int, db_status: str) -> str:
+        """Возвращает статус ивента (start — начало, UTC epoch).
         Правила:
           - Если db_status == 'finished' → "Закончился".
           - Иначе по времени:
               now < start-5m → "Скоро"
               start-5m <= now < start → "Начинается"
               now >= start → "Идёт"
+        Моменты смены статуса — Events.next_transition: только в них embed и обновляется.
         """
-        now = datetime.now(self.MSK)
-        start = datetime.fromisoformat(when_iso)
-        # Перевести в MSK, если вдруг без TZ
-        if start.tzinfo is None:
-            start = self.MSK.localize(start)
+        now = time.time()
         if str(db_status).lower() == "finished":
             return "Закончился"
-        start_minus_5 = start - timedelta(minutes=5)
+        start_minus_5 = start - Events.REMIND_BEFORE
         if now < start_minus_5:
             return "Скоро"
         if start_minus_5 <= now < start:
@@ -138,85 +146,118 @@ class EventsService:
 
     async def join(self, message_id: int, user_id: int) -> tuple[bool, int, int]:
         """Присоединение пользователя к ивенту"""
-        ok, cur, mx = self.db.add_participant(message_id, user_id)
+        ok, cur, mx = await self.db.add_participant(message_id, user_id)
         return (ok, cur, mx)
 
 
 
     async def leave(self, message_id: int, user_id: int) -> tuple[bool, int, int]:
         """Выход пользователя из ивента"""
-        ok, cur, mx = self.db.remove_participant(message_id, user_id)
+        ok, cur, mx = await self.db.remove_participant(message_id, user_id)
         return (ok, cur, mx)
 
 
 
-    async def notify_upcoming(self, client: interactions.Client) -> List[int]:
-        """Отправляет напоминания за ~5 минут. Возвращает список message_id, по которым было уведомление"""
-        now = datetime.now(self.MSK)
-        start = (now + timedelta(minutes=4)).isoformat()
-        end = (now + timedelta(minutes=6)).isoformat()
-        events = self.db.list_need_notification(start, end)
+    async def notify_event(self, client: interactions.Client, message_id: int) -> bool:
+        """Напоминание участникам за 5 минут до начала (задача event_remind очереди jobs).
+        Возвращает True, если напоминание отправлено"""
+        e = await self.db.get_event(int(message_id))
+        # Задача могла устареть: ивент уже уведомлён/завершён, перенесён или уже начался
+        if not e or str(e.get("status")) != "planned":
+            return False
+        ts = int(e["ts"])
+        if not (ts - Events.REMIND_BEFORE <= time.time() < ts):
+            return False
+
+        participants = e["participants"]
+        if not participants:
+            return False
+
+        notif_channel = await self.channels.get(client, "event_notifications")
+
+        mentions = " ".join(f"<@{pid}>" for pid in participants)
+        await self.dispatch.send(notif_channel, f"⏰ Через 5 минут начнётся ивент '{e['title']}' {mentions}",
+                                 priority=REMINDER)
+        # Помечаем как уведомлённый, чтобы не слать повторно
+        try:
+            await self.db.set_status(int(e["message_id"]), "notified")
+        except Exception:
+            pass
+        return True
 
-        notified: List[int] = []
-        if not events:
-            return notified
 
-        notif_channel_id = int(self.cfg.get("channels.event_notifications"))
-        notif_channel = await client.fetch_channel(notif_channel_id)
 
+    async def load_deadlines(self) -> int:
+        """Сверяет очередь jobs с ивентами: ставит напоминания и смены статуса всех ещё не начавшихся
+        (уже поставленные не дублируются). Возвращает количество ивентов"""
+        queue = get_queue()
+        events = await self.db.list_planned(int(time.time()))
+        now = time.time()
         for e in events:
-            participants = [int(p) for p in (e["participants"].split(",") if e["participants"] else []) if p]
-            if not participants:
-                continue
-
-            mentions = " ".join(f"<@{pid}>" for pid in participants)
-            await notif_channel.send(f"⏰ Через 5 минут начнётся ивент '{e['title']}' {mentions}")
-            # Помечаем как уведомлённый, чтобы не слать повторно в следующей минуте
-            try:
-                self.db.set_status(int(e["message_id"]), "notified")
-            except Exception:
-                pass
-            notified.append(int(e["message_id"]))
-        return notified
-
-
-    async def refresh_status_embeds(self, client: interactions.Client) -> None:
-        """Периодически обновляет статус в embed для актуальных ивентов"""
-        now = datetime.now(self.MSK)
-        # Берём события, которые начнутся в течение 12 часов или начались не позже 3 часов назад
-        relevant: list[dict] = self.db.list_events(limit=200)
-        channel_id = int(self.cfg.get("channels.events"))
-        channel = await client.fetch_channel(channel_id)
-
-        for e in relevant:
-            start = datetime.fromisoformat(e["ts"]).astimezone(self.MSK)
-            if (now - timedelta(hours=3)) <= start <= (now + timedelta(hours=12)):
-                try:
-                    msg = await channel.fetch_message(int(e["message_id"]))
-                    embed = self.build_event_embed(int(e["message_id"]))
-                    await msg.edit(embed=embed)
-                except Exception:
-                    pass
+            mid, ts = int(e["message_id"]), int(e["ts"])
+            # Если до начала уже меньше 5 минут, напоминание сработает сразу
+            await queue.put("event_remind", mid, ts - Events.REMIND_BEFORE)
+            moment = Events.next_transition(ts, now)
+            if moment is not None:
+                await queue.put("event_embed", mid, moment)
+        return len(events)
+
+
+    async def render_participants(self, client: interactions.Client, channel_id: int, message_id: int) -> bool:
+        """Перерисовывает счётчик участников незавершённого ивента. Возвращает True, если правка отправлена"""
+        mid = int(message_id)
+        embed = await self.build_event_embed(mid)
+        # Завершённый ивент не трогаем: иначе пропал бы список участников.
+        # Проверка после сборки — ивент мог завершиться, пока она шла
+        e = await self.db.get_event(mid)
+        if not e or str(e.get("status")) == "finished":
+            return False
+        return await self.renders.edit_by_id(mid, self.channels.editor(client, channel_id, mid), embed=embed)
+
+
+    def mark_event_dirty(self, client: interactions.Client, channel_id: int, message_id: int) -> None:
+        """Планирует перерисовку ивента (объединяется с другими за окно events.render_window)"""
+        mid = int(message_id)
+        self.coalescer.mark(mid, lambda: self.render_participants(client, channel_id, mid))
+
+
+    async def refresh_event_embed(self, client: interactions.Client, message_id: int) -> bool:
+        """Обновляет embed ивента в момент смены статуса (задача event_embed очереди jobs)
+        и ставит задачу на следующую смену. Возвращает True, если правка отправлена"""
+        mid = int(message_id)
+        e = await self.db.get_event(mid)
+        if not e or str(e.get("status")) == "finished":
+            return False
+
+        channel_id = self.channels.channel_id("events")
+        # Правка по id, без запроса канала и сообщения; без изменений — не отправляется
+        sent = await self.renders.edit_by_id(mid, self.channels.editor(client, channel_id, mid),
+                                             embed=await self.build_event_embed(mid))
+
+        moment = Events.next_transition(int(e["ts"]), time.time())
+        if moment is not None:
+            await get_queue().put("event_embed", mid, moment)
+        return sent
 
 
 _TASK_STARTED = False
 
 
-def setup_tasks(bot: interactions.Client, service: EventsService) -> None:
-    """Запускает периодическую проверку каждые 1 минуту (одиночный старт)"""
+async def setup_tasks(bot: interactions.Client, service: EventsService) -> None:
+    """Подключает напоминания и обновление статусов в embed к очереди jobs (одиночный старт)"""
     global _TASK_STARTED
     if _TASK_STARTED:
         return
-
-    @Task.create(IntervalTrigger(minutes=1))
-    async def _notify_loop():
-        try:
-            await service.notify_upcoming(bot)
-            await service.refresh_status_embeds(bot)
-        except Exception:
-            pass
-
-    _notify_loop.start()
     _TASK_STARTED = True
 
+    # Напоминания — задачи очереди jobs за 5 минут до начала:
+    # add_event/update_event/set_status ставят и снимают их сами
+    queue = get_queue()
+    Events.scheduler = queue
+    queue.on("event_remind", lambda payload: service.notify_event(bot, payload["id"]))
+    # Статус в embed меняется только в start-5m и start: между ними отсчёт ведёт <t:..:R>
+    queue.on("event_embed", lambda payload: service.refresh_event_embed(bot, payload["id"]))
+    await queue.start()
+    await service.load_deadlines()
+
 
@@ -3,8 +3,10 @@ import pytz
 import random
 import os
 from datetime import datetime
-from interactions import Task, CronTrigger
 from config import admin
+from utils.jobs import get_queue
+from utils.channels import get_channels
+from utils.dispatch import get_dispatcher
 from utils.log import log_db
 
 
@@ -13,6 +15,8 @@ class MorningService:
 
     def __init__(self) -> None:
         self.cfg = admin
+        self.channels = get_channels()
+        self.dispatch = get_dispatcher()
         self.MSK = pytz.timezone("Europe/Moscow")
         self._task_started = False
         self.messages_file = os.path.join(os.path.dirname(__file__), "..", "..", "data", "morning.txt")
@@ -67,7 +71,7 @@ class MorningService:
                 log_db("ERROR", "Не настроен канал для уведомлений в admin.toml")
                 return
 
-            channel = await client.fetch_channel(int(channel_id))
+            channel = await self.channels.get_by_id(client, int(channel_id))
             if not channel:
                 log_db("ERROR", f"Не удалось найти канал {channel_id}")
                 return
@@ -86,21 +90,24 @@ class MorningService:
             if gif_url:
                 embed.set_image(url=gif_url)
 
-            await channel.send(embed=embed)
+            await self.dispatch.send(channel, embed=embed)
             log_db("INFO", f"Отправлено уведомление 'доброе утро': {message_text[:50]}...")
 
         except Exception as e:
             log_db("ERROR", f"Ошибка при отправке уведомления: {str(e)}")
+            # Очередь jobs повторит попытку
+            raise
 
-    def setup_morning_task(self, bot: interactions.Client) -> None:
-        """Настраивает задачу для ежедневной отправки уведомлений в 8:00 МСК"""
+    async def setup_morning_task(self, bot: interactions.Client) -> None:
+        """Настраивает задачу для ежедневной отправки уведомлений в 8:00 МСК (очередь jobs)"""
         if self._task_started:
             return
-
-        @Task.create(CronTrigger(hour=8, minute=0, timezone="Europe/Moscow"))
-        async def morning_task():
-            await self.send_morning_notification(bot)
-
-        morning_task.start()
         self._task_started = True
+
+        queue = get_queue()
+        # Если бот был выключен в 8:00, уведомление уйдёт при старте, но не позже jobs.morning_grace
+        queue.daily("morning", 8, 0,
+                    lambda payload: self.send_morning_notification(bot),
+                    grace=int(self.cfg.get("jobs.morning_grace", 2 * 3600)))
+        await queue.start()
         log_db("INFO", "Настроена задача ежедневных уведомлений в 8:00 МСК")
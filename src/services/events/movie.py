@@ -1,10 +1,16 @@
 import interactions
-from datetime import datetime, timedelta
+import time
+from datetime import datetime
 import pytz
 from typing import List, Optional
 
 from utils.db import MoviePolls
+from utils.adb import AsyncDB
 from utils.log import log_db
+from utils.jobs import get_queue
+from utils.render import RenderCoalescer, get_renders
+from utils.channels import get_channels
+from utils.dispatch import ANNOUNCE, get_dispatcher
 from interactions import Task, IntervalTrigger
 from config import admin
 
@@ -12,24 +18,30 @@ class MovieService:
     """Ядро логики голосований за фильм: создание, добавление вариантов, голосование, закрытие"""
 
     def __init__(self) -> None:
-        self.db = MoviePolls()
+        self.db = AsyncDB(MoviePolls)
+        # Последние отправленные эмбеды/компоненты: одинаковые правки не отправляются
+        self.renders = get_renders()
+        # Каналы из конфига запрашиваются у Discord один раз
+        self.channels = get_channels()
+        # Исходящие запросы к Discord — через общую очередь с приоритетами
+        self.dispatch = get_dispatcher()
 
         self.cfg = admin
         self.MSK = pytz.timezone("Europe/Moscow")
 
+        # Не больше одной перерисовки опроса за окно, сколько бы голосов ни пришло
+        self.coalescer = RenderCoalescer(window=float(self.cfg.get("movie.render_window", 2.0)))
 
-    def _format_until(self, end_iso: str) -> str:
-        dt = datetime.fromisoformat(end_iso)
-        # Приводим к МСК и выводим явное время в МСК + относительное время
-        if dt.tzinfo is None:
-            dt = self.MSK.localize(dt)
-        msk_dt = dt.astimezone(self.MSK)
+
+    def _format_until(self, end_ts: int) -> str:
+        # Выводим явное время в МСК (end_ts — UTC epoch)
+        msk_dt = datetime.fromtimestamp(int(end_ts), self.MSK)
         human_msk = msk_dt.strftime("%d.%m.%Y %H:%M")
         return f"{human_msk} (МСК)"
 
 
-    def _build_poll_embed(self, message_id: int) -> interactions.Embed:
-        poll = self.db.get_poll(message_id)
+    async def _build_poll_embed(self, message_id: int) -> interactions.Embed:
+        poll = await self.db.get_poll(message_id)
         if not poll:
             return interactions.Embed(title="Опрос не найден", color=0xED4245)
 
@@ -38,8 +50,8 @@ class MovieService:
         status = str(poll.get("status", "open"))
         ts_end = poll["ts_end"]
 
-        counts = self.db.count_votes_by_option(message_id)
-        options = self.db.list_options(message_id)
+        counts = await self.db.count_votes_by_option(message_id)
+        options = await self.db.list_options(message_id)
 
         embed = interactions.Embed(
             title=f"🎬 {title}",
@@ -65,8 +77,8 @@ class MovieService:
         return embed
 
 
-    def _build_vote_components(self, message_id: int) -> List[interactions.ActionRow]:
-        options = self.db.list_options(message_id)
+    async def _build_vote_components(self, message_id: int) -> List[interactions.ActionRow]:
+        options = await self.db.list_options(message_id)
         has_options = len(options) > 0
 
         # Кнопка добавления фильма
@@ -106,34 +118,36 @@ class MovieService:
                           end_str: str,
                           description: str = "") -> int:
         """Создаёт сообщение-опрос в канале и записывает poll в БД"""
-        channel_id = int(self.cfg.get("channels.movie_polls"))
-        channel = await ctx.client.fetch_channel(channel_id)
+        channel = await self.channels.get(ctx.client, "movie_polls")
 
         # Ожидаем формат "DD.MM.YY HH:MM" в MSK
         end_naive = datetime.strptime(end_str, "%d.%m.%y %H:%M")
         end_dt = self.MSK.localize(end_naive)
 
-        embed = self._build_poll_embed_placeholder(title=title, description=description, ts_end=end_dt.isoformat())
-        components = self._build_vote_components(message_id=0)  # заглушка, затем перерисуем
+        embed = self._build_poll_embed_placeholder(title=title, description=description, ts_end=int(end_dt.timestamp()))
+        components = await self._build_vote_components(message_id=0)  # заглушка, затем перерисуем
 
-        msg = await channel.send(embed=embed, components=components)
+        msg = await self.dispatch.send(channel, embed=embed, components=components)
+        self.renders.remember(int(msg.id), embed=embed, components=components)
 
-        self.db.add_poll(
+        await self.db.add_poll(
             message_id=int(msg.id),
             title=title,
             description=description or "",
-            ts_end=end_dt.isoformat(),
+            ts_end=int(end_dt.timestamp()),
             status="open",
         )
 
         # Перестроим embed/компоненты уже с реальным message_id
-        await msg.edit(embed=self._build_poll_embed(int(msg.id)), components=self._build_vote_components(int(msg.id)))
+        await self.renders.edit_by_id(int(msg.id), self.channels.editor(ctx.client, int(channel.id), int(msg.id), ANNOUNCE),
+                                      embed=await self._build_poll_embed(int(msg.id)),
+                                      components=await self._build_vote_components(int(msg.id)))
 
         log_db("INFO", f"Создан опрос фильмов '{title}' ({msg.id})")
         return int(msg.id)
 
 
-    def _build_poll_embed_placeholder(self, title: str, description: str, ts_end: str) -> interactions.Embed:
+    def _build_poll_embed_placeholder(self, title: str, description: str, ts_end: int) -> interactions.Embed:
         embed = interactions.Embed(title=f"🎬 {title}", description=description or "", color=0x5865F2)
         embed.add_field(name="Начало", value=self._format_until(ts_end), inline=True)
         embed.add_field(name="Статус", value="Открыт", inline=True)
@@ -144,107 +158,140 @@ class MovieService:
 
     async def add_option(self, message_id: int, title: str, link: Optional[str], author_id: Optional[int]) -> bool:
         """Добавляет вариант. Возвращает False, если дубликат по названию."""
-        poll = self.db.get_poll(message_id)
+        poll = await self.db.get_poll(message_id)
         if not poll or str(poll.get("status")) != "open":
             return False
-        existing = self.db.list_options(message_id)
+        existing = await self.db.list_options(message_id)
         title_norm = title.strip().casefold()
         for opt in existing:
             if opt["title"].strip().casefold() == title_norm:
                 return False
-        self.db.add_option(message_id, title.strip(), (link or "").strip() or None, author_id)
+        await self.db.add_option(message_id, title.strip(), (link or "").strip() or None, author_id)
         return True
 
 
     async def cast_vote(self, message_id: int, user_id: int, option_id: int) -> bool:
-        poll = self.db.get_poll(message_id)
+        poll = await self.db.get_poll(message_id)
         if not poll or str(poll.get("status")) != "open":
             return False
         # Проверим, что опция принадлежит этому опросу
-        options = self.db.list_options(message_id)
+        options = await self.db.list_options(message_id)
         valid_ids = {int(o["id"]) for o in options}
         if option_id not in valid_ids:
             return False
-        self.db.upsert_vote(message_id, user_id, option_id)
+        await self.db.upsert_vote(message_id, user_id, option_id)
         return True
 
 
-    async def close_due_polls(self, client: interactions.Client) -> List[int]:
-        """Закрывает опросы, у которых подошло время окончания. Возвращает список message_id закрытых опросов."""
-        now = datetime.now(self.MSK)
-        to_iso = now.isoformat()
-        polls = self.db.list_polls_overdue(to_iso)
+    async def close_due_poll(self, client: interactions.Client, message_id: int) -> bool:
+        """Закрывает опрос по задаче poll_close (или запускает доголосование при ничьей).
+        Возвращает True, если опрос закрыт."""
+        now = int(time.time())
+        mid = int(message_id)
+        poll = await self.db.get_poll(mid)
+        # Дедлайн мог устареть: опрос закрыт вручную или продлён
+        if not poll or str(poll.get("status")) != "open" or int(poll["ts_end"]) > now:
+            return False
+
+        # До изменений в БД: при ошибке очередь jobs повторит задачу целиком
+        # (опрос ещё открыт и просрочен, поэтому повтор дойдёт досюда снова)
+        channel = await self.channels.get(client, "movie_polls")
+        tied = await self.db.top_tied_options(mid)
+        if tied:
+            # Доголосование: оставляем только финалистов, чистим голоса, ставим +10 минут
+            await self.db.start_runoff(mid, [int(o["id"]) for o in tied], now + 10 * 60)
+            winner = None
+        else:
+            winner = await self.db.close_poll(mid)
+            self.coalescer.discard(mid)
+
+        # После фиксации в БД повтор задачи увидит опрос закрытым/продлённым и ничего
+        # не опубликует, поэтому ошибки публикации только логируются, а не пробрасываются
+        try:
+            await self._publish_close(client, channel, mid, tied, winner)
+        except Exception as e:
+            log_db("ERROR", f"movie.close_due_poll: опрос {mid} закрыт, но итог не опубликован", str(e))
+        return not tied
+
+
+
+    async def _publish_close(self,
+                             client: interactions.Client,
+                             channel: interactions.GuildText,
+                             mid: int,
+                             tied: Optional[List[dict]],
+                             winner: Optional[dict]) -> None:
+        """Обновляет сообщение опроса и объявляет доголосование или победителя"""
+        edit = self.channels.editor(client, int(channel.id), mid, ANNOUNCE)
+        role_id = self.cfg.get("roles.movie")
+        mention = f"<@&{int(role_id)}> " if role_id else ""
+
+        if tied:
+            # Обновляем сообщение с пометкой доголосования
+            embed = await self._build_poll_embed(mid)
+            embed.add_field(name="Статус", value="Доголосование (10 минут)", inline=False)
+            await self.renders.edit_by_id(mid, edit, embed=embed, components=await self._build_vote_components(mid))
+
+            names = ", ".join(o['title'] for o in tied)
+            await self.dispatch.send(channel, f"{mention}Ничья! Доголосование между: {names} (10 минут)")
+            return
 
-        closed: List[int] = []
-        if not polls:
-            return closed
+        embed = await self._build_poll_embed(mid)
+        if winner:
+            embed.add_field(name="Победитель",
+                            value=f"{winner['title']} ({winner['_votes']} голосов)",
+                            inline=False)
+        await self.renders.edit_by_id(mid, edit, embed=embed, components=[])
+
+        if winner:
+            announce = f"{mention}🎉 Голосование завершено! Сегодня смотрим: {winner['title']}"
+            if winner.get("link"):
+                announce += f"\n{winner['link']}"
+            await self.dispatch.send(channel, announce)
+        else:
+            await self.dispatch.send(channel, "Голосование завершено, победитель не определён (нет вариантов)")
 
-        channel_id = int(self.cfg.get("channels.movie_polls"))
-        channel = await client.fetch_channel(channel_id)
 
+    async def load_deadlines(self) -> int:
+        """Сверяет очередь jobs с опросами: ставит закрытие всех открытых
+        (уже поставленные не дублируются). Возвращает их количество"""
+        queue = get_queue()
+        polls = await self.db.list_open_polls()
         for p in polls:
-            mid = int(p["message_id"])
-            try:
-                # Проверка на ничью среди лидеров (>=2 вариантов имеют максимум голосов)
-                tied = self.db.top_tied_options(mid)
-                if tied:
-                    # Запускаем доголосование: оставляем только финалистов, чистим голоса, ставим +10 минут
-                    option_ids = [int(o["id"]) for o in tied]
-                    self.db.keep_only_options(mid, option_ids)
-                    self.db.reset_votes(mid)
-                    new_end = (now + timedelta(minutes=10)).isoformat()
-                    self.db.set_poll_end(mid, new_end)
-
-                    # Обновляем сообщение с пометкой доголосования
-                    msg = await channel.fetch_message(mid)
-                    embed = self._build_poll_embed(mid)
-                    embed.add_field(name="Статус", value="Доголосование (10 минут)", inline=False)
-                    await msg.edit(embed=embed, components=self._build_vote_components(mid))
-
-                    role_id = self.cfg.get("roles.movie")
-                    mention = f"<@&{int(role_id)}> " if role_id else ""
-                    names = ", ".join(o['title'] for o in tied)
-                    await channel.send(f"{mention}Ничья! Доголосование между: {names} (10 минут)")
-                else:
-                    winner = self.db.pick_winner(mid)
-                    self.db.set_poll_status(mid, "closed")
-
-                    msg = await channel.fetch_message(mid)
-                    embed = self._build_poll_embed(mid)
-                    if winner:
-                        embed.add_field(name="Победитель",
-                                        value=f"{winner['title']} ({self.db.count_votes_by_option(mid).get(int(winner['id']), 0)} голосов)",
-                                        inline=False)
-                    await msg.edit(embed=embed, components=[])
-
-                    if winner:
-                        role_id = self.cfg.get("roles.movie")
-                        mention = f"<@&{int(role_id)}> " if role_id else ""
-                        announce = f"{mention}🎉 Голосование завершено! Сегодня смотрим: {winner['title']}"
-                        if winner.get("link"):
-                            announce += f"\n{winner['link']}"
-                        await channel.send(announce)
-                    else:
-                        await channel.send("Голосование завершено, победитель не определён (нет вариантов)")
-
-                    closed.append(mid)
-            except Exception as e:
-                log_db("ERROR", f"movie.close_due_polls failed for {mid}", str(e))
-
-        return closed
+            # Просроченные (например, за время простоя бота) сработают сразу
+            await queue.put("poll_close", int(p["message_id"]), int(p["ts_end"]))
+        return len(polls)
+
+
+    async def refresh_poll(self, client: interactions.Client, message_id: int) -> bool:
+        """Перерисовывает открытый опрос по актуальным данным. Возвращает True, если правка отправлена"""
+        mid = int(message_id)
+        channel_id = self.channels.channel_id("movie_polls")
+        embed = await self._build_poll_embed(mid)
+        components = await self._build_vote_components(mid)
+        # Закрытый опрос не трогаем: иначе вернулись бы меню голосования и пропал «Победитель».
+        # Проверка после сборки — опрос мог закрыться, пока она шла
+        poll = await self.db.get_poll(mid)
+        if not poll or str(poll.get("status")) != "open":
+            return False
+        # Правка по id, без запроса канала и сообщения; без изменений — не отправляется
+        return await self.renders.edit_by_id(mid, self.channels.editor(client, channel_id, mid),
+                                             embed=embed, components=components)
+
+
+    def mark_poll_dirty(self, client: interactions.Client, message_id: int) -> None:
+        """Планирует перерисовку опроса (объединяется с другими за окно movie.render_window)"""
+        mid = int(message_id)
+        self.coalescer.mark(mid, lambda: self.refresh_poll(client, mid))
 
 
     async def refresh_poll_embeds(self, client: interactions.Client) -> None:
         """Обновляет эмбед опросов (для актуализации голосов/вариантов)"""
-        poll = self.db.get_latest_open_poll()
+        poll = await self.db.get_latest_open_poll()
         if not poll:
             return
-        channel_id = int(self.cfg.get("channels.movie_polls"))
-        channel = await client.fetch_channel(channel_id)
         try:
-            msg = await channel.fetch_message(int(poll["message_id"]))
-            await msg.edit(embed=self._build_poll_embed(int(poll["message_id"])),
-                           components=self._build_vote_components(int(poll["message_id"])) )
+            await self.refresh_poll(client, int(poll["message_id"]))
         except Exception:
             pass
 
@@ -252,21 +299,28 @@ class MovieService:
 _TASK_STARTED = False
 
 
-def setup_tasks(bot: interactions.Client, service: MovieService) -> None:
-    """Запускает периодическую проверку каждые 1 минуту (одиночный старт)"""
+async def setup_tasks(bot: interactions.Client, service: MovieService) -> None:
+    """Подключает закрытие опросов к очереди jobs и запускает
+    периодическое обновление эмбеда (одиночный старт)"""
     global _TASK_STARTED
     if _TASK_STARTED:
         return
+    _TASK_STARTED = True
+
+    # Закрытие опросов — задачи очереди jobs на ts_end: add_poll/set_poll_end переносят их сами
+    queue = get_queue()
+    MoviePolls.scheduler = queue
+    queue.on("poll_close", lambda payload: service.close_due_poll(bot, payload["id"]))
+    await queue.start()
+    await service.load_deadlines()
 
     @Task.create(IntervalTrigger(minutes=1))
     async def _movie_loop():
         try:
-            await service.close_due_polls(bot)
             await service.refresh_poll_embeds(bot)
         except Exception:
             pass
 
     _movie_loop.start()
-    _TASK_STARTED = True
 
 
@@ -0,0 +1,230 @@
+import asyncio
+import time
+import interactions
+
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from utils.db import RoleJobs
+from utils.adb import AsyncDB
+from utils.log import log_db
+from utils.dispatch import MODERATION, Dispatcher, get_dispatcher, retry_after
+from services.mod.resolver import MemberResolver
+from config import admin
+
+
+# progress(job_id, counts, total, finished): counts — {статус: количество}
+Progress = Callable[[int, Dict[str, int], int, bool], Awaitable[Any]]
+
+
+
+async def submit_with_retry(dispatch: Dispatcher,
+                            call: Callable[[], Awaitable[Any]],
+                            route: Tuple[str, int],
+                            max_retries: int) -> Tuple[str, Optional[str]]:
+    """Модерационный запрос через Dispatcher с повтором 429. Возвращает (done | forbidden | failed, ошибка)"""
+    attempt = 0
+    while True:
+        try:
+            await dispatch.submit(call, MODERATION, route=route)
+            return "done", None
+        except interactions.errors.Forbidden as e:
+            return "forbidden", str(e)
+        except interactions.errors.HTTPException as e:
+            attempt += 1
+            if getattr(e, "status", None) != 429 or attempt > max_retries:
+                return "failed", str(e)
+            await asyncio.sleep(retry_after(e, attempt))
+        except Exception as e:
+            return "failed", str(e)
+
+
+
+class BulkRoleService:
+    """Массовая выдача/снятие роли заданиями с ограниченным параллелизмом
+
+    Задание (RoleJobs) создаётся до начала работы, статусы целей
+    записываются пачками, поэтому прерванное задание продолжается с
+    необработанных целей (resume). Одновременно выполняется не больше
+    concurrency запросов, ответ 429 повторяется после Retry-After.
+    """
+
+    # Выполняемые сейчас задания, общие для всех экземпляров (чтобы resume не запустил их второй раз)
+    _active: Dict[int, asyncio.Task] = {}
+
+    def __init__(self) -> None:
+        self.db = AsyncDB(RoleJobs)
+        self.cfg = admin
+        self.dispatch = get_dispatcher()
+        self.resolver = MemberResolver()
+
+        self.concurrency = int(self.cfg.get("roles.bulk_concurrency", 5))
+        self.max_retries = int(self.cfg.get("roles.bulk_retries", 3))
+        # Не чаще раза в interval секунд: запись статусов в БД и вызов progress
+        self.progress_interval = float(self.cfg.get("roles.bulk_progress_interval", 2.0))
+        # Участники запрашиваются пачками по resolve_chunk (таймаут resolver — на пачку);
+        # не полученные за таймаут запрашиваются снова, всего не больше resolve_rounds раз
+        self.resolve_chunk = int(self.cfg.get("roles.bulk_resolve_chunk", 100))
+        self.resolve_rounds = int(self.cfg.get("roles.bulk_resolve_rounds", 3))
+
+
+
+    async def create(self,
+                     guild: interactions.Guild,
+                     role: interactions.Role,
+                     action: str,
+                     user_ids: List[int],
+                     author: Optional[interactions.Member] = None,
+                     reason: str = "Не указана") -> int:
+        """Создаёт задание (action: add / remove). Возвращает его id"""
+        return await self.db.create_job(int(guild.id), int(role.id), action, list(dict.fromkeys(user_ids)),
+                                        reason, int(author.id) if author is not None else None)
+
+
+
+    async def run(self,
+                  job_id: int,
+                  guild: interactions.Guild,
+                  progress: Optional[Progress] = None) -> Dict[str, int]:
+        """Выполняет необработанные цели задания. Возвращает итоговые {статус: количество}"""
+        task = self._active.get(job_id)
+        if task is None:
+            task = self._active[job_id] = asyncio.get_running_loop().create_task(
+                self._run(job_id, guild, progress))
+            task.add_done_callback(lambda _: self._active.pop(job_id, None))
+        return await asyncio.shield(task)
+
+
+
+    async def _run(self,
+                   job_id: int,
+                   guild: interactions.Guild,
+                   progress: Optional[Progress]) -> Dict[str, int]:
+        job = await self.db.get_job(job_id)
+        if job is None:
+            raise ValueError(f"задание {job_id} не найдено")
+
+        role = guild.get_role(int(job["role_id"]))
+        counts = await self.db.count_by_status(job_id)
+        total = sum(counts.values())
+        pending = [int(t["user_id"]) for t in await self.db.list_targets(job_id, "pending")]
+
+        if role is None:
+            # Роль удалена: все оставшиеся цели — ошибка
+            await self.db.set_results(job_id, [(uid, "failed", "роль не найдена") for uid in pending])
+            counts = await self.db.count_by_status(job_id)
+            pending = []
+
+        queue: asyncio.Queue = asyncio.Queue()
+        members: Dict[int, interactions.Member] = {}
+        results: List[Tuple[int, str, Optional[str]]] = []
+        last_flush = time.monotonic()
+
+        async def flush(finished: bool = False) -> None:
+            nonlocal results, last_flush
+            batch, results = results, []
+            last_flush = time.monotonic()
+            if batch:
+                await self.db.set_results(job_id, batch)
+                for _, status, _ in batch:
+                    counts["pending"] -= 1
+                    counts[status] += 1
+            if progress is not None:
+                try:
+                    await progress(job_id, dict(counts), total, finished)
+                except Exception as e:
+                    log_db("WARN", f"role bulk: прогресс задания {job_id} не обновлён", str(e))
+
+        async def worker() -> None:
+            while True:
+                try:
+                    uid = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                status, error = await self._apply(guild, role, job["action"], members.get(uid), job["reason"])
+                results.append((uid, status, error))
+                if time.monotonic() - last_flush >= self.progress_interval:
+                    await flush()
+
+        # Участники — пачками: кэш, затем параллельные запросы промахов. Не полученные
+        # за таймаут пачки не считаются ушедшими: их запросят в следующем круге
+        rounds = 0
+        while pending and rounds < self.resolve_rounds:
+            rounds += 1
+            deferred: List[int] = []
+            for i in range(0, len(pending), self.resolve_chunk):
+                chunk = pending[i:i + self.resolve_chunk]
+                found, _ = await self.resolver.resolve(guild, chunk, unresolved=deferred)
+                members.update(found)
+                retry = set(deferred)
+                for uid in chunk:
+                    if uid not in retry:
+                        queue.put_nowait(uid)
+                await asyncio.gather(*(worker() for _ in range(max(1, min(self.concurrency, queue.qsize())))))
+            pending = deferred
+
+        await flush(finished=not pending)
+        if pending:
+            # Цели остаются pending: задание продолжится при следующем resume
+            log_db("WARN", f"role bulk: задание {job_id}: {len(pending)} участников не получены, задание не завершено")
+            return counts
+        await self.db.finish_job(job_id)
+
+        log_db("INFO",
+               f"role bulk: задание {job_id} ({job['action']} роль {job['role_id']}) завершено: "
+               + ", ".join(f"{s}={n}" for s, n in counts.items() if n))
+        return counts
+
+
+
+    async def _apply(self,
+                     guild: interactions.Guild,
+                     role: interactions.Role,
+                     action: str,
+                     member: Optional[interactions.Member],
+                     reason: Optional[str]) -> Tuple[str, Optional[str]]:
+        """Выдаёт/снимает роль одному участнику. Возвращает (статус, ошибка)"""
+        if member is None:
+            return "failed", "участник не найден"
+
+        if (action == "add") == (role in member.roles):
+            return "skipped", None
+
+        if action == "add":
+            call = lambda: member.add_role(role=role, reason=reason)
+        else:
+            call = lambda: member.remove_role(role=role, reason=reason)
+
+        return await submit_with_retry(self.dispatch, call, ("guild", int(guild.id)), self.max_retries)
+
+
+
+    async def resume(self, client: interactions.Client) -> int:
+        """Продолжает прерванные задания в фоне (при старте бота). Возвращает их количество"""
+        jobs = await self.db.list_unfinished()
+        started = 0
+        for job in jobs:
+            job_id = int(job["id"])
+            if job_id in self._active:
+                continue
+            guild = client.get_guild(int(job["guild_id"]))
+            if guild is None:
+                await self.db.finish_job(job_id, "cancelled")
+                log_db("WARN", f"role bulk: задание {job_id} отменено, сервер {job['guild_id']} недоступен")
+                continue
+            task = self._active[job_id] = asyncio.get_running_loop().create_task(self._run(job_id, guild, None))
+            task.add_done_callback(lambda _, jid=job_id: self._active.pop(jid, None))
+            started += 1
+        if started:
+            log_db("INFO", f"role bulk: продолжено прерванных заданий: {started}")
+        return started
+
+
+
+    async def report(self, job_id: int) -> Optional[Dict[str, Any]]:
+        """Задание, {статус: количество} и цели с ошибками"""
+        job = await self.db.get_job(job_id)
+        if job is None:
+            return None
+        counts = await self.db.count_by_status(job_id)
+        problems = [t for t in await self.db.list_targets(job_id) if t["status"] in ("forbidden", "failed")]
+        return {"job": job, "counts": counts, "total": sum(counts.values()), "problems": problems}
@@ -0,0 +1,198 @@
+import asyncio
+import time
+import interactions
+
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from services.mod.bulk import submit_with_retry
+from services.mod.resolver import MemberResolver
+from services.mod.mutes import TimedMutes
+from utils.members import get_members
+from utils.dispatch import get_dispatcher
+from utils.log import log_db
+from config import admin
+
+
+ACTIONS = {"ban": "бан", "kick": "кик", "mute": "мьют"}
+
+STATUSES = ("pending", "done", "skipped", "forbidden", "failed")
+
+# progress(counts, total, finished): counts — {статус: количество}
+Progress = Callable[[Dict[str, int], int, bool], Awaitable[Any]]
+
+
+
+class MassModerationService:
+    """Массовые бан/кик/мьют (например, во время рейда)
+
+    Цели — список ID и/или все, кто пришёл на сервер за последние N минут.
+    Действия выполняются пулом из concurrency обработчиков через Dispatcher
+    (429 повторяется после Retry-After). В лог пишется одна запись на всю
+    операцию, в ответ — сводный отчёт.
+    """
+
+    def __init__(self, mutes: Optional[TimedMutes] = None) -> None:
+        self.cfg = admin
+        # Массовый мьют бессрочный: прежний таймер мьюта снимается
+        self.mutes = mutes if mutes is not None else TimedMutes()
+        self.dispatch = get_dispatcher()
+        self.resolver = MemberResolver()
+        self.index = get_members()
+        self.mute_role = int(self.cfg.get("roles.mute"))
+
+        self.concurrency = int(self.cfg.get("moderation.mass_concurrency", 5))
+        self.max_retries = int(self.cfg.get("moderation.mass_retries", 3))
+        self.progress_interval = float(self.cfg.get("moderation.mass_progress_interval", 2.0))
+        self.max_minutes = int(self.cfg.get("moderation.mass_max_minutes", 1440))
+        # Участников с правами модерации массовые действия не трогают
+        self.moder_perms = interactions.Permissions(int(self.cfg.get("permissions.moderation")))
+
+
+
+    async def joined_since(self, guild: interactions.Guild, minutes: int) -> List[int]:
+        """ID участников, пришедших за последние minutes минут (1..moderation.mass_max_minutes)"""
+        if not 1 <= minutes <= self.max_minutes:
+            raise ValueError(f"minutes должно быть от 1 до {self.max_minutes}")
+        await self.index.build(guild)
+        return [int(m.id) for m in self.index.joined_since(guild.id, time.time() - minutes * 60)]
+
+
+
+    async def run(self,
+                  guild: interactions.Guild,
+                  action: str,
+                  user_ids: List[int],
+                  author: interactions.Member,
+                  reason: str = "Не указана",
+                  delete_messages: int = 0,
+                  protected: Iterable[int] = (),
+                  progress: Optional[Progress] = None) -> Dict[str, Any]:
+        """
+            Выполняет action (ban / kick / mute) для всех user_ids
+
+            Args:
+                guild (Guild): Сервер
+                action (str): ban, kick или mute
+                user_ids (List[int]): ID целей (повторы отбрасываются)
+                author (Member): Отправитель команды (ЛОГИ)
+                reason (str): Причина
+                delete_messages (int): Для бана — удалить сообщения за столько дней
+                protected (Iterable[int]): ID, к которым действие не применяется (кроме author,
+                    модераторов и участников с верхней ролью не ниже, чем у author)
+                progress: await progress(counts, total, finished) не чаще раза в progress_interval
+
+            Returns:
+                {"counts": {статус: количество}, "total": int, "problems": [(id, статус, ошибка)]}
+        """
+
+        if action not in ACTIONS:
+            raise ValueError(f"неизвестное действие '{action}'")
+
+        ids = list(dict.fromkeys(int(x) for x in user_ids))
+        delete_messages = max(0, min(7, delete_messages))
+        # Бан выполняется и по ID (кого нет на сервере), но участников проверяем на защиту
+        members, _ = await self.resolver.resolve(guild, ids)
+        role = guild.get_role(self.mute_role) if action == "mute" else None
+        # Себя (и, например, бота) не трогаем
+        protected = {int(author.id), *(int(x) for x in protected)}
+
+        counts = {s: 0 for s in STATUSES}
+        counts["pending"] = len(ids)
+        problems: List[Tuple[int, str, Optional[str]]] = []
+        done: List[int] = []
+        queue: asyncio.Queue = asyncio.Queue()
+        for uid in ids:
+            queue.put_nowait(uid)
+        last_report = time.monotonic()
+
+        async def report(finished: bool = False) -> None:
+            nonlocal last_report
+            last_report = time.monotonic()
+            if progress is None:
+                return
+            try:
+                await progress(dict(counts), len(ids), finished)
+            except Exception as e:
+                log_db("WARN", f"mass {action}: прогресс не обновлён", str(e))
+
+        async def worker() -> None:
+            while True:
+                try:
+                    uid = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                guard = "защищённый пользователь" if uid in protected else \
+                    self._guard(guild, author, members.get(uid))
+                if guard is not None:
+                    status, error = "skipped", guard
+                    problems.append((uid, status, error))
+                else:
+                    status, error = await self._apply(guild, action, uid, members.get(uid), role,
+                                                      reason, delete_messages)
+                counts["pending"] -= 1
+                counts[status] += 1
+                # Замьючен сейчас или уже был (skipped без причины): мьют теперь бессрочный
+                if action == "mute" and (status == "done" or (status == "skipped" and error is None)):
+                    await self.mutes.clear(guild.id, uid)
+                if status == "done":
+                    done.append(uid)
+                elif status in ("forbidden", "failed"):
+                    problems.append((uid, status, error))
+                if time.monotonic() - last_report >= self.progress_interval:
+                    await report()
+
+        await asyncio.gather(*(worker() for _ in range(max(1, min(self.concurrency, len(ids))))))
+        await report(finished=True)
+
+        # Одна запись аудита на всю операцию
+        log_db("INFO",
+               f"Модератор {author} выполнил массовый {ACTIONS[action]}: "
+               + ", ".join(f"{s}={n}" for s, n in counts.items() if n),
+               reason=f"{reason}; ID: {' '.join(str(uid) for uid in done) or '—'}")
+
+        return {"counts": counts, "total": len(ids), "problems": problems}
+
+
+
+    def _guard(self,
+               guild: interactions.Guild,
+               author: interactions.Member,
+               member: Optional[interactions.Member]) -> Optional[str]:
+        """Причина не трогать участника или None"""
+        if member is None:
+            return None
+        if guild.is_owner(member):
+            return "владелец сервера"
+        if member.has_permission(self.moder_perms):
+            return "модератор"
+        # Владелец сервера может всё, остальные — только ниже своей верхней роли
+        if not guild.is_owner(author) and member.top_role.position >= author.top_role.position:
+            return "роль не ниже вашей"
+        return None
+
+
+
+    async def _apply(self,
+                     guild: interactions.Guild,
+                     action: str,
+                     user_id: int,
+                     member: Optional[interactions.Member],
+                     role: Optional[interactions.Role],
+                     reason: str,
+                     delete_messages: int) -> Tuple[str, Optional[str]]:
+        """Действие для одной цели. Возвращает (статус, ошибка)"""
+        if action == "ban":
+            # Забанить можно и того, кого нет на сервере
+            call = lambda: guild.ban(user_id, reason=reason, delete_message_seconds=delete_messages * 86_400)
+        elif member is None:
+            return "skipped", "нет на сервере"
+        elif action == "kick":
+            call = lambda: member.kick(reason=reason)
+        else:
+            if role is None:
+                return "failed", "роль мьюта не найдена"
+            if role in member.roles:
+                return "skipped", None
+            call = lambda: member.add_role(role=role, reason=reason)
+
+        return await submit_with_retry(self.dispatch, call, ("guild", int(guild.id)), self.max_retries)
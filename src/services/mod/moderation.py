@@ -1,8 +1,16 @@
+import asyncio
+import time
 import interactions
 import os
 
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
 from services.mod.role import RoleService
+from services.mod.mass import MassModerationService
+from services.mod.mutes import TimedMutes
+from services.mod.bulk import submit_with_retry
 from utils.log import log_db
+from utils.dispatch import MODERATION, get_dispatcher
 from config import admin
 
 class ModerationService:
@@ -12,6 +20,23 @@ class ModerationService:
         self.mute_role = int(admin.get("roles.mute"))
 
         self.role = RoleService()
+        # Мьюты на время: снимаются сами по истечении срока
+        self.mutes = TimedMutes()
+        # Массовые бан/кик/мьют
+        self.mass = MassModerationService(self.mutes)
+        # Модерация — самый важный класс в очереди исходящих запросов
+        self.dispatch = get_dispatcher()
+
+        # /m purge: сколько сообщений истории просматривать не больше
+        self.purge_scan_limit = int(admin.get("moderation.purge_scan_limit", 5000))
+        self.purge_retries = int(admin.get("moderation.purge_retries", 3))
+        # Старше 14 дней сообщения удаляются по одному (~1 в секунду): не больше стольких за раз,
+        # чтобы очистка уложилась во время жизни ответа на команду
+        self.purge_old_limit = int(admin.get("moderation.purge_old_limit", 100))
+        self.purge_progress_interval = float(admin.get("moderation.purge_progress_interval", 5.0))
+        # /m unban: разбаны идут пачками, на каждую — не дольше unban_timeout секунд
+        self.unban_chunk = max(1, int(admin.get("moderation.mass_concurrency", 5)))
+        self.unban_timeout = float(admin.get("moderation.unban_timeout", 10.0))
 
 
     async def kick(self,
@@ -33,7 +58,8 @@ class ModerationService:
         """
 
         try:
-            await member.kick(reason=reason)
+            await self.dispatch.submit(lambda: member.kick(reason=reason),
+                                       MODERATION, route=("guild", int(member.guild.id)))
             log_db("INFO", 
                     f"Модератор {author} кикнул пользователя {member}",
                     reason=reason)
@@ -68,8 +94,9 @@ class ModerationService:
         """
 
         try:
-            await member.ban(reason=reason,
-                             delete_message_seconds=(delete_messages*86_400))
+            await self.dispatch.submit(lambda: member.ban(reason=reason,
+                                                          delete_message_seconds=(delete_messages*86_400)),
+                                       MODERATION, route=("guild", int(member.guild.id)))
             log_db("INFO", 
                     f"Модератор {author} забанил пользователя {member}",
                     reason=reason)
@@ -103,7 +130,8 @@ class ModerationService:
                 0: ошибка
         """
         try:
-            await guild.unban(user=user, reason=reason)
+            await self.dispatch.submit(lambda: guild.unban(user=user, reason=reason),
+                                       MODERATION, route=("guild", int(guild.id)))
             user_id = guild.get_member(user)
             log_db("INFO", 
                     f"Модератор {author} разбанил пользователя {user_id}",
@@ -117,11 +145,55 @@ class ModerationService:
 
 
 
+    async def unbans(self,
+                     guild: interactions.Guild,
+                     author: interactions.Member,
+                     users: List[int],
+                     reason: str = "Не указана") -> List[Tuple[int, int]]:
+        """
+            Разбанивает нескольких пользователей по ID
+
+            Запросы идут пачками по moderation.mass_concurrency: в очереди
+            Dispatcher одновременно не больше одной пачки, поэтому длинный
+            список не задерживает другие команды модерации. Не успевшие за
+            moderation.unban_timeout секунд разбаны пачки отменяются (код 0).
+
+            Args:
+                guild (Guild): сервер
+                author (Member): Отправитель команды (ЛОГИ)
+                users (List[int]): Discord-ID пользователей
+                reason (str): причина (по умолчанию "Не указана")
+
+            Returns:
+                Список [(id, код)], коды как у unban
+        """
+        users = list(dict.fromkeys(int(uid) for uid in users))
+        loop = asyncio.get_running_loop()
+        codes: Dict[int, int] = {}
+        timed_out = 0
+        for i in range(0, len(users), self.unban_chunk):
+            chunk = users[i:i + self.unban_chunk]
+            tasks = {loop.create_task(self.unban(guild, author, uid, reason)): uid for uid in chunk}
+            _, pending = await asyncio.wait(tasks, timeout=self.unban_timeout)
+            for task in pending:
+                # Отмена снимает и запрос, ещё ждущий в очереди Dispatcher
+                task.cancel()
+            timed_out += len(pending)
+            for task, uid in tasks.items():
+                codes[uid] = 0 if task in pending else task.result()
+
+        if timed_out:
+            log_db("WARN", f"unban: {timed_out} из {len(users)} разбанов не выполнены за таймаут")
+        return [(uid, codes[uid]) for uid in users]
+
+
+
     async def mute(self,
                    guild: interactions.Guild,
                    member: interactions.Member,
                    author: interactions.Member,
-                   reason: str = "Не указана") -> int:
+                   reason: str = "Не указана",
+                   minutes: int = 0) -> int:
 
         """
             Мьютит пользователя
@@ -131,9 +203,11 @@ class ModerationService:
                 member (Member): Пользователь
                 author (Member): Отправитель команды (ЛОГИ)
                 reason (str): Причина мута (по умолчанию "Не указана")
+                minutes (int): Срок мьюта в минутах (0 — бессрочно)
 
             Returns:
                 1: Команда успешно выполнена
+                2: Пользователь уже замьючен (срок мьюта заменён)
                 -1: У бота нет прав на выполнение этого действия
                 0: Произошла ошибка
         """
@@ -144,6 +218,12 @@ class ModerationService:
                                   role=role,
                                   reason=reason)
 
+        if res in (1, 2):
+            if minutes > 0:
+                await self.mutes.set(guild, member, role, minutes, author, reason)
+            else:
+                await self.mutes.clear(guild.id, member.id)
+
         return res
 
 
@@ -173,4 +253,119 @@ class ModerationService:
                                      role=role,
                                      reason=reason)
 
+        if res in (1, 2):
+            await self.mutes.clear(guild.id, member.id)
+
         return res
+
+
+
+    async def purge(self,
+                    channel: interactions.GuildText,
+                    author: interactions.Member,
+                    count: int,
+                    member_id: Optional[int] = None,
+                    minutes: int = 0,
+                    reason: str = "Не указана",
+                    progress: Optional[Callable[[Dict[str, int]], Awaitable[Any]]] = None) -> Dict[str, int]:
+        """
+            Удаляет последние сообщения канала
+
+            История читается постранично (от новых к старым), подходящие
+            сообщения удаляются пачками до 100 штук одним запросом. Старше
+            14 дней Discord пачкой удалять не даёт — такие удаляются по
+            одному (через Dispatcher, с ограничением скорости канала), и не
+            больше moderation.purge_old_limit за раз: остальные пропускаются.
+
+            Args:
+                channel (GuildText): Канал
+                author (Member): Отправитель команды (ЛОГИ)
+                count (int): Сколько сообщений удалить (не больше)
+                member_id (int): Только сообщения этого пользователя (необязательно)
+                minutes (int): Только сообщения за последние N минут (0 — без ограничения, < 0 — ValueError)
+                reason (str): Причина
+                progress: await progress(stats) во время удаления по одному
+
+            Returns:
+                {"deleted", "bulk", "single", "failed", "scanned", "old_skipped"}
+                old_skipped — 1, если старые сообщения не удалены из-за лимита
+        """
+
+        # Отрицательное окно дало бы «будущее» since — не удалилось бы ничего
+        if minutes < 0:
+            raise ValueError("minutes не может быть отрицательным")
+
+        cid = int(channel.id)
+        now = time.time()
+        since = now - minutes * 60 if minutes else None
+        # Запас в минуту, чтобы сообщение не «состарилось» до запроса
+        bulk_edge = now - 14 * 86_400 + 60
+
+        stats = {"deleted": 0, "bulk": 0, "single": 0, "failed": 0, "scanned": 0, "old_skipped": 0}
+        chunk: List[int] = []
+        old: List[int] = []
+
+        async def flush() -> None:
+            nonlocal chunk
+            batch, chunk = chunk, []
+            if not batch:
+                return
+            status, error = await submit_with_retry(self.dispatch,
+                                                    lambda: channel.delete_messages(batch, reason=reason),
+                                                    ("channel", cid), self.purge_retries)
+            if status == "done":
+                stats["bulk"] += len(batch)
+            else:
+                stats["failed"] += len(batch)
+                log_db("WARN", f"purge: пачка из {len(batch)} сообщений в канале {cid} не удалена", error)
+
+        matched = 0
+        async for message in channel.history(limit=self.purge_scan_limit):
+            stats["scanned"] += 1
+            ts = message.timestamp.timestamp()
+            # Дальше только более старые сообщения
+            if since is not None and ts < since:
+                break
+            if member_id is not None and int(message.author.id) != member_id:
+                continue
+
+            if ts > bulk_edge:
+                chunk.append(int(message.id))
+                if len(chunk) >= 100:
+                    await flush()
+            else:
+                # Дальше только старые: лимит исчерпан — больше ничего не удалится
+                if len(old) >= self.purge_old_limit:
+                    stats["old_skipped"] = 1
+                    break
+                old.append(int(message.id))
+
+            matched += 1
+            if matched >= count:
+                break
+        await flush()
+
+        last_report = time.monotonic()
+        for mid in old:
+            status, _ = await submit_with_retry(self.dispatch,
+                                                lambda mid=mid: channel.delete_message(mid, reason=reason),
+                                                ("channel", cid), self.purge_retries)
+            stats["single" if status == "done" else "failed"] += 1
+            if progress is not None and time.monotonic() - last_report >= self.purge_progress_interval:
+                last_report = time.monotonic()
+                stats["deleted"] = stats["bulk"] + stats["single"]
+                try:
+                    await progress(dict(stats))
+                except Exception as e:
+                    log_db("WARN", "purge: прогресс не обновлён", str(e))
+
+        stats["deleted"] = stats["bulk"] + stats["single"]
+
+        # Одна запись на всю очистку
+        log_db("INFO",
+               f"Модератор {author} очистил канал {channel}: удалено {stats['deleted']} "
+               f"(пачками {stats['bulk']}, по одному {stats['single']}, ошибок {stats['failed']})"
+               + (f", автор <@{member_id}>" if member_id is not None else ""),
+               reason=reason)
+
+        return stats
@@ -0,0 +1,138 @@
+import asyncio
+import time
+import interactions
+
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.db import Mutes
+from utils.adb import AsyncDB
+from utils.log import log_db
+from utils.dispatch import get_dispatcher
+from utils.scheduler import get_scheduler
+from services.mod.bulk import submit_with_retry
+from services.mod.resolver import MemberResolver
+from config import admin
+
+
+
+class TimedMutes:
+    """Снятие мьютов по истечении срока
+
+    Мьют на время записывается в таблицу mutes, дедлайн — в общий
+    DeadlineScheduler (min-heap и один таймер до ближайшего срока, без
+    опроса БД). При старте бота куча восстанавливается из таблицы, а
+    мьюты, истёкшие за время простоя, снимаются одной пачкой.
+    """
+
+    def __init__(self) -> None:
+        self.db = AsyncDB(Mutes)
+        self.cfg = admin
+        self.dispatch = get_dispatcher()
+        self.scheduler = get_scheduler()
+        self.resolver = MemberResolver()
+
+        self.max_retries = int(self.cfg.get("moderation.mute_retries", 3))
+        # Через сколько секунд повторить неудачное снятие мьюта
+        self.retry_delay = int(self.cfg.get("moderation.mute_retry_delay", 60))
+
+        self._started = False
+
+
+
+    async def start(self, client: interactions.Client) -> None:
+        """Снимает истёкшие за простой мьюты и планирует остальные (одиночный старт)"""
+        if self._started:
+            return
+        self._started = True
+
+        Mutes.scheduler = self.scheduler
+        self.scheduler.on("mute", lambda key: self.expire(client, *key))
+        self.scheduler.start()
+
+        now = int(time.time())
+        expired = await self.db.list_expired(now)
+        if expired:
+            await self._expire_batch(client, expired)
+
+        for mute in await self.db.list_active(now):
+            self.scheduler.schedule(("mute", (int(mute["guild_id"]), int(mute["user_id"]))), int(mute["expires_at"]))
+
+
+
+    async def set(self,
+                  guild: interactions.Guild,
+                  member: interactions.Member,
+                  role: interactions.Role,
+                  minutes: int,
+                  author: Optional[interactions.Member] = None,
+                  reason: str = "Не указана") -> int:
+        """Мьют истекает через minutes минут (прежний срок заменяется). Возвращает время окончания"""
+        expires_at = int(time.time()) + minutes * 60
+        await self.db.set_mute(int(guild.id), int(member.id), int(role.id), expires_at,
+                               int(author.id) if author is not None else None, reason)
+        return expires_at
+
+
+
+    async def clear(self, guild_id: int, user_id: int) -> None:
+        """Снимает таймер мьюта (размьют вручную или мьют стал бессрочным)"""
+        await self.db.remove_mutes([(int(guild_id), int(user_id))])
+
+
+
+    async def expire(self, client: interactions.Client, guild_id: int, user_id: int) -> None:
+        """Обработчик дедлайна: снимает мьют, если его срок действительно наступил"""
+        mute = await self.db.get_mute(guild_id, user_id)
+        # Мьют сняли вручную или продлили
+        if mute is None or int(mute["expires_at"]) > time.time():
+            return
+        await self._expire_batch(client, [mute])
+
+
+
+    async def _expire_batch(self, client: interactions.Client, mutes: List[Dict[str, Any]]) -> None:
+        """Снимает роль мьюта у всех mutes и удаляет их строки одной транзакцией"""
+        by_guild: Dict[int, List[Dict[str, Any]]] = {}
+        for mute in mutes:
+            by_guild.setdefault(int(mute["guild_id"]), []).append(mute)
+
+        removed: List[Tuple[int, int]] = []
+        retry: List[Tuple[int, int]] = []
+        for gid, rows in by_guild.items():
+            guild = client.get_guild(gid)
+            if guild is None:
+                # Бота на сервере больше нет — снимать нечего
+                removed += [(gid, int(m["user_id"])) for m in rows]
+                continue
+
+            members, _ = await self.resolver.resolve(guild, [int(m["user_id"]) for m in rows])
+
+            async def unmute(mute: Dict[str, Any]) -> None:
+                uid = int(mute["user_id"])
+                member = members.get(uid)
+                role = guild.get_role(int(mute["role_id"]))
+                # Ушёл с сервера, роль удалена или уже снята — мьют просто забывается
+                if member is None or role is None or role not in member.roles:
+                    removed.append((gid, uid))
+                    return
+                status, error = await submit_with_retry(
+                    self.dispatch,
+                    lambda: member.remove_role(role=role, reason="Срок мьюта истёк"),
+                    ("guild", gid), self.max_retries)
+                if status == "failed":
+                    retry.append((gid, uid))
+                    log_db("WARN", f"mutes: мьют {uid} не снят, повтор через {self.retry_delay} с", error)
+                    return
+                # forbidden повторять бессмысленно
+                if status == "forbidden":
+                    log_db("WARN", f"mutes: нет прав снять мьют {uid}", error)
+                removed.append((gid, uid))
+
+            await asyncio.gather(*(unmute(m) for m in rows))
+
+        if removed:
+            await self.db.remove_mutes(removed)
+            log_db("INFO", f"Снято мьютов по истечении срока: {len(removed)}",
+                   reason=" ".join(str(uid) for _, uid in removed))
+        for key in retry:
+            self.scheduler.schedule(("mute", key), int(time.time()) + self.retry_delay)
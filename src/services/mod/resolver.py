@@ -0,0 +1,119 @@
+import asyncio
+import re
+import interactions
+
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from utils.log import log_db
+from utils.members import get_members
+from utils.dispatch import MODERATION, get_dispatcher, retry_after
+from config import admin
+
+
+# _fetch: участника нет на сервере (в отличие от None — запрос не удался)
+_ABSENT = object()
+
+
+def parse_ids(raw: str) -> List[int]:
+    """ID из произвольного текста (упоминания, ID через пробел/запятую), без повторов"""
+    return list(dict.fromkeys(int(x) for x in re.findall(r"\d{15,20}", raw)))
+
+
+
+class MemberResolver:
+    """Получение участников сервера по списку ID
+
+    Сначала — локальный кэш (индекс участников и кэш сервера), промахи
+    запрашиваются у Discord параллельно (не больше concurrency запросов,
+    через Dispatcher, 429 повторяется после Retry-After). На всю пачку
+    действует общий таймаут: не успевшие ID считаются не найденными.
+    """
+
+    def __init__(self) -> None:
+        self.cfg = admin
+        self.index = get_members()
+        self.dispatch = get_dispatcher()
+
+        self.concurrency = int(self.cfg.get("resolver.concurrency", 10))
+        self.timeout = float(self.cfg.get("resolver.timeout", 10.0))
+        self.max_retries = int(self.cfg.get("resolver.retries", 3))
+
+
+
+    async def resolve(self,
+                      guild: interactions.Guild,
+                      user_ids: Iterable[int],
+                      timeout: Optional[float] = None,
+                      unresolved: Optional[List[int]] = None) -> Tuple[Dict[int, interactions.Member], List[int]]:
+        """
+            Участники по ID
+
+            Args:
+                guild (Guild): Сервер
+                user_ids (Iterable[int]): ID (повторы отбрасываются)
+                timeout (float): Таймаут запросов пачки, сек (по умолчанию resolver.timeout)
+                unresolved (List[int]): Если передан — сюда, а не в не найденные, попадают ID,
+                    не полученные из-за таймаута или временной ошибки (их можно запросить позже)
+
+            Returns:
+                ({id: участник} в порядке user_ids, [id не найденных])
+        """
+
+        gid = int(guild.id)
+        ids = list(dict.fromkeys(int(x) for x in user_ids))
+        found: Dict[int, interactions.Member] = {}
+        misses: List[int] = []
+        # NotFound — участника точно нет на сервере
+        absent: set = set()
+        for uid in ids:
+            member = self.index.get_member(gid, uid) or guild.get_member(uid)
+            if member is not None:
+                found[uid] = member
+            else:
+                misses.append(uid)
+
+        if misses:
+            slots = asyncio.Semaphore(max(1, self.concurrency))
+
+            async def fetch(uid: int) -> None:
+                async with slots:
+                    member = await self._fetch(guild, uid)
+                if member is _ABSENT:
+                    absent.add(uid)
+                elif member is not None:
+                    found[uid] = member
+                    self.index.add(gid, member)
+
+            tasks = [asyncio.get_running_loop().create_task(fetch(uid)) for uid in misses]
+            _, pending = await asyncio.wait(tasks, timeout=self.timeout if timeout is None else timeout)
+            for task in pending:
+                task.cancel()
+            if pending:
+                log_db("WARN", f"resolver: {len(pending)} из {len(misses)} ID не получены за таймаут")
+
+        ordered = {uid: found[uid] for uid in ids if uid in found}
+        if unresolved is None:
+            return ordered, [uid for uid in ids if uid not in found]
+        unresolved += [uid for uid in misses if uid not in found and uid not in absent]
+        return ordered, [uid for uid in ids if uid in absent]
+
+
+
+    async def _fetch(self, guild: interactions.Guild, user_id: int) -> Optional[interactions.Member]:
+        """guild.fetch_member через Dispatcher; _ABSENT — участника нет на сервере, None — запрос не удался"""
+        attempt = 0
+        while True:
+            try:
+                return await self.dispatch.submit(lambda: guild.fetch_member(user_id),
+                                                  MODERATION, route=("guild", int(guild.id)))
+            except interactions.errors.NotFound:
+                return _ABSENT
+            except interactions.errors.HTTPException as e:
+                attempt += 1
+                if getattr(e, "status", None) != 429 or attempt > self.max_retries:
+                    log_db("WARN", f"resolver: участник {user_id} не получен", str(e))
+                    return None
+                await asyncio.sleep(retry_after(e, attempt))
+            except Exception as e:
+                log_db("WARN", f"resolver: участник {user_id} не получен", str(e))
+                return None
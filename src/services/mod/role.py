@@ -1,10 +1,20 @@
 import interactions
-from typing import List, Tuple
+from typing import Dict, List, Optional, Tuple
 from utils.log import log_db
+from utils.dispatch import MODERATION, get_dispatcher
+from utils.members import get_members
+from services.mod.bulk import BulkRoleService, Progress
 
 class RoleService:
     """ Core логика, можно использовать повсюду """
 
+    def __init__(self) -> None:
+        self.dispatch = get_dispatcher()
+        # Массовые операции — заданиями с ограниченным параллелизмом
+        self.bulk = BulkRoleService()
+        # Роль → участники: обновляется событиями шлюза (RoleCog)
+        self.index = get_members()
+
     async def add(self,
                   member: interactions.Member,
                   author: interactions.Member | None,
@@ -30,7 +40,8 @@ class RoleService:
             if role in member.roles:
                 return 2
 
-            await member.add_role(role=role, reason=reason)
+            await self.dispatch.submit(lambda: member.add_role(role=role, reason=reason),
+                                       MODERATION, route=("guild", int(member.guild.id)))
             if author is not None:
                 log_db(level="INFO",
                        message=f"Модератор {author} добавил роль {role.name} пользователю {member}",
@@ -46,37 +57,30 @@ class RoleService:
 
 
     async def adds(self,
-                   members: List[interactions.Member],
+                   guild: interactions.Guild,
                    role: interactions.Role,
-                   reason: str = "Не указана") -> List[Tuple[interactions.Member, int]]:
+                   user_ids: List[int],
+                   author: interactions.Member | None = None,
+                   reason: str = "Не указана",
+                   progress: Optional[Progress] = None) -> Tuple[int, Dict[str, int]]:
 
         """
-            Добавляет роль нескольким пользователям
+            Добавляет роль нескольким пользователям (задание BulkRoleService)
 
             Args:
-                members (Member): Пользователи
+                guild (Guild): Сервер
                 role (Role): Роль, присваемая пользователям
+                user_ids (List[int]): ID пользователей
+                author (Member): Отправитель команды (ЛОГИ)
                 reason (str): Причина выдачи роли (по умолчанию "Не указана")
+                progress: await progress(job_id, counts, total, finished) по ходу выполнения
 
             Returns:
-                Возвращает список [member, код]
+                (id задания, {статус: количество})
         """
 
-        results: List[Tuple[interactions.Member, int]] = []
-        for m in members:
-            res = await self.add(member=m,
-                                 author=None,
-                                 role=role,
-                                 reason=reason)
-            results.append((m, res))
-        return results
-
-    async def add_many(self,
-                       guild: interactions.Guild,
-                       members: List[interactions.Member],
-                       role: interactions.Role,
-                       reason: str = "Не указана") -> List[Tuple[interactions.Member, int]]:
-        return await self.adds(members=members, role=role, reason=reason)
+        job_id = await self.bulk.create(guild, role, "add", user_ids, author, reason)
+        return job_id, await self.bulk.run(job_id, guild, progress)
 
 
 
@@ -105,7 +109,8 @@ class RoleService:
             if role not in member.roles:
                 return 2
             
-            await member.remove_role(role=role, reason=reason)
+            await self.dispatch.submit(lambda: member.remove_role(role=role, reason=reason),
+                                       MODERATION, route=("guild", int(member.guild.id)))
             if author is not None:
                 log_db(level="INFO",
                        message=f"Модератор {author} убрал роль {role.name} у пользователя {member}",
@@ -121,37 +126,30 @@ class RoleService:
 
 
     async def removes(self,
-                      members: List[interactions.Member],
+                      guild: interactions.Guild,
                       role: interactions.Role,
-                      reason: str = "Не указана") -> List[Tuple[interactions.Member, int]]:
+                      user_ids: List[int],
+                      author: interactions.Member | None = None,
+                      reason: str = "Не указана",
+                      progress: Optional[Progress] = None) -> Tuple[int, Dict[str, int]]:
 
         """
-            Убирает роль у нескольких пользователей
+            Убирает роль у нескольких пользователей (задание BulkRoleService)
 
             Args:
-                members (Member): Пользователи
+                guild (Guild): Сервер
                 role (Role): Роль, убираемая у пользователей
+                user_ids (List[int]): ID пользователей
+                author (Member): Отправитель команды (ЛОГИ)
                 reason (str): Причина убирания роли (по умолчанию "Не указана")
+                progress: await progress(job_id, counts, total, finished) по ходу выполнения
 
             Returns:
-                Возвращает список [member, код]
+                (id задания, {статус: количество})
         """
 
-        results: List[Tuple[interactions.Member, int]] = []
-        for m in members:
-            res = await self.remove(member=m,
-                                    author=None,
-                                    role=role,
-                                    reason=reason)
-            results.append((m, res))
-        return results
-
-    async def remove_many(self,
-                          guild: interactions.Guild,
-                          members: List[interactions.Member],
-                          role: interactions.Role,
-                          reason: str = "Не указана") -> List[Tuple[interactions.Member, int]]:
-        return await self.removes(members=members, role=role, reason=reason)
+        job_id = await self.bulk.create(guild, role, "remove", user_ids, author, reason)
+        return job_id, await self.bulk.run(job_id, guild, progress)
 
 
 
@@ -170,7 +168,7 @@ class RoleService:
                 Возвращает список пользователей
         """
 
-        await guild.chunk()
-        return [m for m in guild.members if role in m.roles]
+        await self.index.build(guild)
+        return self.index.members_with_role(guild.id, role.id)
 
             
@@ -1,12 +1,20 @@
+import time
 import interactions
+from typing import Any, Dict, List, Optional
 from utils.db import Users
+from utils.adb import AsyncDB
+from utils.jobs import get_queue
 from utils.log import log_db
+from config import admin
 
 class WarnService:
     """Core логика для работы с предупреждениями"""
 
     def __init__(self) -> None:
-        self.db = Users()
+        self.db = AsyncDB(Users)
+        # Через сколько дней выданное предупреждение истекает (0 — бессрочно)
+        self.decay_days = int(admin.get("warns.decay_days", 0))
+        self.history_page = int(admin.get("warns.history_page", 10))
 
 
 
@@ -33,7 +41,8 @@ class WarnService:
         """
 
         try:
-            new_count = self.db.add_warn(member.id, count)
+            decay_at = int(time.time()) + self.decay_days * 86_400 if self.decay_days > 0 else None
+            new_count = await self.db.add_warn(int(member.id), count, int(author.id), reason, decay_at)
             log_db("INFO",
                    f"Модератор {author} добавил {count} предупреждений пользователю {member}",
                    reason=reason)
@@ -67,7 +76,7 @@ class WarnService:
         """
 
         try:
-            new_count = self.db.remove_warn(member.id, count)
+            new_count = await self.db.remove_warn(int(member.id), count, int(author.id), reason)
             log_db("INFO",
                    f"Модератор {author} убрал {count} предупреждений у пользователя {member}",
                    reason=reason)
@@ -98,7 +107,7 @@ class WarnService:
         """
 
         try:
-            self.db.clear_warns(member.id)
+            await self.db.clear_warns(int(member.id), int(author.id), reason)
             log_db("INFO",
                    f"Модератор {author} очистил все предупреждения у пользователя {member}",
                    reason=reason)
@@ -119,5 +128,43 @@ class WarnService:
                 int: Количество предупреждений
         """
 
-        user = self.db.get_user(member.id)
-        return user['warns'] if user else 0
\ No newline at end of file
+        user = await self.db.get_user(member.id)
+        return user['warns'] if user else 0
+
+
+
+    async def history(self,
+                      user_id: int,
+                      before: Optional[tuple] = None) -> List[Dict[str, Any]]:
+
+        """
+            Страница журнала предупреждений пользователя (от новых к старым)
+
+            Args:
+                user_id (int): ID пользователя
+                before (tuple): (ts, id) последней записи предыдущей страницы
+
+            Returns:
+                Записи warn_events, не больше warns.history_page
+        """
+
+        return await self.db.warn_history(int(user_id), self.history_page, before)
+
+
+
+    async def decay(self) -> int:
+        """Снимает истёкшие предупреждения. Возвращает их количество"""
+        removed = await self.db.decay_warns(int(time.time()))
+        if removed:
+            log_db("INFO", f"Истёк срок предупреждений: снято {removed}")
+        return removed
+
+
+async def setup_warn_tasks(service: WarnService) -> None:
+    """Ежедневное снятие истёкших предупреждений (очередь jobs), если задан warns.decay_days"""
+    if service.decay_days <= 0:
+        return
+    queue = get_queue()
+    # Пропущенный из-за простоя запуск выполнится при старте — до следующего
+    queue.daily("warn_decay", 4, 0, lambda payload: service.decay(), grace=24 * 3600 - 60)
+    await queue.start()
@@ -4,8 +4,11 @@ import pytz
 from typing import List, Dict, Any
 
 from utils.db import Users
+from utils.adb import AsyncDB
 from utils.log import log_db
-from interactions import Task, CronTrigger
+from utils.channels import get_channels
+from utils.dispatch import get_dispatcher
+from utils.jobs import get_queue
 from config import admin
 
 
@@ -13,8 +16,10 @@ class BirthdayService:
     """Сервис для работы с днями рождения"""
 
     def __init__(self) -> None:
-        self.db = Users()
+        self.db = AsyncDB(Users)
         self.cfg = admin
+        self.channels = get_channels()
+        self.dispatch = get_dispatcher()
         self.MSK = pytz.timezone("Europe/Moscow")
 
     async def get_birthday_users_today(self) -> List[Dict[str, Any]]:
@@ -23,7 +28,7 @@ class BirthdayService:
         today_str = f"{today.day:02d}.{today.month:02d}"
         
         # Используем метод из db.py
-        return self.db.get_birthday_users_by_date(today_str)
+        return await self.db.get_birthday_users_by_date(today_str)
 
     async def get_birthday_users_tomorrow(self) -> List[Dict[str, Any]]:
         """Получает список пользователей, у которых завтра день рождения"""
@@ -31,7 +36,7 @@ class BirthdayService:
         tomorrow_str = f"{tomorrow.day:02d}.{tomorrow.month:02d}"
         
         # Используем метод из db.py
-        return self.db.get_birthday_users_by_date(tomorrow_str)
+        return await self.db.get_birthday_users_by_date(tomorrow_str)
 
     async def send_birthday_congratulations(self, bot: interactions.Client) -> None:
         """Отправляет поздравления с днем рождения в специальный канал"""
@@ -42,8 +47,7 @@ class BirthdayService:
                 return
             
             # Получаем канал для поздравлений
-            channel_id = int(self.cfg.get("channels.birthday", self.cfg.get("channels.events")))
-            channel = await bot.fetch_channel(channel_id)
+            channel = await self.channels.get(bot, "birthday", fallback="events")
             
             for user_data in birthday_users:
                 user_id = user_data['user_id']
@@ -65,13 +69,15 @@ class BirthdayService:
                         embed.set_thumbnail(url=user.avatar.url if user.avatar else None)
                         embed.set_footer(text=f"День рождения: {user_data['birthday']}")
                         
-                        await channel.send(embed=embed)
+                        await self.dispatch.send(channel, embed=embed)
                         
                 except Exception as e:
                     log_db("ERROR", f"Не удалось отправить поздравление пользователю {user_id}: {str(e)}")
                     
         except Exception as e:
             log_db("ERROR", f"Ошибка при отправке поздравлений: {str(e)}")
+            # До отправки поздравлений: очередь jobs повторит попытку
+            raise
 
     async def check_and_send_birthdays(self, bot: interactions.Client) -> None:
         """Проверяет дни рождения и отправляет поздравления"""
@@ -81,15 +87,13 @@ class BirthdayService:
             log_db("ERROR", f"Ошибка при проверке дней рождения: {str(e)}")
 
 
-def setup_birthday_tasks(bot: interactions.Client, birthday_service: BirthdayService) -> None:
-    """Настраивает фоновые задачи для проверки дней рождения"""
-    
-    @Task.create(CronTrigger("0 10 * * *", tz="Europe/Moscow"))
-    async def birthday_check_task():
-        """Задача для проверки дней рождения в 10:00 по МСК"""
-        await birthday_service.check_and_send_birthdays(bot)
-    
-    # Запускаем задачу
-    birthday_check_task.start()
-    
+async def setup_birthday_tasks(bot: interactions.Client, birthday_service: BirthdayService) -> None:
+    """Настраивает ежедневную задачу поздравлений (очередь jobs: не пропускается при простое бота)"""
+    queue = get_queue()
+    # Если бот был выключен в 10:00, поздравления уйдут при старте — до конца дня
+    queue.daily("birthday", 10, 0,
+                lambda payload: birthday_service.send_birthday_congratulations(bot),
+                grace=14 * 3600 - 60)
+    await queue.start()
+
     log_db("INFO", "Задача проверки дней рождения запущена (каждый день в 10:00 МСК)")
\ No newline at end of file
@@ -4,7 +4,11 @@ import pytz
 from typing import Optional, List, Dict, Any
 
 from utils.db import Users
+from utils.adb import AsyncDB
 from utils.log import log_db
+from utils.channels import get_channels
+from utils.dispatch import get_dispatcher
+from interactions import Task, IntervalTrigger
 from config import admin
 
 
@@ -12,10 +16,22 @@ class ProfileService:
     """Core логика профилей, можно использовать повсюду"""
 
     def __init__(self) -> None:
-        self.db = Users()
+        self.db = AsyncDB(Users)
         self.cfg = admin
+        self.channels = get_channels()
+        self.dispatch = get_dispatcher()
         self.MSK = pytz.timezone("Europe/Moscow")
 
+        # Порог (в сообщениях), при котором буфер сбрасывается, не дожидаясь интервала
+        Users.messages.max_pending = int(self.cfg.get("counters.messages_flush_size", 100))
+
+    async def flush_messages(self) -> None:
+        """Сбрасывает накопленные счётчики сообщений в БД"""
+        try:
+            await self.db.flush_messages()
+        except Exception as e:
+            log_db("ERROR", f"Ошибка при сбросе счётчиков сообщений: {str(e)}")
+
     async def get_user_profile(self, user_id: int) -> Optional[Dict[str, Any]]:
         """
         Получает профиль пользователя
@@ -26,11 +42,11 @@ class ProfileService:
         Returns:
             Optional[Dict[str, Any]]: Данные профиля или None
         """
-        user_data = self.db.get_user(user_id)
+        user_data = await self.db.get_user(user_id)
         if not user_data:
             # Создаем пользователя если его нет
-            self.db.add_user(user_id)
-            user_data = self.db.get_user(user_id)
+            await self.db.add_user(user_id)
+            user_data = await self.db.get_user(user_id)
         
         return user_data
 
@@ -64,7 +80,7 @@ class ProfileService:
                 return 0
             
             # Сохраняем в формате DD.MM используя метод из db.py
-            success = self.db.update_birthday(user_id, birthday_str)
+            success = await self.db.update_birthday(user_id, birthday_str)
             if success:
                 log_db("INFO", f"Пользователь {user_id} установил день рождения: {birthday_str}")
                 return 1
@@ -80,7 +96,7 @@ class ProfileService:
         today_str = f"{today.day:02d}.{today.month:02d}"
         
         # Используем метод из db.py
-        return self.db.get_birthday_users_by_date(today_str)
+        return await self.db.get_birthday_users_by_date(today_str)
 
     async def get_birthday_users_tomorrow(self) -> List[Dict[str, Any]]:
         """Получает список пользователей, у которых завтра день рождения"""
@@ -88,7 +104,7 @@ class ProfileService:
         tomorrow_str = f"{tomorrow.day:02d}.{tomorrow.month:02d}"
         
         # Используем метод из db.py
-        return self.db.get_birthday_users_by_date(tomorrow_str)
+        return await self.db.get_birthday_users_by_date(tomorrow_str)
 
     async def send_birthday_congratulations(self, bot: interactions.Client) -> None:
         """Отправляет поздравления с днем рождения в специальный канал"""
@@ -99,8 +115,7 @@ class ProfileService:
                 return
             
             # Получаем канал для поздравлений
-            channel_id = int(self.cfg.get("channels.birthday", self.cfg.get("channels.events")))
-            channel = await bot.fetch_channel(channel_id)
+            channel = await self.channels.get(bot, "birthday", fallback="events")
             
             for user_data in birthday_users:
                 user_id = user_data['user_id']
@@ -122,7 +137,7 @@ class ProfileService:
                         embed.set_thumbnail(url=user.avatar.url if user.avatar else None)
                         embed.set_footer(text=f"День рождения: {user_data['birthday']}")
                         
-                        await channel.send(embed=embed)
+                        await self.dispatch.send(channel, embed=embed)
                         
                 except Exception as e:
                     log_db("ERROR", f"Не удалось отправить поздравление пользователю {user_id}: {str(e)}")
@@ -162,4 +177,24 @@ class ProfileService:
         
         embed.set_footer(text=f"ID: {user_data['user_id']}")
         
-        return embed
\ No newline at end of file
+        return embed
+
+
+
+_TASK_STARTED = False
+
+
+def setup_counter_tasks(bot: interactions.Client, service: ProfileService) -> None:
+    """Запускает периодический сброс буфера сообщений (одиночный старт)"""
+    global _TASK_STARTED
+    if _TASK_STARTED:
+        return
+
+    interval = int(service.cfg.get("counters.messages_flush_interval", 30))
+
+    @Task.create(IntervalTrigger(seconds=interval))
+    async def _flush_loop():
+        await service.flush_messages()
+
+    _flush_loop.start()
+    _TASK_STARTED = True
@@ -0,0 +1,179 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Type
+
+from utils.db import DB
+
+
+class _Engine:
+    """Потоки доступа к одному файлу БД: один писатель и пул читателей
+
+    Общие для всех AsyncDB, работающих с этим файлом. В каждом потоке
+    лениво создаётся по одному экземпляру каждого репозитория.
+    """
+
+    def __init__(self, path: str, readers: int) -> None:
+        self.path = path
+        self.local = threading.local()
+
+        name = path.rsplit("/", 1)[-1].split(".")[0]
+        self.writer = ThreadPoolExecutor(max_workers=1,
+                                         thread_name_prefix=f"{name}-writer",
+                                         initializer=self._init_thread,
+                                         initargs=(False,))
+        self.readers = ThreadPoolExecutor(max_workers=max(1, readers),
+                                          thread_name_prefix=f"{name}-reader",
+                                          initializer=self._init_thread,
+                                          initargs=(True,))
+
+    def _init_thread(self, readonly: bool) -> None:
+        self.local.readonly = readonly
+        self.local.repos = {}
+
+    def repo(self, cls: Type[DB]) -> DB:
+        """Экземпляр репозитория текущего потока (вызывать только из потоков движка)"""
+        db = self.local.repos.get(cls)
+        if db is None:
+            db = self.local.repos[cls] = cls(readonly=self.local.readonly)
+        return db
+
+    def close(self) -> None:
+        self.readers.shutdown(wait=True)
+        self.writer.shutdown(wait=True)
+
+
+
+_engines: Dict[str, _Engine] = {}
+_engines_lock = threading.Lock()
+
+
+def _engine(path: str, readers: int) -> _Engine:
+    with _engines_lock:
+        engine = _engines.get(path)
+        if engine is None:
+            engine = _engines[path] = _Engine(path, readers)
+        return engine
+
+
+
+class AsyncDB:
+    """Асинхронный доступ к репозиторию DB без блокировки event loop
+
+    Записи выполняются в одном выделенном потоке-писателе, чтения — в
+    небольшом пуле потоков с read-only соединениями (в режиме WAL они не
+    ждут писателя). Потоки общие для всех репозиториев одного файла, а
+    любой метод репозитория доступен как корутина:
+
+        db = AsyncDB(Events)
+        event = await db.get_event(message_id)
+
+    Методы, помеченные @reader, уходят в пул читателей, остальные — писателю.
+
+    Args:
+        repo (Type[DB]): Класс репозитория (Users, Events, MoviePolls, ...)
+        readers (int): Количество read-only соединений (при первом открытии файла)
+    """
+
+    def __init__(self, repo: Type[DB], readers: int = 2) -> None:
+        self.repo = repo
+        self._engine = _engine(repo.DB_PATH, readers)
+        self._writer = self._engine.writer
+        self._readers = self._engine.readers
+
+        # Писатель создаёт файл и таблицы до того, как их откроют читатели
+        self._writer.submit(self._db).result()
+
+
+
+    def _db(self) -> DB:
+        return self._engine.repo(self.repo)
+
+
+
+    def _call(self, name: str, args: tuple, kwargs: Dict[str, Any]) -> Any:
+        return getattr(self._db(), name)(*args, **kwargs)
+
+
+
+    async def _submit(self, pool: ThreadPoolExecutor, fn: Callable, *args: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(pool, functools.partial(fn, *args))
+
+
+
+    def __getattr__(self, name: str) -> Callable:
+        attr = getattr(self.repo, name, None)
+        if name.startswith("_") or not callable(attr):
+            raise AttributeError(f"{self.repo.__name__} has no method '{name}'")
+
+        pool = self._readers if getattr(attr, "_reads", False) else self._writer
+
+        async def method(*args: Any, **kwargs: Any) -> Any:
+            return await self._submit(pool, self._call, name, args, kwargs)
+
+        method.__name__ = name
+        return method
+
+
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Выполняет fn(repo, *args) в потоке писателя.
+
+        Нужен для операций из нескольких шагов: все репозитории файла
+        пишут через одно соединение, поэтому шаги видят друг друга
+        и могут быть частью одной транзакции.
+        """
+        return await self._submit(self._writer, lambda: fn(self._db(), *args))
+
+
+
+    # --- Произвольные запросы ---
+    def _execute(self, sql: str, params: tuple, many: bool) -> int:
+        db = self._db()
+        if many:
+            db.cursor.executemany(sql, params)
+        else:
+            db.cursor.execute(sql, params)
+        db.commit()
+        # Произвольная запись может затронуть любые закэшированные сущности
+        if db.cache is not None:
+            db.cache.clear()
+        return db.cursor.rowcount
+
+    def _fetch(self, sql: str, params: tuple, one: bool) -> Any:
+        db = self._db()
+        db.cursor.execute(sql, params)
+        if one:
+            row = db.cursor.fetchone()
+            return dict(row) if row else None
+        return [dict(r) for r in db.cursor.fetchall()]
+
+    async def execute(self, sql: str, params: tuple = ()) -> int:
+        """Выполняет запрос на запись и коммитит. Возвращает rowcount"""
+        return await self._submit(self._writer, self._execute, sql, params, False)
+
+    async def executemany(self, sql: str, rows: List[tuple]) -> int:
+        """Пакетная запись одной транзакцией. Возвращает rowcount"""
+        return await self._submit(self._writer, self._execute, sql, rows, True)
+
+    async def fetchone(self, sql: str, params: tuple = ()) -> Optional[Dict[str, Any]]:
+        """SELECT в пуле читателей, первая строка или None"""
+        return await self._submit(self._readers, self._fetch, sql, params, True)
+
+    async def fetchall(self, sql: str, params: tuple = ()) -> List[Dict[str, Any]]:
+        """SELECT в пуле читателей, все строки"""
+        return await self._submit(self._readers, self._fetch, sql, params, False)
+
+
+
+    def cache_stats(self) -> Optional[Dict[str, Any]]:
+        """Статистика кэша сущностей репозитория (None, если кэша нет)"""
+        return self.repo.cache.stats() if self.repo.cache is not None else None
+
+
+
+    def close(self) -> None:
+        """Дожидается выполнения очереди и останавливает потоки файла (общие для всех его репозиториев)"""
+        self._engine.close()
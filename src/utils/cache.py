@@ -0,0 +1,121 @@
+import copy
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable
+
+
+def _sizeof(obj: Any) -> int:
+    """Приблизительный размер объекта в байтах (dict/list/tuple рекурсивно)"""
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_sizeof(k) + _sizeof(v) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set)):
+        size += sum(_sizeof(x) for x in obj)
+    return size
+
+
+
+class LRUCache:
+    """Потокобезопасный LRU-кэш сущностей с ограничением по памяти
+
+    Используется репозиториями DB как read-through кэш: чтение идёт через
+    get_or_load, каждый изменяющий метод вызывает invalidate для своих
+    ключей. Наружу всегда отдаются копии, чтобы вызывающий код не мог
+    испортить закэшированное значение.
+
+    Args:
+        name (str): Имя кэша (для статистики)
+        max_bytes (int): Ограничение суммарного размера значений
+    """
+
+    def __init__(self, name: str, max_bytes: int = 2 * 1024 * 1024) -> None:
+        self.name = name
+        self.max_bytes = max_bytes
+
+        self._data: "OrderedDict[Hashable, tuple[Any, int]]" = OrderedDict()
+        self._bytes = 0
+        # Счётчик инвалидаций: значение, загруженное во время инвалидации, не кладём
+        self._generation = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """Значение из кэша или результат loader() (который и кэшируется)"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return copy.deepcopy(entry[0])
+            self.misses += 1
+            generation = self._generation
+
+        value = loader()
+
+        with self._lock:
+            if generation == self._generation:
+                self._put(key, value)
+        return copy.deepcopy(value)
+
+
+
+    def _put(self, key: Hashable, value: Any) -> None:
+        size = _sizeof(value)
+        if size > self.max_bytes:
+            return
+        old = self._data.pop(key, None)
+        if old is not None:
+            self._bytes -= old[1]
+        self._data[key] = (copy.deepcopy(value), size)
+        self._bytes += size
+
+        while self._bytes > self.max_bytes:
+            _, (_, evicted) = self._data.popitem(last=False)
+            self._bytes -= evicted
+            self.evictions += 1
+
+
+
+    def invalidate(self, *keys: Hashable) -> None:
+        """Удаляет ключи из кэша"""
+        self.invalidate_many(keys)
+
+
+
+    def invalidate_many(self, keys: Iterable[Hashable]) -> None:
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                old = self._data.pop(key, None)
+                if old is not None:
+                    self._bytes -= old[1]
+
+
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._data.clear()
+            self._bytes = 0
+
+
+
+    def stats(self) -> Dict[str, Any]:
+        """Счётчики попаданий/промахов (каждое попадание — сэкономленный запрос к БД)"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "name": self.name,
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits / total) if total else 0.0,
+            }
@@ -0,0 +1,127 @@
+import threading
+import interactions
+
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from interactions.models.discord.message import process_message_payload
+
+from utils.dispatch import COSMETIC, get_dispatcher
+from config import admin
+
+
+
+class ChannelCache:
+    """Кэш каналов из конфига (channels.*) и правка сообщений без fetch
+
+    Канал запрашивается у Discord один раз и дальше берётся из кэша.
+    ID канала читается из конфига при каждом обращении (TomlIO перечитывает
+    файл только после изменения), поэтому смена channels.* в конфиге сразу
+    приводит к новому каналу. Обновление/удаление канала на стороне Discord
+    приходит через update/evict (слушатели ChannelUpdate/ChannelDelete).
+    """
+
+    def __init__(self) -> None:
+        self.cfg = admin
+        self._channels: Dict[int, Any] = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+
+
+    def channel_id(self, name: str, fallback: Optional[str] = None) -> int:
+        """ID канала channels.<name> (или channels.<fallback>, если первого нет)"""
+        value = self.cfg.get(f"channels.{name}")
+        if value is None and fallback is not None:
+            value = self.cfg.get(f"channels.{fallback}")
+        return int(value)
+
+
+
+    async def get(self, client: interactions.Client, name: str, fallback: Optional[str] = None) -> Any:
+        """Канал channels.<name> (запрос к Discord — только при первом обращении)"""
+        return await self.get_by_id(client, self.channel_id(name, fallback))
+
+
+
+    async def get_by_id(self, client: interactions.Client, channel_id: int) -> Any:
+        channel_id = int(channel_id)
+        with self._lock:
+            channel = self._channels.get(channel_id)
+        if channel is not None:
+            self.hits += 1
+            return channel
+
+        self.misses += 1
+        channel = await client.fetch_channel(channel_id)
+        if channel is not None:
+            with self._lock:
+                self._channels[channel_id] = channel
+        return channel
+
+
+
+    def update(self, channel: Any) -> None:
+        """Канал изменился (событие ChannelUpdate): заменяем закэшированный объект"""
+        with self._lock:
+            if int(channel.id) in self._channels:
+                self._channels[int(channel.id)] = channel
+
+
+
+    def evict(self, channel_id: int) -> None:
+        """Канал удалён (событие ChannelDelete)"""
+        with self._lock:
+            self._channels.pop(int(channel_id), None)
+
+
+
+    async def edit_message(self,
+                           client: interactions.Client,
+                           channel_id: int,
+                           message_id: int,
+                           priority: int = COSMETIC,
+                           **payload: Any) -> Any:
+        """Правит сообщение по id, без предварительного fetch_message
+
+        Правка идёт через Dispatcher с приоритетом priority; ещё не отправленная
+        правка того же сообщения заменяется (тогда результат — SUPERSEDED).
+        payload — как у Message.edit (content, embed/embeds, components).
+        """
+        if "embed" in payload:
+            payload["embeds"] = payload.pop("embed")
+        message_payload = process_message_payload(**payload)
+        channel_id, message_id = int(channel_id), int(message_id)
+        return await get_dispatcher().submit(
+            lambda: client.http.edit_message(message_payload, channel_id, message_id),
+            priority, route=("channel", channel_id), key=("edit", message_id))
+
+
+
+    def editor(self,
+               client: interactions.Client,
+               channel_id: int,
+               message_id: int,
+               priority: int = COSMETIC) -> Callable[..., Awaitable[Any]]:
+        """edit(**payload) для сообщения по id (для RenderRegistry.edit_by_id)"""
+        return lambda **payload: self.edit_message(client, channel_id, message_id, priority, **payload)
+
+
+
+    def stats(self) -> Dict[str, Any]:
+        return {"channels": len(self._channels), "hits": self.hits, "misses": self.misses}
+
+
+
+_channels: Optional[ChannelCache] = None
+_channels_lock = threading.Lock()
+
+
+def get_channels() -> ChannelCache:
+    """Возвращает общий ChannelCache (создаётся при первом обращении)"""
+    global _channels
+    with _channels_lock:
+        if _channels is None:
+            _channels = ChannelCache()
+        return _channels
@@ -0,0 +1,140 @@
+import atexit
+import threading
+from typing import Callable, Dict, Iterable, Optional
+
+
+class WriteBehindCounter:
+    """Буфер дельт счётчиков в памяти с отложенной пакетной записью в БД
+
+    Инкременты копятся в словаре {key: delta} и сбрасываются одним вызовом
+    flush-функции: по интервалу (см. задачу в сервисе) или при достижении
+    порога max_pending накопленных инкрементов.
+    """
+
+    def __init__(self,
+                 flush: Callable[[Dict[int, int]], None],
+                 max_pending: int = 100) -> None:
+        self._flush = flush
+        self.max_pending = max_pending
+
+        self._deltas: Dict[int, int] = {}
+        self._total = 0
+        # RLock: читатели БД держат его на время SELECT + слияния дельт,
+        # чтобы сброс не мог «проскочить» между ними
+        self.lock = threading.RLock()
+
+        atexit.register(self.flush)
+
+
+
+    def add(self, key: int, delta: int = 1) -> None:
+        """Добавляет дельту к ключу; при переполнении буфера сразу сбрасывает его"""
+        with self.lock:
+            self._deltas[key] = self._deltas.get(key, 0) + delta
+            self._total += abs(delta)
+            full = self._total >= self.max_pending
+
+        if full:
+            self.flush()
+
+
+
+    def get(self, key: int) -> int:
+        """Несброшенная дельта по ключу (0, если нет)"""
+        with self.lock:
+            return self._deltas.get(key, 0)
+
+
+
+    def pending(self) -> Dict[int, int]:
+        """Копия всех несброшенных дельт"""
+        with self.lock:
+            return dict(self._deltas)
+
+
+
+    def __len__(self) -> int:
+        return self._total
+
+
+
+    def flush(self) -> int:
+        """Сбрасывает накопленные дельты. Возвращает количество записанных ключей"""
+        with self.lock:
+            if not self._deltas:
+                return 0
+
+            batch = self._deltas
+            # Запись идёт под блокировкой: читатели не увидят состояние,
+            # в котором дельты уже убраны из буфера, но ещё не в БД
+            self._flush(batch)
+            self._deltas = {}
+            self._total = 0
+            return len(batch)
+
+
+
+class VoteTally:
+    """Счётчики голосов опросов в памяти {poll_id: {option_id: votes}}
+
+    Счётчики опроса загружаются из БД один раз (loader), дальше меняются
+    только дельтами из изменяющих методов репозитория. Писатель меняет
+    таблицу голосов и счётчик под self.lock, загрузка тоже идёт под ним,
+    поэтому загруженный счётчик не может пропустить или учесть дважды
+    ни один голос.
+    """
+
+    def __init__(self) -> None:
+        self._polls: Dict[int, Dict[int, int]] = {}
+        self.lock = threading.RLock()
+
+
+
+    def get_or_load(self, poll_id: int, loader: Callable[[], Dict[int, int]]) -> Dict[int, int]:
+        """Копия счётчиков опроса (при первом обращении — loader())"""
+        with self.lock:
+            tally = self._polls.get(poll_id)
+            if tally is None:
+                tally = self._polls[poll_id] = dict(loader())
+            return dict(tally)
+
+
+
+    def move(self, poll_id: int, old: Optional[int], new: int) -> None:
+        """Голос перешёл с варианта old (None — новый голос) на new"""
+        with self.lock:
+            tally = self._polls.get(poll_id)
+            # Не загружен — загрузится из БД уже с этим голосом
+            if tally is None or old == new:
+                return
+            if old is not None:
+                left = tally.get(old, 0) - 1
+                if left > 0:
+                    tally[old] = left
+                else:
+                    tally.pop(old, None)
+            tally[new] = tally.get(new, 0) + 1
+
+
+
+    def keep_only(self, poll_id: int, option_ids: Iterable[int]) -> None:
+        """Убирает счётчики всех вариантов, кроме option_ids"""
+        keep = set(option_ids)
+        with self.lock:
+            tally = self._polls.get(poll_id)
+            if tally is not None:
+                self._polls[poll_id] = {k: v for k, v in tally.items() if k in keep}
+
+
+
+    def reset(self, poll_id: int) -> None:
+        """Все голоса опроса удалены"""
+        with self.lock:
+            self._polls[poll_id] = {}
+
+
+
+    def drop(self, poll_id: int) -> None:
+        """Забывает счётчики опроса (при следующем чтении загрузятся заново)"""
+        with self.lock:
+            self._polls.pop(poll_id, None)
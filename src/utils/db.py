@@ -1,44 +1,263 @@
+import json
 import os
 import sqlite3
+import threading
+import time
 import pytz
+from contextlib import contextmanager
 from datetime import datetime
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Callable, Iterator, Set
 
+from utils.cache import LRUCache
+from utils.counter import VoteTally, WriteBehindCounter
 
-class DB:
-    """Универсальный класс для работы с SQLite"""
 
-    def __init__(self, db_path: str) -> None:
-        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+def reader(method: Callable) -> Callable:
+    """Помечает метод репозитория как только читающий (AsyncDB выполнит его в пуле читателей)"""
+    method._reads = True
+    return method
 
-        self.path = db_path
-        self.conn = sqlite3.connect(self.path)
 
+
+class SharedConnection:
+    """Общее на процесс соединение писателя с одним файлом БД
+
+    Все репозитории одного файла (например, Events и MoviePolls для
+    events.db) пишут через это соединение, поэтому могут работать в одной
+    транзакции. DDL каждого репозитория выполняется один раз за процесс.
+    """
+
+    def __init__(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        self.path = path
+        # Соединение используется из потока-писателя AsyncDB и, изредка,
+        # из других потоков (например, сброс буферов при выходе)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
         self.conn.row_factory = sqlite3.Row
+        # WAL: читатели не блокируются писателем и наоборот
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+
+        self.lock = threading.RLock()
+        self._initialized: Set[type] = set()
+
+        # Открытая транзакция (DB.transaction): глубина вложенности и действия,
+        # отложенные до её завершения (сброс кэшей и т.п.)
+        self.tx_depth = 0
+        self.tx_callbacks: List[Callable[[], None]] = []
+
+
+
+    def init_once(self, db: "DB") -> None:
+        """Выполняет _init_tables репозитория, если для этого класса ещё не выполнялся"""
+        with self.lock:
+            if type(db) in self._initialized:
+                return
+            db._init_tables()
+            db._init_indexes()
+            self._initialized.add(type(db))
+
+
+
+_connections: Dict[str, SharedConnection] = {}
+_connections_lock = threading.Lock()
+
+
+def connect(path: str) -> SharedConnection:
+    """Возвращает общее соединение с файлом БД (открывается один раз на процесс)"""
+    path = os.path.abspath(path)
+    with _connections_lock:
+        shared = _connections.get(path)
+        if shared is None:
+            shared = _connections[path] = SharedConnection(path)
+        return shared
+
+
+
+class DB:
+    """Универсальный класс для работы с SQLite
+
+    Соединение писателя берётся из общего реестра (connect), read-only
+    соединения открываются отдельно для каждого экземпляра.
+
+    Args:
+        db_path (str): Путь к файлу БД
+        readonly (bool): Открыть read-only соединение (без создания таблиц)
+    """
+
+    # Управляемый набор индексов: {имя: "таблица(колонки)"}, создаётся вместе с таблицами
+    INDEXES: Dict[str, str] = {}
+
+    # Read-through кэш сущностей, общий для всех экземпляров (писатель и читатели)
+    cache: Optional[LRUCache] = None
+
+    # Планировщик дедлайнов (utils.scheduler.DeadlineScheduler), подключается сервисом при старте
+    scheduler: Any = None
+
+    def __init__(self, db_path: str, readonly: bool = False) -> None:
+        self.path = db_path
+        self.readonly = readonly
+        self.shared: Optional[SharedConnection] = None
+        if readonly:
+            self.conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+            self.conn.row_factory = sqlite3.Row
+        else:
+            self.shared = connect(self.path)
+            self.conn = self.shared.conn
 
         self.cursor = self.conn.cursor()
 
         self.MSK = pytz.timezone("Europe/Moscow")
 
-        self._init_tables()
+        if self.shared is not None:
+            self.shared.init_once(self)
 
     def _init_tables(self) -> None:
         """Переопределяем в наследниках"""
         pass
 
+    def _init_indexes(self) -> None:
+        for name, spec in self.INDEXES.items():
+            self.cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {spec}")
+        self.commit()
+
+    def _columns(self, table: str) -> Dict[str, str]:
+        """{колонка: объявленный тип} таблицы"""
+        self.cursor.execute(f"PRAGMA table_info({table})")
+        return {r["name"]: str(r["type"]).upper() for r in self.cursor.fetchall()}
+
+    def _to_epoch(self, value: Any) -> int:
+        """ISO-8601 (без смещения считается МСК) или число → UTC epoch, сек"""
+        if isinstance(value, (int, float)):
+            return int(value)
+        text = str(value).strip()
+        if text.lstrip("-").isdigit():
+            return int(text)
+        dt = datetime.fromisoformat(text)
+        if dt.tzinfo is None:
+            dt = self.MSK.localize(dt)
+        return int(dt.timestamp())
+
+    def _rebuild_table(self,
+                       table: str,
+                       schema: str,
+                       columns: List[str],
+                       convert: Dict[str, Callable[[Any], Any]]) -> None:
+        """Пересоздаёт таблицу по новой схеме (schema с плейсхолдером {name}),
+        перенося columns и преобразуя значения через convert. Одна транзакция."""
+        cols = ", ".join(columns)
+        self.cursor.execute(f"SELECT {cols} FROM {table}")
+        rows = [tuple(convert[c](r[c]) if c in convert else r[c] for c in columns)
+                for r in self.cursor.fetchall()]
+
+        self.commit()
+        self.cursor.execute("BEGIN")
+        try:
+            self.cursor.execute(schema.format(name=f"{table}_new"))
+            self.cursor.executemany(
+                f"INSERT INTO {table}_new ({cols}) VALUES ({', '.join(['?'] * len(columns))})",
+                rows
+            )
+            self.cursor.execute(f"DROP TABLE {table}")
+            self.cursor.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+            self.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+
+    def _cached(self, key: tuple, loader: Callable[[], Any]) -> Any:
+        """Читает через кэш репозитория (если он есть)"""
+        if self.cache is None:
+            return loader()
+        return self.cache.get_or_load(key, loader)
+
+    def _invalidate(self, *keys: tuple) -> None:
+        """Сбрасывает ключи кэша; вызывается каждым изменяющим методом после записи"""
+        if self.cache is not None:
+            cache = self.cache
+            self._after_transaction(lambda: cache.invalidate(*keys))
+
+    def in_transaction(self) -> bool:
+        return self.shared is not None and self.shared.tx_depth > 0
+
+    def _after_transaction(self, fn: Callable[[], None]) -> None:
+        """Выполняет fn сразу, а внутри transaction() — после commit/rollback"""
+        if self.in_transaction():
+            self.shared.tx_callbacks.append(fn)
+        else:
+            fn()
+
+    def _deadline(self, key: tuple, ts: Optional[int]) -> None:
+        """Переносит дедлайн key в планировщике (ts=None — снимает) после фиксации записи
+
+        Обработчики дедлайнов всё равно перепроверяют состояние в БД, поэтому
+        дедлайн, оставшийся от откатившейся транзакции, ничего не сломает.
+        """
+        scheduler = self.scheduler
+        if scheduler is None:
+            return
+        if ts is None:
+            self._after_transaction(lambda: scheduler.cancel(key))
+        else:
+            self._after_transaction(lambda: scheduler.schedule(key, ts))
+
+    @contextmanager
+    def transaction(self) -> Iterator["DB"]:
+        """Единица работы: commit() внутри блока откладывается до выхода из него
+
+        При исключении все изменения блока откатываются. Вложенные блоки
+        становятся частью внешнего. Транзакция общая для всех репозиториев
+        файла, поэтому в ней можно вызывать методы, например, Events и
+        MoviePolls одного соединения писателя:
+
+            with db.transaction():
+                db.keep_only_options(mid, ids)
+                db.reset_votes(mid)
+        """
+        if self.shared is None:
+            raise RuntimeError("Транзакция на read-only соединении")
+
+        shared = self.shared
+        with shared.lock:
+            shared.tx_depth += 1
+            ok = False
+            try:
+                yield self
+                ok = True
+            finally:
+                shared.tx_depth -= 1
+                if shared.tx_depth == 0:
+                    try:
+                        if ok:
+                            self.conn.commit()
+                        else:
+                            self.conn.rollback()
+                    finally:
+                        callbacks, shared.tx_callbacks = shared.tx_callbacks, []
+                        for fn in callbacks:
+                            fn()
+
     def commit(self) -> None:
+        # Внутри transaction() фиксирует сам блок при выходе
+        if self.in_transaction():
+            return
         self.conn.commit()
 
     def close(self) -> None:
-        self.conn.close()
+        # Общее соединение живёт всё время работы процесса
+        if self.readonly:
+            self.conn.close()
 
 
 
 class Log(DB):
     """Работа с таблицей logs"""
 
-    def __init__(self) -> None:
-        super().__init__(os.path.abspath("src/data/db/log.db"))
+    DB_PATH = os.path.abspath("src/data/db/log.db")
+
+    def __init__(self, readonly: bool = False) -> None:
+        super().__init__(self.DB_PATH, readonly)
 
 
 
@@ -65,7 +284,18 @@ class Log(DB):
         self.commit()
 
 
-    
+
+    def write_many(self, rows: List[tuple]) -> None:
+        """Пакетная запись: rows = [(level, message, reason, ts), ...], один commit"""
+        self.cursor.executemany(
+            "INSERT INTO logs(level, message, reason, ts) VALUES (?, ?, ?, ?)",
+            rows
+        )
+        self.commit()
+
+
+
+    @reader
     def get(self, limit: int = 10) -> List[Dict[str, Any]]:
         self.cursor.execute(
             "SELECT id, level, message, reason, ts "
@@ -77,10 +307,34 @@ class Log(DB):
 
 
 class Users(DB):
-    """Работа с таблицей users (статистика и предупреждения)"""
+    """Работа с таблицами users (статистика и предупреждения) и warn_events
+
+    warn_events — журнал предупреждений (только добавление): каждая выдача,
+    снятие, очистка и истечение срока — строка с изменением delta.
+    users.warns — материализованная сумма журнала, обновляется в той же
+    транзакции, что и запись в журнал.
+    """
+
+    DB_PATH = os.path.abspath("src/data/db/users.db")
+
+    INDEXES = {
+        "idx_users_birthday": "users(birthday)",
+        "idx_users_messages": "users(messages DESC)",
+        "idx_warn_events_user_ts": "warn_events(user_id, ts)",
+        "idx_warn_events_decay": "warn_events(decay_at)",
+    }
+
+    cache = LRUCache("users")
+
+    # Общий для всех экземпляров буфер несброшенных сообщений {user_id: delta}
+    messages: Optional[WriteBehindCounter] = None
+
+    def __init__(self, readonly: bool = False) -> None:
+        super().__init__(self.DB_PATH, readonly)
 
-    def __init__(self) -> None:
-        super().__init__(os.path.abspath("src/data/db/users.db"))
+        # Сбрасывать буфер может только соединение писателя
+        if Users.messages is None and not readonly:
+            Users.messages = WriteBehindCounter(self._write_messages)
 
     def _init_tables(self) -> None:
         self.cursor.execute("""
@@ -91,6 +345,33 @@ class Users(DB):
                 warns INTEGER DEFAULT 0
             );
         """)
+
+        # ts / decay_at — UTC epoch (сек); decay_at — когда выданное предупреждение
+        # истекает (NULL — бессрочно или уже истекло/снято), decay_left — сколько
+        # предупреждений записи ещё истечёт (уменьшается ручным снятием)
+        ledger_cols = self._columns("warn_events")
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS warn_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                moderator_id INTEGER,
+                delta INTEGER NOT NULL,
+                reason TEXT,
+                ts INTEGER NOT NULL,
+                decay_at INTEGER,
+                decay_left INTEGER NOT NULL DEFAULT 0
+            );
+        """)
+        if ledger_cols and "decay_left" not in ledger_cols:
+            self.cursor.execute("ALTER TABLE warn_events ADD COLUMN decay_left INTEGER NOT NULL DEFAULT 0")
+            self.cursor.execute("UPDATE warn_events SET decay_left = delta WHERE decay_at IS NOT NULL")
+        # Миграция: текущие счётчики становятся первой записью журнала
+        if not ledger_cols:
+            self.cursor.execute(
+                "INSERT INTO warn_events (user_id, delta, reason, ts) "
+                "SELECT user_id, warns, 'Перенесено из users.warns', ? FROM users WHERE warns > 0",
+                (int(time.time()),)
+            )
         self.commit()
 
 
@@ -101,12 +382,31 @@ class Users(DB):
             "INSERT OR IGNORE INTO users (user_id, messages, warns) VALUES (?, 0, 0)",
             (user_id,)
         )
+        inserted = self.cursor.rowcount == 1
         self.commit()
+        if inserted:
+            self._invalidate(("user", user_id))
 
 
 
+    @reader
     def get_user(self, user_id: int) -> Optional[Dict[str, Any]]:
-        """Получает информацию о пользователе"""
+        """Получает информацию о пользователе (с учётом несброшенных сообщений)"""
+        with self.messages.lock:
+            user = self._cached(("user", user_id), lambda: self._load_user(user_id))
+            delta = self.messages.get(user_id)
+
+        if not user:
+            if not delta:
+                return None
+            return {"user_id": user_id, "birthday": None, "messages": delta, "warns": 0}
+
+        user["messages"] += delta
+        return user
+
+
+
+    def _load_user(self, user_id: int) -> Optional[Dict[str, Any]]:
         self.cursor.execute(
             "SELECT user_id, birthday, messages, warns FROM users WHERE user_id = ?",
             (user_id,)
@@ -117,172 +417,468 @@ class Users(DB):
 
 
     def increment_messages(self, user_id: int) -> None:
-        """Увеличивает счетчик сообщений пользователя"""
-        self.add_user(user_id)
-        self.cursor.execute(
-            "UPDATE users SET messages = messages + 1 WHERE user_id = ?",
-            (user_id,)
+        """Увеличивает счетчик сообщений пользователя (в буфере, запись в БД отложена)"""
+        self.messages.add(user_id)
+
+
+
+    def flush_messages(self) -> int:
+        """Сбрасывает буфер сообщений в БД. Возвращает количество обновлённых пользователей"""
+        return self.messages.flush()
+
+
+
+    def _write_messages(self, deltas: Dict[int, int]) -> None:
+        """Записывает пачку дельт сообщений одной транзакцией"""
+        self.cursor.executemany(
+            "INSERT INTO users (user_id, messages, warns) VALUES (?, ?, 0) "
+            "ON CONFLICT(user_id) DO UPDATE SET messages = messages + excluded.messages",
+            list(deltas.items())
         )
         self.commit()
+        self._invalidate(*(("user", uid) for uid in deltas))
+
+
+
+    def _merge_pending(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Добавляет несброшенные дельты сообщений к строкам users"""
+        pending = self.messages.pending()
+        for r in rows:
+            r["messages"] += pending.get(int(r["user_id"]), 0)
+        return rows
+
 
 
+    def _upsert_user(self,
+                     user_id: int,
+                     update: str,
+                     params: tuple = (),
+                     warns: int = 0,
+                     birthday: Optional[str] = None) -> Dict[str, Any]:
+        """Создаёт пользователя или обновляет его одной командой и одним коммитом
 
-    def add_warn(self, user_id: int, count: int = 1) -> int:
-        """Добавляет предупреждения пользователю"""
-        self.add_user(user_id)
+        Args:
+            user_id (int): ID пользователя
+            update (str): SET-часть для существующей строки (может ссылаться на excluded.*)
+            params (tuple): Параметры для update
+            warns (int): Предупреждения новой строки
+            birthday (Optional[str]): День рождения новой строки
+
+        Returns:
+            Строка users после изменения (без учёта несброшенных сообщений)
+        """
         self.cursor.execute(
-            "UPDATE users SET warns = warns + ? WHERE user_id = ?",
-            (count, user_id)
+            "INSERT INTO users (user_id, birthday, messages, warns) VALUES (?, ?, 0, ?) "
+            f"ON CONFLICT(user_id) DO UPDATE SET {update} "
+            "RETURNING user_id, birthday, messages, warns",
+            (user_id, birthday, warns, *params)
         )
+        row = dict(self.cursor.fetchone())
         self.commit()
-        
-        user = self.get_user(user_id)
-        return user['warns'] if user else 0
+        self._invalidate(("user", user_id))
+        return row
 
 
 
-    def remove_warn(self, user_id: int, count: int = 1) -> int:
-        """Убирает предупреждения у пользователя"""
-        self.add_user(user_id)
+    def _log_warn(self,
+                  user_id: int,
+                  delta: int,
+                  moderator_id: Optional[int],
+                  reason: Optional[str],
+                  decay_at: Optional[int] = None) -> None:
+        """Запись в журнал warn_events (вызывается внутри транзакции изменения users.warns)"""
+        if delta == 0:
+            return
         self.cursor.execute(
-            "UPDATE users SET warns = MAX(0, warns - ?) WHERE user_id = ?",
-            (count, user_id)
+            "INSERT INTO warn_events (user_id, moderator_id, delta, reason, ts, decay_at, decay_left) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (user_id, moderator_id, delta, reason, int(time.time()), decay_at,
+             delta if decay_at is not None else 0)
         )
-        self.commit()
-        
-        user = self.get_user(user_id)
-        return user['warns'] if user else 0
 
 
 
-    def clear_warns(self, user_id: int) -> None:
-        """Очищает все предупреждения пользователя"""
-        self.add_user(user_id)
+    def _consume_decays(self, user_id: int, count: int) -> None:
+        """Снятые вручную предупреждения больше не истекают: уменьшает decay_left
+        ожидающих истечения записей, начиная со старых"""
         self.cursor.execute(
-            "UPDATE users SET warns = 0 WHERE user_id = ?",
+            "SELECT id, decay_left FROM warn_events WHERE user_id = ? AND decay_at IS NOT NULL ORDER BY ts, id",
             (user_id,)
         )
-        self.commit()
+        updates = []
+        for r in self.cursor.fetchall():
+            if count <= 0:
+                break
+            left = int(r["decay_left"])
+            used = min(left, count)
+            count -= used
+            updates.append((left - used, left - used, int(r["id"])))
+        self.cursor.executemany(
+            "UPDATE warn_events SET decay_left = ?, decay_at = CASE WHEN ? > 0 THEN decay_at END WHERE id = ?",
+            updates
+        )
+
+
 
+    def add_warn(self,
+                 user_id: int,
+                 count: int = 1,
+                 moderator_id: Optional[int] = None,
+                 reason: Optional[str] = None,
+                 decay_at: Optional[int] = None) -> int:
+        """Добавляет предупреждения пользователю (истекают в decay_at, если задан). Возвращает новое количество"""
+        with self.transaction():
+            row = self._upsert_user(user_id, "warns = warns + excluded.warns", warns=count)
+            self._log_warn(user_id, count, moderator_id, reason, decay_at)
+        return row["warns"]
 
 
+
+    def remove_warn(self,
+                    user_id: int,
+                    count: int = 1,
+                    moderator_id: Optional[int] = None,
+                    reason: Optional[str] = None) -> int:
+        """Убирает предупреждения у пользователя. Возвращает новое количество"""
+        with self.transaction():
+            old = self._warns(user_id)
+            row = self._upsert_user(user_id, "warns = MAX(0, warns - ?)", (count,))
+            self._log_warn(user_id, row["warns"] - old, moderator_id, reason)
+            self._consume_decays(user_id, old - row["warns"])
+        return row["warns"]
+
+
+
+    def clear_warns(self,
+                    user_id: int,
+                    moderator_id: Optional[int] = None,
+                    reason: Optional[str] = None) -> None:
+        """Очищает все предупреждения пользователя"""
+        with self.transaction():
+            old = self._warns(user_id)
+            self._upsert_user(user_id, "warns = 0")
+            self._log_warn(user_id, -old, moderator_id, reason)
+            # Очищенные предупреждения больше не истекают
+            self.cursor.execute(
+                "UPDATE warn_events SET decay_at = NULL, decay_left = 0 WHERE user_id = ? AND decay_at IS NOT NULL",
+                (user_id,)
+            )
+
+
+
+    def _warns(self, user_id: int) -> int:
+        self.cursor.execute("SELECT warns FROM users WHERE user_id = ?", (user_id,))
+        row = self.cursor.fetchone()
+        return int(row["warns"] or 0) if row else 0
+
+
+
+    def decay_warns(self, now: int) -> int:
+        """Снимает предупреждения, срок которых истёк к now (не ниже нуля), одной транзакцией.
+        Возвращает количество снятых предупреждений"""
+        with self.transaction():
+            self.cursor.execute(
+                "SELECT id, user_id, decay_left FROM warn_events WHERE decay_at <= ?",
+                (now,)
+            )
+            # Истекает только то, что ещё не снято вручную (decay_left)
+            due: Dict[int, int] = {}
+            ids: List[int] = []
+            for r in self.cursor.fetchall():
+                due[int(r["user_id"])] = due.get(int(r["user_id"]), 0) + int(r["decay_left"])
+                ids.append(int(r["id"]))
+            if not ids:
+                return 0
+
+            self.cursor.executemany("UPDATE warn_events SET decay_at = NULL, decay_left = 0 WHERE id = ?",
+                                    [(i,) for i in ids])
+            removed = 0
+            for user_id, count in due.items():
+                old = self._warns(user_id)
+                delta = -min(count, old)
+                if delta:
+                    self.cursor.execute("UPDATE users SET warns = warns + ? WHERE user_id = ?", (delta, user_id))
+                    self._log_warn(user_id, delta, None, "Истёк срок предупреждения")
+                    removed -= delta
+            self._invalidate(*(("user", uid) for uid in due))
+        return removed
+
+
+
+    @reader
+    def warn_history(self,
+                     user_id: int,
+                     limit: int = 10,
+                     before: Optional[tuple] = None) -> List[Dict[str, Any]]:
+        """Журнал предупреждений пользователя, от новых к старым
+
+        Постранично по ключу (ts, id): before — (ts, id) последней записи
+        предыдущей страницы, поэтому страница стоит O(limit) при любой глубине.
+        """
+        if before is None:
+            self.cursor.execute(
+                "SELECT id, user_id, moderator_id, delta, reason, ts, decay_at FROM warn_events "
+                "WHERE user_id = ? ORDER BY ts DESC, id DESC LIMIT ?",
+                (user_id, limit)
+            )
+        else:
+            ts, event_id = before
+            self.cursor.execute(
+                "SELECT id, user_id, moderator_id, delta, reason, ts, decay_at FROM warn_events "
+                "WHERE user_id = ? AND (ts < ? OR (ts = ? AND id < ?)) ORDER BY ts DESC, id DESC LIMIT ?",
+                (user_id, ts, ts, event_id, limit)
+            )
+        return [dict(r) for r in self.cursor.fetchall()]
+
+
+
+    @reader
     def get_leaderboard(self, limit: int = 10) -> List[Dict[str, Any]]:
-        """Получает топ пользователей по сообщениям"""
-        self.cursor.execute(
-            "SELECT user_id, messages, warns FROM users ORDER BY messages DESC LIMIT ?",
-            (limit,)
-        )
-        return [dict(row) for row in self.cursor.fetchall()]
+        """Получает топ пользователей по сообщениям (с учётом несброшенных сообщений)"""
+        with self.messages.lock:
+            pending = self.messages.pending()
+            # Пользователи с дельтами могут только подняться в топе, поэтому
+            # берём из БД с запасом на их количество и досчитываем их отдельно
+            self.cursor.execute(
+                "SELECT user_id, messages, warns FROM users ORDER BY messages DESC LIMIT ?",
+                (limit + len(pending),)
+            )
+            rows = {int(r["user_id"]): dict(r) for r in self.cursor.fetchall()}
+
+            missing = [uid for uid in pending if uid not in rows]
+            if missing:
+                placeholders = ",".join(["?"] * len(missing))
+                self.cursor.execute(
+                    f"SELECT user_id, messages, warns FROM users WHERE user_id IN ({placeholders})",
+                    missing
+                )
+                rows.update({int(r["user_id"]): dict(r) for r in self.cursor.fetchall()})
 
+        for uid, delta in pending.items():
+            row = rows.setdefault(uid, {"user_id": uid, "messages": 0, "warns": 0})
+            row["messages"] += delta
 
+        return sorted(rows.values(), key=lambda r: -int(r["messages"]))[:limit]
 
+
+
+    @reader
     def get_birthday_users_by_date(self, date_str: str) -> List[Dict[str, Any]]:
         """Получает список пользователей с днем рождения в указанную дату (формат DD.MM)"""
         self.cursor.execute(
             "SELECT user_id, birthday, messages, warns FROM users WHERE birthday = ?",
             (date_str,)
         )
-        return [dict(row) for row in self.cursor.fetchall()]
+        return self._merge_pending([dict(row) for row in self.cursor.fetchall()])
 
+    @reader
     def get_all_users_with_birthday(self) -> List[Dict[str, Any]]:
         """Получает всех пользователей, у которых установлен день рождения"""
         self.cursor.execute(
-            "SELECT user_id, birthday, messages, warns FROM users WHERE birthday IS NOT NULL AND birthday != ''"
+            # birthday > '' — то же, что IS NOT NULL AND != '', но по индексу
+            "SELECT user_id, birthday, messages, warns FROM users WHERE birthday > ''"
         )
-        return [dict(row) for row in self.cursor.fetchall()]
+        return self._merge_pending([dict(row) for row in self.cursor.fetchall()])
 
     def update_birthday(self, user_id: int, birthday: str) -> bool:
         """Обновляет день рождения пользователя. Возвращает True если успешно"""
         try:
-            self.add_user(user_id)  # Создаем пользователя если его нет
-            self.cursor.execute(
-                "UPDATE users SET birthday = ? WHERE user_id = ?",
-                (birthday, user_id)
-            )
-            self.commit()
+            self._upsert_user(user_id, "birthday = excluded.birthday", birthday=birthday)
             return True
         except Exception:
             return False
 
     def remove_birthday(self, user_id: int) -> None:
         """Удаляет день рождения у пользователя"""
-        self.add_user(user_id)
-        self.cursor.execute(
-            "UPDATE users SET birthday = NULL WHERE user_id = ?",
-            (user_id,)
-        )
-        self.commit()
+        self._upsert_user(user_id, "birthday = NULL")
 
 
 
 class Events(DB):
-    """Работа с таблицей events (Ивенты)"""
+    """Работа с таблицами events и event_participants (Ивенты)"""
+
+    DB_PATH = os.path.abspath("src/data/db/events.db")
 
-    def __init__(self) -> None:
-        super().__init__(os.path.abspath("src/data/db/events.db"))
+    INDEXES = {
+        "idx_events_status_ts": "events(status, ts)",
+        "idx_events_ts": "events(ts)",
+    }
 
+    cache = LRUCache("events")
 
+    # Напоминание участникам: дедлайн ("event_remind", message_id) за столько секунд до начала.
+    # С этого же момента статус в embed — «Начинается»
+    REMIND_BEFORE = 5 * 60
+
+    # Колонки events, отдаваемые наружу (participants — список id из event_participants)
+    _COLUMNS = "message_id, title, description, max_participants, status, ts"
+
+    def __init__(self, readonly: bool = False) -> None:
+        super().__init__(self.DB_PATH, readonly)
+
+
+
+    # ts — начало ивента, UTC epoch (сек)
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS {name} (
+            message_id BIGINT PRIMARY KEY,
+            title TEXT NOT NULL,
+            description TEXT,
+            max_participants INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            ts INTEGER NOT NULL
+        );
+    """
 
     def _init_tables(self) -> None:
+        self.cursor.execute(self._SCHEMA.format(name="events"))
         self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS events (
-                message_id BIGINT PRIMARY KEY,
-                title TEXT NOT NULL,
-                description TEXT,
-                participants TEXT DEFAULT '',
-                max_participants INTEGER NOT NULL,
-                status TEXT NOT NULL,
-                ts TEXT NOT NULL
+            CREATE TABLE IF NOT EXISTS event_participants (
+                message_id BIGINT NOT NULL,
+                user_id BIGINT NOT NULL,
+                joined_ts INTEGER NOT NULL,
+                PRIMARY KEY (message_id, user_id)
             );
         """)
+
+        # Миграции старой схемы: CSV-колонка participants и ts в ISO-строках
+        cols = self._columns("events")
+        if "participants" in cols:
+            self._migrate_participants()
+        if "participants" in cols or cols.get("ts") != "INTEGER":
+            self._rebuild_table("events", self._SCHEMA,
+                                ["message_id", "title", "description", "max_participants", "status", "ts"],
+                                {"ts": self._to_epoch})
         self.commit()
 
 
 
-    def add_event(self, message_id: int, 
-                  title: str, 
-                  description: str, 
-                  participants: str, 
-                  max_participants: int, 
+    def _migrate_participants(self) -> None:
+        """Переносит участников из CSV-колонки events.participants в event_participants"""
+        self.cursor.execute(
+            "SELECT message_id, participants FROM events WHERE participants IS NOT NULL AND participants != ''"
+        )
+        rows = self.cursor.fetchall()
+        if not rows:
+            return
+
+        now = int(time.time())
+        # Порядок вступления сохраняется порядком вставки (rowid)
+        pairs = [(int(r["message_id"]), int(p), now)
+                 for r in rows
+                 for p in r["participants"].split(",") if p]
+        self.cursor.executemany(
+            "INSERT OR IGNORE INTO event_participants (message_id, user_id, joined_ts) VALUES (?, ?, ?)",
+            pairs
+        )
+
+
+
+    def _attach_participants(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Добавляет к ивентам поле participants (список user_id по порядку вступления) одним запросом"""
+        if not rows:
+            return rows
+        by_id = {int(r["message_id"]): r for r in rows}
+        for r in rows:
+            r["participants"] = []
+
+        placeholders = ",".join(["?"] * len(by_id))
+        self.cursor.execute(
+            f"SELECT message_id, user_id FROM event_participants WHERE message_id IN ({placeholders}) "
+            "ORDER BY joined_ts, rowid",
+            list(by_id)
+        )
+        for p in self.cursor.fetchall():
+            by_id[int(p["message_id"])]["participants"].append(int(p["user_id"]))
+        return rows
+
+
+
+    def add_event(self, message_id: int,
+                  title: str,
+                  description: str,
+                  max_participants: int,
                   status: str,
-                  ts: str) -> None:
-        """Добавляет ивент"""
+                  ts: int) -> None:
+        """Добавляет ивент (ts — начало, UTC epoch)"""
         self.cursor.execute(
-            "INSERT INTO events (message_id, title, description, participants, max_participants, status, ts) VALUES (?, ?, ?, ?, ?, ?, ?)",
-            (message_id, title, description, participants, max_participants, status, ts)
+            "INSERT INTO events (message_id, title, description, max_participants, status, ts) VALUES (?, ?, ?, ?, ?, ?)",
+            (message_id, title, description, max_participants, status, ts)
         )
         self.commit()
+        self._invalidate(("event", message_id))
+        self._schedule_deadlines(message_id, status, ts)
 
 
 
+    @reader
     def get_event(self, message_id: int) -> Optional[Dict[str, Any]]:
-        """Получает ивент по message_id"""
+        """Получает ивент по message_id (вместе со списком участников)"""
+        return self._cached(("event", message_id), lambda: self._load_event(message_id))
+
+
+
+    def _load_event(self, message_id: int) -> Optional[Dict[str, Any]]:
         self.cursor.execute(
-            "SELECT message_id, title, description, participants, max_participants, status, ts FROM events WHERE message_id = ?",
+            f"SELECT {self._COLUMNS} FROM events WHERE message_id = ?",
             (message_id,)
         )
         row = self.cursor.fetchone()
-        return dict(row) if row else None
+        return self._attach_participants([dict(row)])[0] if row else None
 
 
 
-    def update_event(self, message_id: int, title: str, description: str, participants: str, max_participants: int, status: str, ts: str) -> None:
-        """Полное обновление ивента"""
+    def update_event(self, message_id: int, title: str, description: str, max_participants: int, status: str, ts: int) -> None:
+        """Полное обновление ивента (без участников)"""
         self.cursor.execute(
-            "UPDATE events SET title = ?, description = ?, participants = ?, max_participants = ?, status = ?, ts = ? WHERE message_id = ?",
-            (title, description, participants, max_participants, status, ts, message_id)
+            "UPDATE events SET title = ?, description = ?, max_participants = ?, status = ?, ts = ? WHERE message_id = ?",
+            (title, description, max_participants, status, ts, message_id)
         )
         self.commit()
+        self._invalidate(("event", message_id))
+        self._schedule_deadlines(message_id, status, ts)
+
+
+
+    @classmethod
+    def next_transition(cls, ts: int, now: float) -> Optional[int]:
+        """Ближайший момент смены статуса в embed («Скоро» → «Начинается» → «Идёт»), None — смен больше нет"""
+        for moment in (ts - cls.REMIND_BEFORE, ts):
+            if now < moment:
+                return moment
+        return None
+
+
+
+    def _schedule_deadlines(self, message_id: int, status: str, ts: int) -> None:
+        # Напоминание нужно только ещё не уведомлённым ивентам
+        self._deadline(("event_remind", message_id),
+                       ts - self.REMIND_BEFORE if status == "planned" else None)
+        # Embed обновляется только в моменты смены статуса
+        self._deadline(("event_embed", message_id),
+                       self.next_transition(ts, time.time()) if status != "finished" else None)
 
 
 
+    @reader
     def list_events(self, limit: int = 50) -> List[Dict[str, Any]]:
         """Возвращает список ивентов (по времени начала)"""
         self.cursor.execute(
-            "SELECT message_id, title, description, participants, max_participants, status, ts FROM events ORDER BY ts ASC LIMIT ?",
+            f"SELECT {self._COLUMNS} FROM events ORDER BY ts ASC LIMIT ?",
             (limit,)
         )
-        return [dict(r) for r in self.cursor.fetchall()]
+        return self._attach_participants([dict(r) for r in self.cursor.fetchall()])
+
+
+
+    @reader
+    def list_events_between(self, from_ts: int, to_ts: int) -> List[Dict[str, Any]]:
+        """Ивенты, начинающиеся в интервале [from_ts, to_ts] (UTC epoch)"""
+        self.cursor.execute(
+            f"SELECT {self._COLUMNS} FROM events WHERE ts >= ? AND ts <= ? ORDER BY ts ASC",
+            (from_ts, to_ts)
+        )
+        return self._attach_participants([dict(r) for r in self.cursor.fetchall()])
 
 
 
@@ -293,67 +889,113 @@ class Events(DB):
             (status, message_id)
         )
         self.commit()
+        self._invalidate(("event", message_id))
+        if status != "planned":
+            self._deadline(("event_remind", message_id), None)
+        if status == "finished":
+            self._deadline(("event_embed", message_id), None)
 
 
 
-    def _get_participants_list(self, participants: str) -> List[int]:
-        if not participants:
-            return []
-        return [int(p) for p in participants.split(",") if p]
+    @reader
+    def list_participants(self, message_id: int) -> List[int]:
+        """user_id участников по порядку вступления"""
+        self.cursor.execute(
+            "SELECT user_id FROM event_participants WHERE message_id = ? ORDER BY joined_ts, rowid",
+            (message_id,)
+        )
+        return [int(r["user_id"]) for r in self.cursor.fetchall()]
+
+
+
+    @reader
+    def is_participant(self, message_id: int, user_id: int) -> bool:
+        self.cursor.execute(
+            "SELECT 1 FROM event_participants WHERE message_id = ? AND user_id = ?",
+            (message_id, user_id)
+        )
+        return self.cursor.fetchone() is not None
+
+
+
+    def _count_participants(self, message_id: int) -> int:
+        self.cursor.execute(
+            "SELECT COUNT(*) AS c FROM event_participants WHERE message_id = ?",
+            (message_id,)
+        )
+        return int(self.cursor.fetchone()["c"])
 
 
 
     def add_participant(self, message_id: int, user_id: int) -> tuple[bool, int, int]:
         """Добавляет участника. Возвращает (успех, текущее_кол-во, максимум)"""
-        event = self.get_event(message_id)
-        if not event:
+        self.cursor.execute(
+            "SELECT max_participants FROM events WHERE message_id = ?",
+            (message_id,)
+        )
+        row = self.cursor.fetchone()
+        if not row:
             return (False, 0, 0)
+        mx = int(row["max_participants"])
 
-        participants_list = self._get_participants_list(event["participants"])
-        if user_id in participants_list:
-            return (True, len(participants_list), int(event["max_participants"]))
-
-        if len(participants_list) >= int(event["max_participants"]):
-            return (False, len(participants_list), int(event["max_participants"]))
-
-        participants_list.append(user_id)
-        new_value = ",".join(str(p) for p in participants_list)
+        # Проверка лимита и вставка — один атомарный запрос по первичному ключу
         self.cursor.execute(
-            "UPDATE events SET participants = ? WHERE message_id = ?",
-            (new_value, message_id)
+            "INSERT OR IGNORE INTO event_participants (message_id, user_id, joined_ts) "
+            "SELECT ?, ?, ? WHERE (SELECT COUNT(*) FROM event_participants WHERE message_id = ?) "
+            "< (SELECT max_participants FROM events WHERE message_id = ?)",
+            (message_id, user_id, int(time.time()), message_id, message_id)
         )
+        inserted = self.cursor.rowcount == 1
         self.commit()
-        return (True, len(participants_list), int(event["max_participants"]))
+        if inserted:
+            self._invalidate(("event", message_id))
+
+        cur = self._count_participants(message_id)
+        if inserted:
+            return (True, cur, mx)
+        # Не вставили: либо уже участник (успех), либо лимит
+        return (self.is_participant(message_id, user_id), cur, mx)
 
 
 
     def remove_participant(self, message_id: int, user_id: int) -> tuple[bool, int, int]:
         """Удаляет участника. Возвращает (успех, текущее_кол-во, максимум)"""
-        event = self.get_event(message_id)
-        if not event:
+        self.cursor.execute(
+            "SELECT max_participants FROM events WHERE message_id = ?",
+            (message_id,)
+        )
+        row = self.cursor.fetchone()
+        if not row:
             return (False, 0, 0)
 
-        participants_list = self._get_participants_list(event["participants"])
-        if user_id not in participants_list:
-            return (True, len(participants_list), int(event["max_participants"]))
-
-        participants_list = [p for p in participants_list if p != user_id]
-        new_value = ",".join(str(p) for p in participants_list)
         self.cursor.execute(
-            "UPDATE events SET participants = ? WHERE message_id = ?",
-            (new_value, message_id)
+            "DELETE FROM event_participants WHERE message_id = ? AND user_id = ?",
+            (message_id, user_id)
         )
         self.commit()
-        return (True, len(participants_list), int(event["max_participants"]))
+        self._invalidate(("event", message_id))
+        return (True, self._count_participants(message_id), int(row["max_participants"]))
 
 
 
-    def list_need_notification(self, from_iso: str, to_iso: str) -> List[Dict[str, Any]]:
-        """Ивенты со статусом 'planned', начинающиеся в интервале [from_iso, to_iso]"""
+    @reader
+    def list_need_notification(self, from_ts: int, to_ts: int) -> List[Dict[str, Any]]:
+        """Ивенты со статусом 'planned', начинающиеся в интервале [from_ts, to_ts] (UTC epoch)"""
         self.cursor.execute(
-            "SELECT message_id, title, description, participants, max_participants, status, ts FROM events "
+            f"SELECT {self._COLUMNS} FROM events "
             "WHERE status = 'planned' AND ts >= ? AND ts <= ?",
-            (from_iso, to_iso)
+            (from_ts, to_ts)
+        )
+        return self._attach_participants([dict(r) for r in self.cursor.fetchall()])
+
+
+
+    @reader
+    def list_planned(self, from_ts: int) -> List[Dict[str, Any]]:
+        """Ивенты со статусом 'planned', начинающиеся не раньше from_ts (без участников)"""
+        self.cursor.execute(
+            f"SELECT {self._COLUMNS} FROM events WHERE status = 'planned' AND ts >= ?",
+            (from_ts,)
         )
         return [dict(r) for r in self.cursor.fetchall()]
 
@@ -362,24 +1004,41 @@ class Events(DB):
 class MoviePolls(DB):
     """Работа с таблицами голосований за фильм"""
 
-    def __init__(self) -> None:
-        super().__init__(os.path.abspath("src/data/db/events.db"))
+    DB_PATH = os.path.abspath("src/data/db/events.db")
+
+    INDEXES = {
+        "idx_movie_polls_status_end": "movie_polls(status, ts_end)",
+        "idx_movie_polls_status_created": "movie_polls(status, created_ts)",
+        "idx_movie_options_poll": "movie_options(poll_message_id)",
+        "idx_movie_votes_poll_option": "movie_votes(poll_message_id, option_id)",
+    }
+
+    # Ключи: ("poll", id), ("options", id)
+    cache = LRUCache("movie_polls")
+
+    # Общие для всех экземпляров счётчики голосов: меняются дельтами в upsert_vote,
+    # таблица movie_votes агрегируется только при первой загрузке опроса
+    tallies = VoteTally()
+
+    def __init__(self, readonly: bool = False) -> None:
+        super().__init__(self.DB_PATH, readonly)
+
 
+    # ts_end / created_ts — UTC epoch (сек)
+    _POLLS_SCHEMA = """
+        CREATE TABLE IF NOT EXISTS {name} (
+            message_id BIGINT PRIMARY KEY,
+            title TEXT NOT NULL,
+            description TEXT,
+            status TEXT NOT NULL,
+            ts_end INTEGER NOT NULL,
+            created_ts INTEGER NOT NULL
+        );
+    """
 
     def _init_tables(self) -> None:
         # Таблица опросов по фильмам
-        self.cursor.execute(
-            """
-            CREATE TABLE IF NOT EXISTS movie_polls (
-                message_id BIGINT PRIMARY KEY,
-                title TEXT NOT NULL,
-                description TEXT,
-                status TEXT NOT NULL,
-                ts_end TEXT NOT NULL,
-                created_ts TEXT NOT NULL
-            );
-            """
-        )
+        self.cursor.execute(self._POLLS_SCHEMA.format(name="movie_polls"))
         # Варианты фильмов
         self.cursor.execute(
             """
@@ -406,6 +1065,13 @@ class MoviePolls(DB):
             );
             """
         )
+
+        # Миграция старой схемы: времена в ISO-строках
+        cols = self._columns("movie_polls")
+        if cols.get("ts_end") != "INTEGER" or cols.get("created_ts") != "INTEGER":
+            self._rebuild_table("movie_polls", self._POLLS_SCHEMA,
+                                ["message_id", "title", "description", "status", "ts_end", "created_ts"],
+                                {"ts_end": self._to_epoch, "created_ts": self._to_epoch})
         self.commit()
 
 
@@ -414,16 +1080,24 @@ class MoviePolls(DB):
                  message_id: int,
                  title: str,
                  description: str,
-                 ts_end: str,
+                 ts_end: int,
                  status: str = "open") -> None:
-        created_ts = datetime.now(self.MSK).isoformat()
+        """Добавляет опрос (ts_end — окончание, UTC epoch)"""
+        created_ts = int(time.time())
         self.cursor.execute(
             "INSERT INTO movie_polls(message_id, title, description, status, ts_end, created_ts) VALUES (?, ?, ?, ?, ?, ?)",
             (message_id, title, description, status, ts_end, created_ts)
         )
         self.commit()
+        self._invalidate(("poll", message_id))
+        if status == "open":
+            self._deadline(("poll_close", message_id), ts_end)
 
+    @reader
     def get_poll(self, message_id: int) -> Optional[Dict[str, Any]]:
+        return self._cached(("poll", message_id), lambda: self._load_poll(message_id))
+
+    def _load_poll(self, message_id: int) -> Optional[Dict[str, Any]]:
         self.cursor.execute(
             "SELECT message_id, title, description, status, ts_end, created_ts FROM movie_polls WHERE message_id = ?",
             (message_id,)
@@ -437,7 +1111,11 @@ class MoviePolls(DB):
             (status, message_id)
         )
         self.commit()
+        self._invalidate(("poll", message_id))
+        if status != "open":
+            self._deadline(("poll_close", message_id), None)
 
+    @reader
     def get_latest_open_poll(self) -> Optional[Dict[str, Any]]:
         self.cursor.execute(
             "SELECT message_id, title, description, status, ts_end, created_ts FROM movie_polls WHERE status = 'open' ORDER BY created_ts DESC LIMIT 1"
@@ -445,18 +1123,28 @@ class MoviePolls(DB):
         row = self.cursor.fetchone()
         return dict(row) if row else None
 
-    def list_polls_to_close(self, from_iso: str, to_iso: str) -> List[Dict[str, Any]]:
+    @reader
+    def list_polls_to_close(self, from_ts: int, to_ts: int) -> List[Dict[str, Any]]:
         self.cursor.execute(
             "SELECT message_id, title, description, status, ts_end, created_ts FROM movie_polls WHERE status = 'open' AND ts_end >= ? AND ts_end <= ?",
-            (from_iso, to_iso)
+            (from_ts, to_ts)
+        )
+        return [dict(r) for r in self.cursor.fetchall()]
+
+    @reader
+    def list_open_polls(self) -> List[Dict[str, Any]]:
+        """Все открытые опросы (для загрузки дедлайнов при старте)"""
+        self.cursor.execute(
+            "SELECT message_id, title, description, status, ts_end, created_ts FROM movie_polls WHERE status = 'open'"
         )
         return [dict(r) for r in self.cursor.fetchall()]
 
-    def list_polls_overdue(self, to_iso: str) -> List[Dict[str, Any]]:
-        """Открытые опросы, у которых срок окончания уже наступил (ts_end <= to_iso)."""
+    @reader
+    def list_polls_overdue(self, to_ts: int) -> List[Dict[str, Any]]:
+        """Открытые опросы, у которых срок окончания уже наступил (ts_end <= to_ts, UTC epoch)."""
         self.cursor.execute(
             "SELECT message_id, title, description, status, ts_end, created_ts FROM movie_polls WHERE status = 'open' AND ts_end <= ?",
-            (to_iso,)
+            (to_ts,)
         )
         return [dict(r) for r in self.cursor.fetchall()]
 
@@ -468,11 +1156,16 @@ class MoviePolls(DB):
             (poll_message_id, title, link, author_id)
         )
         self.commit()
+        self._invalidate(("options", poll_message_id))
         self.cursor.execute("SELECT last_insert_rowid() AS id")
         row = self.cursor.fetchone()
         return int(row["id"]) if row else 0
 
+    @reader
     def list_options(self, poll_message_id: int) -> List[Dict[str, Any]]:
+        return self._cached(("options", poll_message_id), lambda: self._load_options(poll_message_id))
+
+    def _load_options(self, poll_message_id: int) -> List[Dict[str, Any]]:
         self.cursor.execute(
             "SELECT id, poll_message_id, title, link, author_id FROM movie_options WHERE poll_message_id = ? ORDER BY id ASC",
             (poll_message_id,)
@@ -481,18 +1174,34 @@ class MoviePolls(DB):
 
 
     # --- Votes ---
+    def _update_tally(self, poll_message_id: int, apply: Callable[[], None]) -> None:
+        """Применяет дельту к счётчикам голосов после записи
+
+        Внутри transaction() запись ещё может откатиться, поэтому вместо дельты
+        счётчики опроса сбрасываются после завершения транзакции.
+        """
+        if self.in_transaction():
+            self._after_transaction(lambda: self.tallies.drop(poll_message_id))
+        else:
+            apply()
+
     def upsert_vote(self, poll_message_id: int, user_id: int, option_id: int) -> None:
-        self.cursor.execute(
-            """
-            INSERT INTO movie_votes(poll_message_id, user_id, option_id)
-            VALUES (?, ?, ?)
-            ON CONFLICT(poll_message_id, user_id)
-            DO UPDATE SET option_id = excluded.option_id
-            """,
-            (poll_message_id, user_id, option_id)
-        )
-        self.commit()
+        with self.tallies.lock:
+            # Прежний голос нужен, чтобы снять его с варианта в счётчиках
+            old = self.get_user_vote(poll_message_id, user_id)
+            self.cursor.execute(
+                """
+                INSERT INTO movie_votes(poll_message_id, user_id, option_id)
+                VALUES (?, ?, ?)
+                ON CONFLICT(poll_message_id, user_id)
+                DO UPDATE SET option_id = excluded.option_id
+                """,
+                (poll_message_id, user_id, option_id)
+            )
+            self.commit()
+            self._update_tally(poll_message_id, lambda: self.tallies.move(poll_message_id, old, option_id))
 
+    @reader
     def get_user_vote(self, poll_message_id: int, user_id: int) -> Optional[int]:
         self.cursor.execute(
             "SELECT option_id FROM movie_votes WHERE poll_message_id = ? AND user_id = ?",
@@ -501,7 +1210,16 @@ class MoviePolls(DB):
         row = self.cursor.fetchone()
         return int(row["option_id"]) if row else None
 
+    @reader
     def count_votes_by_option(self, poll_message_id: int) -> Dict[int, int]:
+        """Голоса по вариантам {option_id: votes} (из счётчиков в памяти)"""
+        poll = self.get_poll(poll_message_id)
+        # Голоса закрытого опроса уже не меняются — их не держим в памяти
+        if poll is not None and poll["status"] != "open":
+            return self._load_votes(poll_message_id)
+        return self.tallies.get_or_load(poll_message_id, lambda: self._load_votes(poll_message_id))
+
+    def _load_votes(self, poll_message_id: int) -> Dict[int, int]:
         self.cursor.execute(
             "SELECT option_id, COUNT(*) AS c FROM movie_votes WHERE poll_message_id = ? GROUP BY option_id",
             (poll_message_id,)
@@ -509,6 +1227,7 @@ class MoviePolls(DB):
         rows = self.cursor.fetchall()
         return {int(r["option_id"]): int(r["c"]) for r in rows}
 
+    @reader
     def pick_winner(self, poll_message_id: int) -> Optional[Dict[str, Any]]:
         """Возвращает вариант-победитель (dict movie_options.*)"""
         counts = self.count_votes_by_option(poll_message_id)
@@ -524,6 +1243,7 @@ class MoviePolls(DB):
         return winner
 
     # --- Runoff helpers ---
+    @reader
     def top_tied_options(self, poll_message_id: int) -> Optional[List[Dict[str, Any]]]:
         """Возвращает все варианты, которые разделяют максимум голосов (>=2 варианта и >0 голосов)."""
         counts = self.count_votes_by_option(poll_message_id)
@@ -545,23 +1265,466 @@ class MoviePolls(DB):
         return [id_to_opt[oid] for oid in sorted(tied_ids)]
 
     def reset_votes(self, poll_message_id: int) -> None:
+        with self.tallies.lock:
+            self.cursor.execute(
+                "DELETE FROM movie_votes WHERE poll_message_id = ?",
+                (poll_message_id,)
+            )
+            self.commit()
+            self._update_tally(poll_message_id, lambda: self.tallies.reset(poll_message_id))
+
+    def keep_only_options(self, poll_message_id: int, option_ids: list[int]) -> None:
+        """Удаляет все варианты, кроме option_ids, вместе с голосами за них"""
+        placeholders = ",".join(["?"] * len(option_ids))
+        with self.tallies.lock:
+            self.cursor.execute(
+                f"DELETE FROM movie_options WHERE poll_message_id = ? AND id NOT IN ({placeholders})",
+                (poll_message_id, *option_ids)
+            )
+            self.cursor.execute(
+                f"DELETE FROM movie_votes WHERE poll_message_id = ? AND option_id NOT IN ({placeholders})",
+                (poll_message_id, *option_ids)
+            )
+            self.commit()
+            self._update_tally(poll_message_id, lambda: self.tallies.keep_only(poll_message_id, option_ids))
+        self._invalidate(("options", poll_message_id))
+
+    def set_poll_end(self, poll_message_id: int, new_end_ts: int) -> None:
         self.cursor.execute(
-            "DELETE FROM movie_votes WHERE poll_message_id = ?",
-            (poll_message_id,)
+            "UPDATE movie_polls SET ts_end = ?, status = 'open' WHERE message_id = ?",
+            (new_end_ts, poll_message_id)
         )
         self.commit()
+        self._invalidate(("poll", poll_message_id))
+        self._deadline(("poll_close", poll_message_id), new_end_ts)
+
+
+    # --- Многошаговые операции (одна транзакция) ---
+    def start_runoff(self, poll_message_id: int, option_ids: list[int], new_end_ts: int) -> None:
+        """Доголосование: оставляет только option_ids, сбрасывает голоса и продлевает опрос"""
+        with self.transaction():
+            self.keep_only_options(poll_message_id, option_ids)
+            self.reset_votes(poll_message_id)
+            self.set_poll_end(poll_message_id, new_end_ts)
+
+    def close_poll(self, poll_message_id: int) -> Optional[Dict[str, Any]]:
+        """Определяет победителя и закрывает опрос. Возвращает победителя (см. pick_winner)"""
+        with self.transaction():
+            winner = self.pick_winner(poll_message_id)
+            self.set_poll_status(poll_message_id, "closed")
+        self.tallies.drop(poll_message_id)
+        return winner
 
-    def keep_only_options(self, poll_message_id: int, option_ids: list[int]) -> None:
-        placeholders = ",".join(["?"] * len(option_ids))
+
+
+
+class Jobs(DB):
+    """Работа с таблицей jobs (отложенные задачи с гарантией выполнения)
+
+    Задача — строка с уникальным ключом идемпотентности key: повторная
+    постановка того же key ничего не меняет, поэтому перезапуск или два
+    экземпляра бота не создают дублей. ref — логический объект задачи
+    ("poll_close:123"): у одного ref может быть только одна ожидающая задача.
+
+    Состояния: pending → running → done | failed | expired | cancelled
+    """
+
+    DB_PATH = os.path.abspath("src/data/db/jobs.db")
+
+    INDEXES = {
+        "idx_jobs_state_due": "jobs(state, due_at)",
+        "idx_jobs_ref_state": "jobs(ref, state)",
+    }
+
+    # Колонки, отдаваемые наружу (payload — уже разобранный JSON)
+    _COLUMNS = "id, key, kind, ref, payload, due_at, expires_at, state, attempts, last_error"
+
+    def __init__(self, readonly: bool = False) -> None:
+        super().__init__(self.DB_PATH, readonly)
+
+
+
+    def _init_tables(self) -> None:
+        # due_at / expires_at / updated_ts — UTC epoch (сек)
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                key TEXT NOT NULL UNIQUE,
+                kind TEXT NOT NULL,
+                ref TEXT NOT NULL,
+                payload TEXT NOT NULL DEFAULT '{}',
+                due_at INTEGER NOT NULL,
+                expires_at INTEGER,
+                state TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                updated_ts INTEGER NOT NULL
+            );
+        """)
+        self.commit()
+
+
+
+    def _row(self, row: Optional[sqlite3.Row]) -> Optional[Dict[str, Any]]:
+        if not row:
+            return None
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"] or "{}")
+        return job
+
+
+
+    def enqueue(self,
+                key: str,
+                kind: str,
+                ref: str,
+                payload: Dict[str, Any],
+                due_at: int,
+                expires_at: Optional[int] = None) -> bool:
+        """Ставит задачу; ожидающие задачи того же ref с другим key отменяются.
+        Возвращает True, если задача добавлена (False — key уже был в очереди или выполнен)"""
+        now = int(time.time())
+        with self.transaction():
+            self.cursor.execute(
+                "UPDATE jobs SET state = 'cancelled', updated_ts = ? "
+                "WHERE ref = ? AND state = 'pending' AND key != ?",
+                (now, ref, key)
+            )
+            # Отменённую задачу с тем же key можно поставить снова, выполненную — нет
+            self.cursor.execute(
+                "INSERT INTO jobs (key, kind, ref, payload, due_at, expires_at, updated_ts) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET state = 'pending', attempts = 0, updated_ts = excluded.updated_ts "
+                "WHERE state = 'cancelled'",
+                (key, kind, ref, json.dumps(payload), due_at, expires_at, now)
+            )
+            inserted = self.cursor.rowcount == 1
+        return inserted
+
+
+
+    def cancel(self, ref: str) -> int:
+        """Отменяет ожидающие задачи ref. Возвращает их количество"""
         self.cursor.execute(
-            f"DELETE FROM movie_options WHERE poll_message_id = ? AND id NOT IN ({placeholders})",
-            (poll_message_id, *option_ids)
+            "UPDATE jobs SET state = 'cancelled', updated_ts = ? WHERE ref = ? AND state = 'pending'",
+            (int(time.time()), ref)
         )
+        count = self.cursor.rowcount
         self.commit()
+        return count
+
 
-    def set_poll_end(self, poll_message_id: int, new_end_iso: str) -> None:
+
+    def claim(self, ref: str, now: int, stale_before: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """Атомарно берёт наступившую задачу ref в работу (pending → running, attempts + 1).
+        Задача, оставшаяся в running с updated_ts < stale_before (процесс упал), берётся повторно"""
         self.cursor.execute(
-            "UPDATE movie_polls SET ts_end = ?, status = 'open' WHERE message_id = ?",
-            (new_end_iso, poll_message_id)
+            "UPDATE jobs SET state = 'running', attempts = attempts + 1, updated_ts = ? "
+            "WHERE id = (SELECT id FROM jobs WHERE ref = ? AND "
+            "((state = 'pending' AND due_at <= ?) OR (state = 'running' AND updated_ts < ?)) "
+            "ORDER BY due_at LIMIT 1) "
+            f"RETURNING {self._COLUMNS}",
+            (now, ref, now, stale_before if stale_before is not None else -1)
+        )
+        job = self._row(self.cursor.fetchone())
+        self.commit()
+        return job
+
+
+
+    def finish(self, job_id: int, state: str = "done", error: Optional[str] = None) -> None:
+        """Завершает задачу (done / failed / expired)"""
+        self.cursor.execute(
+            "UPDATE jobs SET state = ?, last_error = ?, updated_ts = ? WHERE id = ?",
+            (state, error, int(time.time()), job_id)
         )
-        self.commit()
\ No newline at end of file
+        self.commit()
+
+
+
+    def retry(self, job_id: int, due_at: int, error: str) -> None:
+        """Возвращает задачу в очередь с новым сроком (после неудачной попытки)"""
+        self.cursor.execute(
+            "UPDATE jobs SET state = 'pending', due_at = ?, last_error = ?, updated_ts = ? WHERE id = ?",
+            (due_at, error, int(time.time()), job_id)
+        )
+        self.commit()
+
+
+
+    def reset_running(self, stale_before: int) -> int:
+        """Возвращает в очередь задачи, «зависшие» в running (процесс упал во время выполнения).
+        Свежие running не трогаются: их может выполнять другой экземпляр бота"""
+        self.cursor.execute(
+            "UPDATE jobs SET state = 'pending', updated_ts = ? WHERE state = 'running' AND updated_ts < ?",
+            (int(time.time()), stale_before)
+        )
+        count = self.cursor.rowcount
+        self.commit()
+        return count
+
+
+
+    @reader
+    def list_pending(self, kind: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Ожидающие задачи (по сроку), опционально только вида kind"""
+        if kind is None:
+            self.cursor.execute(
+                f"SELECT {self._COLUMNS} FROM jobs WHERE state = 'pending' ORDER BY due_at"
+            )
+        else:
+            self.cursor.execute(
+                f"SELECT {self._COLUMNS} FROM jobs WHERE state = 'pending' AND kind = ? ORDER BY due_at",
+                (kind,)
+            )
+        return [self._row(r) for r in self.cursor.fetchall()]
+
+
+
+    @reader
+    def list_running(self, kind: str) -> List[Dict[str, Any]]:
+        """Задачи вида kind в running с временем взятия (updated_ts): для повторного claim по истечении аренды"""
+        self.cursor.execute(
+            f"SELECT {self._COLUMNS}, updated_ts FROM jobs WHERE state = 'running' AND kind = ?",
+            (kind,)
+        )
+        return [self._row(r) for r in self.cursor.fetchall()]
+
+
+class RoleJobs(DB):
+    """Работа с таблицами role_jobs и role_job_targets (массовая выдача/снятие ролей)
+
+    Задание хранит роль, действие и список целей со статусом каждой, поэтому
+    прерванное (перезапуск бота) задание продолжается с необработанных целей.
+
+    Статусы цели: pending → done | skipped | forbidden | failed
+    Состояния задания: running → done | cancelled
+    """
+
+    DB_PATH = os.path.abspath("src/data/db/jobs.db")
+
+    INDEXES = {
+        "idx_role_jobs_state": "role_jobs(state)",
+    }
+
+    STATUSES = ("pending", "done", "skipped", "forbidden", "failed")
+
+    def __init__(self, readonly: bool = False) -> None:
+        super().__init__(self.DB_PATH, readonly)
+
+
+
+    def _init_tables(self) -> None:
+        # created_ts / updated_ts — UTC epoch (сек)
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS role_jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                guild_id INTEGER NOT NULL,
+                role_id INTEGER NOT NULL,
+                action TEXT NOT NULL,
+                reason TEXT,
+                author_id INTEGER,
+                state TEXT NOT NULL DEFAULT 'running',
+                created_ts INTEGER NOT NULL,
+                updated_ts INTEGER NOT NULL
+            );
+        """)
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS role_job_targets (
+                job_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                error TEXT,
+                PRIMARY KEY (job_id, user_id),
+                FOREIGN KEY (job_id) REFERENCES role_jobs(id) ON DELETE CASCADE
+            ) WITHOUT ROWID;
+        """)
+        self.commit()
+
+
+
+    def create_job(self,
+                   guild_id: int,
+                   role_id: int,
+                   action: str,
+                   user_ids: List[int],
+                   reason: Optional[str] = None,
+                   author_id: Optional[int] = None) -> int:
+        """Создаёт задание (action: add / remove) со списком целей. Возвращает id задания"""
+        now = int(time.time())
+        with self.transaction():
+            self.cursor.execute(
+                "INSERT INTO role_jobs (guild_id, role_id, action, reason, author_id, created_ts, updated_ts) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (guild_id, role_id, action, reason, author_id, now, now)
+            )
+            job_id = int(self.cursor.lastrowid)
+            self.cursor.executemany(
+                "INSERT OR IGNORE INTO role_job_targets (job_id, user_id) VALUES (?, ?)",
+                [(job_id, int(uid)) for uid in user_ids]
+            )
+        return job_id
+
+
+
+    def set_results(self, job_id: int, results: List[tuple]) -> None:
+        """Записывает статусы целей пачкой: results — [(user_id, status, error), ...]"""
+        with self.transaction():
+            self.cursor.executemany(
+                "UPDATE role_job_targets SET status = ?, error = ? WHERE job_id = ? AND user_id = ?",
+                [(status, error, job_id, int(uid)) for uid, status, error in results]
+            )
+            self.cursor.execute(
+                "UPDATE role_jobs SET updated_ts = ? WHERE id = ?",
+                (int(time.time()), job_id)
+            )
+
+
+
+    def finish_job(self, job_id: int, state: str = "done") -> None:
+        self.cursor.execute(
+            "UPDATE role_jobs SET state = ?, updated_ts = ? WHERE id = ?",
+            (state, int(time.time()), job_id)
+        )
+        self.commit()
+
+
+
+    @reader
+    def get_job(self, job_id: int) -> Optional[Dict[str, Any]]:
+        self.cursor.execute("SELECT * FROM role_jobs WHERE id = ?", (job_id,))
+        row = self.cursor.fetchone()
+        return dict(row) if row else None
+
+
+
+    @reader
+    def list_unfinished(self) -> List[Dict[str, Any]]:
+        """Задания, прерванные до завершения"""
+        self.cursor.execute("SELECT * FROM role_jobs WHERE state = 'running' ORDER BY id")
+        return [dict(r) for r in self.cursor.fetchall()]
+
+
+
+    @reader
+    def list_targets(self, job_id: int, status: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Цели задания, опционально только со статусом status"""
+        if status is None:
+            self.cursor.execute(
+                "SELECT user_id, status, error FROM role_job_targets WHERE job_id = ?",
+                (job_id,)
+            )
+        else:
+            self.cursor.execute(
+                "SELECT user_id, status, error FROM role_job_targets WHERE job_id = ? AND status = ?",
+                (job_id, status)
+            )
+        return [dict(r) for r in self.cursor.fetchall()]
+
+
+
+    @reader
+    def count_by_status(self, job_id: int) -> Dict[str, int]:
+        """{статус: количество целей} (все статусы, включая нулевые)"""
+        self.cursor.execute(
+            "SELECT status, COUNT(*) AS cnt FROM role_job_targets WHERE job_id = ? GROUP BY status",
+            (job_id,)
+        )
+        counts = {s: 0 for s in self.STATUSES}
+        counts.update({r["status"]: int(r["cnt"]) for r in self.cursor.fetchall()})
+        return counts
+
+
+class Mutes(DB):
+    """Работа с таблицей mutes (мьюты на время)
+
+    Строка — активный мьют с временем окончания. Таблица — источник
+    истины: дедлайны в планировщике (ключ ("mute", (guild_id, user_id)))
+    ставятся и снимаются при записи и восстанавливаются из таблицы при
+    старте бота. Бессрочный мьют строки не имеет.
+    """
+
+    DB_PATH = os.path.abspath("src/data/db/users.db")
+
+    INDEXES = {
+        "idx_mutes_expires": "mutes(expires_at)",
+    }
+
+    def __init__(self, readonly: bool = False) -> None:
+        super().__init__(self.DB_PATH, readonly)
+
+
+
+    def _init_tables(self) -> None:
+        # expires_at / created_ts — UTC epoch (сек)
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS mutes (
+                guild_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                role_id INTEGER NOT NULL,
+                expires_at INTEGER NOT NULL,
+                author_id INTEGER,
+                reason TEXT,
+                created_ts INTEGER NOT NULL,
+                PRIMARY KEY (guild_id, user_id)
+            ) WITHOUT ROWID;
+        """)
+        self.commit()
+
+
+
+    def set_mute(self,
+                 guild_id: int,
+                 user_id: int,
+                 role_id: int,
+                 expires_at: int,
+                 author_id: Optional[int] = None,
+                 reason: Optional[str] = None) -> None:
+        """Записывает (или продлевает) мьют до expires_at"""
+        self.cursor.execute(
+            "INSERT INTO mutes (guild_id, user_id, role_id, expires_at, author_id, reason, created_ts) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(guild_id, user_id) DO UPDATE SET role_id = excluded.role_id, "
+            "expires_at = excluded.expires_at, author_id = excluded.author_id, reason = excluded.reason",
+            (guild_id, user_id, role_id, int(expires_at), author_id, reason, int(time.time()))
+        )
+        self.commit()
+        self._deadline(("mute", (guild_id, user_id)), int(expires_at))
+
+
+
+    def remove_mutes(self, keys: List[tuple]) -> int:
+        """Удаляет мьюты пачкой: keys — [(guild_id, user_id), ...]. Возвращает количество удалённых"""
+        with self.transaction():
+            self.cursor.executemany(
+                "DELETE FROM mutes WHERE guild_id = ? AND user_id = ?",
+                [(int(gid), int(uid)) for gid, uid in keys]
+            )
+            count = self.cursor.rowcount
+            for gid, uid in keys:
+                self._deadline(("mute", (int(gid), int(uid))), None)
+        return count
+
+
+
+    @reader
+    def get_mute(self, guild_id: int, user_id: int) -> Optional[Dict[str, Any]]:
+        self.cursor.execute("SELECT * FROM mutes WHERE guild_id = ? AND user_id = ?", (guild_id, user_id))
+        row = self.cursor.fetchone()
+        return dict(row) if row else None
+
+
+
+    @reader
+    def list_expired(self, now: int) -> List[Dict[str, Any]]:
+        """Мьюты, срок которых наступил к now"""
+        self.cursor.execute("SELECT * FROM mutes WHERE expires_at <= ? ORDER BY expires_at", (now,))
+        return [dict(r) for r in self.cursor.fetchall()]
+
+
+
+    @reader
+    def list_active(self, now: int) -> List[Dict[str, Any]]:
+        """Мьюты, срок которых ещё не наступил (по времени окончания)"""
+        self.cursor.execute("SELECT * FROM mutes WHERE expires_at > ? ORDER BY expires_at", (now,))
+        return [dict(r) for r in self.cursor.fetchall()]
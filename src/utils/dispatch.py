@@ -0,0 +1,299 @@
+import asyncio
+import heapq
+import threading
+import time
+
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Set, Tuple
+
+from config import admin
+
+
+# Классы приоритета исходящих запросов (меньше — важнее)
+MODERATION = 0
+REMINDER = 1
+ANNOUNCE = 2
+COSMETIC = 3
+
+PRIORITY_NAMES = {MODERATION: "moderation", REMINDER: "reminder", ANNOUNCE: "announce", COSMETIC: "cosmetic"}
+
+# Результат операции, которую заменила более новая с тем же ключом
+SUPERSEDED = object()
+
+Call = Callable[[], Awaitable[Any]]
+
+
+
+def retry_after(e: Exception, attempt: int) -> float:
+    """Пауза перед повтором после 429: Retry-After ответа или экспоненциальная"""
+    headers = getattr(getattr(e, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return float(2 ** attempt)
+
+
+
+class _Op:
+    __slots__ = ("priority", "seq", "route", "key", "call", "future", "queued_at", "throttled")
+
+    def __init__(self, priority: int, seq: int, route: Optional[Hashable], key: Optional[Hashable],
+                 call: Call, future: asyncio.Future) -> None:
+        self.priority = priority
+        self.seq = seq
+        self.route = route
+        self.key = key
+        self.call = call
+        self.future = future
+        self.queued_at = time.monotonic()
+        self.throttled = False
+
+    def __lt__(self, other: "_Op") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+
+class _Bucket:
+    """Token bucket маршрута: rate запросов за per секунд"""
+
+    def __init__(self, rate: int, per: float) -> None:
+        self.rate = rate
+        self.per = per
+        self.tokens = float(rate)
+        self.ts = time.monotonic()
+
+    def delay(self, now: float) -> float:
+        """Через сколько секунд будет доступен запрос (0 — сейчас)"""
+        self.tokens = min(float(self.rate), self.tokens + (now - self.ts) * self.rate / self.per)
+        self.ts = now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) * self.per / self.rate
+
+    def full(self, now: float) -> bool:
+        return self.delay(now) == 0.0 and self.tokens >= self.rate
+
+
+
+class Dispatcher:
+    """Единая очередь исходящих REST-запросов к Discord
+
+    Сервисы не вызывают channel.send/message.edit/member.ban напрямую, а
+    отдают их сюда: await dispatcher.submit(call, priority, route, key).
+    Одновременно выполняется не больше workers запросов; из очереди первым
+    берётся самый важный (MODERATION > REMINDER > ANNOUNCE > COSMETIC), поэтому
+    поток косметических перерисовок не задерживает /ban или напоминание.
+
+    route — маршрут запроса (например, ("channel", id)): на маршрут вида с
+    лимитом в route_limits действует свой token bucket, и упёршийся в лимит
+    маршрут не держит остальные.
+    key — ключ правки (например, ("edit", message_id)): ещё не начатая правка
+    с тем же ключом заменяется новой (если новая не менее важна), а её
+    вызывающий получает SUPERSEDED.
+
+    Args:
+        workers (int): Максимум одновременно выполняемых запросов
+        route_limits (dict): {вид маршрута: (запросов, за секунд)}, по умолчанию
+            только каналы — 5 сообщений за 5 секунд
+    """
+
+    def __init__(self, workers: int = 4, route_limits: Optional[Dict[str, Tuple[int, float]]] = None) -> None:
+        self.workers = workers
+        self.route_limits = route_limits if route_limits is not None else {"channel": (5, 5.0)}
+
+        self._heap: List[_Op] = []
+        self._keys: Dict[Hashable, _Op] = {}
+        self._buckets: Dict[Hashable, _Bucket] = {}
+        self._seq = 0
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._runner: Optional[asyncio.Task] = None
+        self._running: Set[asyncio.Task] = set()
+
+        self.submitted = 0
+        self.sent = 0
+        self.failed = 0
+        self.coalesced = 0
+        self.throttled = 0
+        # Ожидание в очереди по классам: {priority: [count, total, max]}
+        self._waits: Dict[int, List[float]] = {p: [0, 0.0, 0.0] for p in PRIORITY_NAMES}
+
+
+
+    def _start(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._runner is not None and self._loop is loop:
+            return
+        self._loop = loop
+        self._wake = asyncio.Event()
+        self._slots = asyncio.Semaphore(self.workers)
+        self._runner = loop.create_task(self._run())
+
+
+
+    def submit(self,
+               call: Call,
+               priority: int = COSMETIC,
+               route: Optional[Hashable] = None,
+               key: Optional[Hashable] = None) -> asyncio.Future:
+        """Ставит запрос в очередь (вызывать из event loop). Возвращает future с
+        результатом await call() (или SUPERSEDED, если правку заменила более новая)"""
+        self._start()
+        self.submitted += 1
+
+        pending = self._keys.get(key) if key is not None else None
+        if pending is not None and priority <= pending.priority:
+            # Ещё не отправленная правка устарела: отправим только новую
+            superseded = pending.future
+            pending.call = call
+            pending.future = self._loop.create_future()
+            if not superseded.done():
+                superseded.set_result(SUPERSEDED)
+            if priority < pending.priority:
+                pending.priority = priority
+                heapq.heapify(self._heap)
+            self.coalesced += 1
+            return pending.future
+
+        self._seq += 1
+        op = _Op(priority, self._seq, route, key, call, self._loop.create_future())
+        heapq.heappush(self._heap, op)
+        if key is not None:
+            self._keys[key] = op
+        self._wake.set()
+        return op.future
+
+
+
+    async def send(self, channel: Any, content: Optional[str] = None, priority: int = ANNOUNCE, **kwargs: Any) -> Any:
+        """channel.send(content, **kwargs) через очередь"""
+        return await self.submit(lambda: channel.send(content, **kwargs), priority, ("channel", int(channel.id)))
+
+
+
+    def _bucket(self, route: Hashable, now: float) -> Optional[_Bucket]:
+        """Token bucket маршрута (None — у вида маршрута нет своего лимита)"""
+        bucket = self._buckets.get(route)
+        if bucket is None:
+            limit = self.route_limits.get(route[0]) if isinstance(route, tuple) else None
+            if limit is None:
+                return None
+            # Полные (давно простаивающие) bucket'ы не нужны
+            if len(self._buckets) >= 1000:
+                for r in [r for r, b in self._buckets.items() if b.full(now)]:
+                    del self._buckets[r]
+            bucket = self._buckets[route] = _Bucket(int(limit[0]), float(limit[1]))
+        return bucket
+
+
+
+    def _next(self, now: float) -> Tuple[Optional[_Op], Optional[float]]:
+        """Самый важный запрос, маршрут которого не упёрся в лимит, и (если такого нет)
+        через сколько секунд освободится ближайший маршрут"""
+        skipped: List[_Op] = []
+        chosen: Optional[_Op] = None
+        delay: Optional[float] = None
+        while self._heap:
+            op = heapq.heappop(self._heap)
+            if op.future.cancelled():
+                if op.key is not None and self._keys.get(op.key) is op:
+                    del self._keys[op.key]
+                continue
+            bucket = self._bucket(op.route, now) if op.route is not None else None
+            wait = bucket.delay(now) if bucket is not None else 0.0
+            if wait <= 0:
+                chosen = op
+                break
+            if not op.throttled:
+                op.throttled = True
+                self.throttled += 1
+            delay = wait if delay is None else min(delay, wait)
+            skipped.append(op)
+
+        for op in skipped:
+            heapq.heappush(self._heap, op)
+        if chosen is not None:
+            if chosen.route in self._buckets:
+                self._buckets[chosen.route].tokens -= 1
+            if chosen.key is not None and self._keys.get(chosen.key) is chosen:
+                del self._keys[chosen.key]
+        return chosen, delay
+
+
+
+    async def _run(self) -> None:
+        while True:
+            await self._slots.acquire()
+            op = None
+            while op is None:
+                op, delay = self._next(time.monotonic())
+                if op is None:
+                    self._wake.clear()
+                    try:
+                        await asyncio.wait_for(self._wake.wait(), delay)
+                    except asyncio.TimeoutError:
+                        pass
+            task = self._loop.create_task(self._execute(op))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+
+
+    async def _execute(self, op: _Op) -> None:
+        wait = time.monotonic() - op.queued_at
+        stat = self._waits[op.priority]
+        stat[0] += 1
+        stat[1] += wait
+        stat[2] = max(stat[2], wait)
+        try:
+            result = await op.call()
+        except Exception as e:
+            self.failed += 1
+            if not op.future.done():
+                op.future.set_exception(e)
+        else:
+            self.sent += 1
+            if not op.future.done():
+                op.future.set_result(result)
+        finally:
+            self._slots.release()
+
+
+
+    def stats(self) -> Dict[str, Any]:
+        """Глубина очереди и ожидание (сек) по классам приоритета, счётчики запросов"""
+        depth = {name: 0 for name in PRIORITY_NAMES.values()}
+        for op in self._heap:
+            depth[PRIORITY_NAMES[op.priority]] += 1
+        waits = {
+            PRIORITY_NAMES[p]: {"count": int(c), "avg": (t / c) if c else 0.0, "max": m}
+            for p, (c, t, m) in self._waits.items()
+        }
+        return {
+            "depth": depth,
+            "wait": waits,
+            "running": len(self._running),
+            "submitted": self.submitted,
+            "sent": self.sent,
+            "failed": self.failed,
+            "coalesced": self.coalesced,
+            "throttled": self.throttled,
+            "routes": len(self._buckets),
+        }
+
+
+
+_dispatcher: Optional[Dispatcher] = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher() -> Dispatcher:
+    """Возвращает общий Dispatcher (создаётся при первом обращении)"""
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            limits = admin.get("dispatch.route_limits", {"channel": [5, 5.0]})
+            _dispatcher = Dispatcher(workers=int(admin.get("dispatch.workers", 4)),
+                                     route_limits={kind: (int(v[0]), float(v[1])) for kind, v in limits.items()})
+        return _dispatcher
@@ -0,0 +1,230 @@
+import asyncio
+import threading
+import time
+import pytz
+
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+
+from utils.db import Jobs
+from utils.adb import AsyncDB
+from utils.log import log_db
+from utils.scheduler import DeadlineScheduler, get_scheduler
+from config import admin
+
+
+MSK = pytz.timezone("Europe/Moscow")
+
+Handler = Callable[[Dict[str, Any]], Awaitable[Any]]
+
+
+
+class JobQueue:
+    """Очередь отложенных задач поверх таблицы jobs и DeadlineScheduler
+
+    Каждая задача сначала записывается в БД, а планировщик лишь будит
+    очередь к её сроку, поэтому задачи переживают перезапуск: при старте
+    просроченные задачи выполняются один раз (catch-up). Неудачная попытка
+    повторяется с экспоненциальной задержкой, после max_attempts задача
+    помечается failed.
+
+    Обработчик вида задачи: await handler(payload). Исключение — попытка
+    не удалась.
+
+    Args:
+        scheduler (DeadlineScheduler): Планировщик дедлайнов
+        max_attempts (int): Максимум попыток выполнения задачи
+        retry_base (int): Задержка перед первым повтором, сек (дальше удваивается)
+        retry_max (int): Максимальная задержка между повторами, сек
+        lease (int): Через сколько секунд задача в running считается зависшей
+    """
+
+    def __init__(self,
+                 scheduler: DeadlineScheduler,
+                 max_attempts: int = 5,
+                 retry_base: int = 30,
+                 retry_max: int = 3600,
+                 lease: int = 600) -> None:
+        self.db = AsyncDB(Jobs)
+        self.scheduler = scheduler
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.lease = lease
+
+        self._handlers: Dict[str, Handler] = {}
+        # Ежедневные задачи: {kind: (hour, minute, grace)}
+        self._daily: Dict[str, Tuple[int, int, int]] = {}
+        self._loaded: Set[str] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._reset_done = False
+
+        self.done = 0
+        self.retried = 0
+        self.failed = 0
+
+        scheduler.on("job", self._run)
+
+
+
+    def on(self, kind: str, handler: Handler) -> None:
+        """Регистрирует обработчик задач вида kind"""
+        self._handlers[kind] = handler
+
+
+
+    def daily(self, kind: str, hour: int, minute: int, handler: Handler, grace: int = 3600) -> None:
+        """Ежедневная задача в hour:minute МСК
+
+        Ключ задачи — kind и дата, поэтому за день она выполняется не более
+        одного раза. Если бот был выключен в срок, задача выполнится при
+        старте, но не позже чем через grace секунд после срока.
+        """
+        self._daily[kind] = (hour, minute, grace)
+        self.on(kind, handler)
+
+
+
+    async def start(self) -> None:
+        """Подхватывает задачи зарегистрированных видов (можно вызывать после каждой регистрации)"""
+        self._loop = asyncio.get_running_loop()
+        self.scheduler.start()
+
+        if not self._reset_done:
+            self._reset_done = True
+            await self.db.reset_running(int(time.time()) - self.lease)
+
+        for kind in list(self._handlers):
+            if kind in self._loaded:
+                continue
+            self._loaded.add(kind)
+            if kind in self._daily:
+                await self._ensure_daily(kind)
+            # Просроченные задачи сработают сразу, но выполнятся один раз (claim)
+            for job in await self.db.list_pending(kind):
+                self.scheduler.schedule(("job", job["ref"]), job["due_at"])
+            # Взятые до перезапуска (аренда ещё не истекла): claim подберёт их, когда истечёт
+            for job in await self.db.list_running(kind):
+                self.scheduler.schedule(("job", job["ref"]), int(job["updated_ts"]) + self.lease + 1)
+
+
+
+    async def put(self,
+                  kind: str,
+                  ref_id: Any,
+                  due_at: int,
+                  payload: Optional[Dict[str, Any]] = None,
+                  expires_at: Optional[int] = None) -> bool:
+        """Ставит задачу kind для объекта ref_id на due_at (переносит прежнюю ожидающую).
+        Возвращает True, если задача новая"""
+        ref = f"{kind}:{ref_id}"
+        key = f"{ref}:{int(due_at)}"
+        payload = payload if payload is not None else {"id": ref_id}
+        added = await self.db.enqueue(key, kind, ref, payload, int(due_at), expires_at)
+        # Уже стоящая в очереди задача запланирована раньше (put или start)
+        if added:
+            self.scheduler.schedule(("job", ref), int(due_at))
+        return added
+
+
+
+    async def cancel_ref(self, kind: str, ref_id: Any) -> None:
+        ref = f"{kind}:{ref_id}"
+        await self.db.cancel(ref)
+        self.scheduler.cancel(("job", ref))
+
+
+
+    # --- Интерфейс DB.scheduler: вызывается из потока писателя после записи ---
+    def schedule(self, key: Tuple[str, Any], ts: int) -> None:
+        self._spawn(self.put(key[0], key[1], ts))
+
+    def cancel(self, key: Tuple[str, Any]) -> None:
+        self._spawn(self.cancel_ref(key[0], key[1]))
+
+    def _spawn(self, coro: Awaitable[Any]) -> None:
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            # Очередь ещё не запущена: задачи подхватит load_deadlines сервиса
+            coro.close()
+            return
+        loop.call_soon_threadsafe(lambda: loop.create_task(coro))
+
+
+
+    async def _ensure_daily(self, kind: str) -> None:
+        """Ставит задачу kind на сегодня (если срок + grace не прошли) и на завтра"""
+        hour, minute, grace = self._daily[kind]
+        now = datetime.now(MSK)
+        for days in (0, 1):
+            day = (now + timedelta(days=days)).date()
+            due = int(MSK.localize(datetime(day.year, day.month, day.day, hour, minute)).timestamp())
+            if due + grace < time.time():
+                continue
+            await self.put(kind, day.isoformat(), due, {"date": day.isoformat()}, expires_at=due + grace)
+
+
+
+    def _backoff(self, attempts: int) -> int:
+        return min(self.retry_max, self.retry_base * 2 ** max(0, attempts - 1))
+
+
+
+    async def _run(self, ref: str) -> None:
+        now = int(time.time())
+        job = await self.db.claim(ref, now, now - self.lease)
+        # Задачу уже выполнил другой экземпляр, отменили или перенесли
+        if job is None:
+            return
+
+        kind = job["kind"]
+        try:
+            handler = self._handlers.get(kind)
+            if handler is None:
+                raise RuntimeError(f"нет обработчика для '{kind}'")
+
+            if job["expires_at"] is not None and now > int(job["expires_at"]):
+                await self.db.finish(job["id"], "expired")
+                log_db("WARN", f"jobs: {job['key']} просрочена, пропущена")
+                return
+
+            await handler(job["payload"])
+            await self.db.finish(job["id"])
+            self.done += 1
+        except Exception as e:
+            attempts = int(job["attempts"])
+            if attempts < self.max_attempts:
+                due = int(time.time()) + self._backoff(attempts)
+                await self.db.retry(job["id"], due, str(e))
+                self.scheduler.schedule(("job", ref), due)
+                self.retried += 1
+                log_db("WARN", f"jobs: {job['key']} попытка {attempts} не удалась, повтор", str(e))
+            else:
+                await self.db.finish(job["id"], "failed", str(e))
+                self.failed += 1
+                log_db("ERROR", f"jobs: {job['key']} не выполнена за {attempts} попыток", str(e))
+        finally:
+            if kind in self._daily:
+                await self._ensure_daily(kind)
+
+
+
+    def stats(self) -> Dict[str, Any]:
+        return {"done": self.done, "retried": self.retried, "failed": self.failed}
+
+
+
+_queue: Optional[JobQueue] = None
+_queue_lock = threading.Lock()
+
+
+def get_queue() -> JobQueue:
+    """Возвращает общую JobQueue (создаётся при первом обращении)"""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = JobQueue(get_scheduler(),
+                              max_attempts=int(admin.get("jobs.max_attempts", 5)),
+                              retry_base=int(admin.get("jobs.retry_base", 30)),
+                              retry_max=int(admin.get("jobs.retry_max", 3600)))
+        return _queue
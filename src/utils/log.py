@@ -1,4 +1,140 @@
+import atexit
+import queue
+import threading
+import time
+import pytz
+
+from datetime import datetime
+from typing import Any, Dict, Optional, List, Tuple
+
 from utils.db import Log
+from config import admin
+
+
+MSK = pytz.timezone("Europe/Moscow")
+
+_STOP = object()
+
+
+
+class LogSink:
+    """Долгоживущий приёмник логов: ограниченная очередь + фоновый поток,
+    который пишет записи пачками (executemany) через одно соединение
+
+    Args:
+        flush_latency (float): Максимальная задержка записи, сек
+        max_queue (int): Размер очереди
+        overflow (str): Поведение при переполнении очереди: "drop" (отбросить) или "block"
+            (ждать не дольше block_timeout, затем отбросить)
+        batch_size (int): Максимальный размер одной пачки
+        block_timeout (float): Сколько ждать места в очереди в режиме "block", сек
+    """
+
+    def __init__(self,
+                 flush_latency: float = 1.0,
+                 max_queue: int = 1000,
+                 overflow: str = "drop",
+                 batch_size: int = 100,
+                 block_timeout: float = 0.05) -> None:
+        self.flush_latency = flush_latency
+        self.overflow = overflow
+        self.batch_size = batch_size
+        self.block_timeout = block_timeout
+        self.dropped = 0
+
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._run, name="log-sink", daemon=True)
+        self._thread.start()
+
+        atexit.register(self.close)
+
+
+
+    def put(self, level: str, message: str, reason: Optional[str] = None) -> bool:
+        """Ставит запись в очередь. Возвращает False, если запись отброшена
+
+        put вызывается из event loop, поэтому даже в режиме "block" ожидание
+        ограничено block_timeout — иначе медленный диск останавливает бота
+        """
+        row = (level.upper(), message, reason, datetime.now(MSK).isoformat())
+
+        try:
+            if self.overflow == "block":
+                self._queue.put(row, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(row)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        return True
+
+
+
+    def stats(self) -> Dict[str, Any]:
+        return {"queued": self._queue.qsize(), "dropped": self.dropped}
+
+
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Дописывает очередь и останавливает поток"""
+        if not self._thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+
+
+    def _collect(self, first: Tuple) -> Tuple[List[Tuple], bool]:
+        """Добирает пачку до batch_size или до истечения flush_latency"""
+        batch = [first]
+        deadline = time.monotonic() + self.flush_latency
+        while len(batch) < self.batch_size:
+            left = deadline - time.monotonic()
+            if left <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=left)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+
+
+    def _run(self) -> None:
+        # Соединение создаётся в потоке писателя и живёт всё время работы бота
+        log = Log()
+        stop = False
+        while not stop:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+
+            batch, stop = self._collect(item)
+            try:
+                log.write_many(batch)
+            except Exception as e:
+                print(f"Ошибка записи логов ({len(batch)} шт.): {e}")
+        log.close()
+
+
+
+_sink: Optional[LogSink] = None
+_sink_lock = threading.Lock()
+
+
+def get_sink() -> LogSink:
+    """Возвращает общий LogSink (создаётся при первом обращении)"""
+    global _sink
+    with _sink_lock:
+        if _sink is None:
+            _sink = LogSink(flush_latency=float(admin.get("log.flush_latency", 1.0)),
+                            max_queue=int(admin.get("log.queue_size", 1000)),
+                            overflow=str(admin.get("log.overflow", "drop")),
+                            block_timeout=float(admin.get("log.block_timeout", 0.05)))
+        return _sink
 
 
 
@@ -7,7 +143,7 @@ def log_db(level: str = "INFO",
            reason: str = ""):
 
     """
-        Пишет в log.db лог
+        Пишет в log.db лог (асинхронно, через общий LogSink)
 
         Args:
             level (str): Уровень логирования (INFO, WARN, ERROR)
@@ -15,9 +151,8 @@ def log_db(level: str = "INFO",
             reason (str): причина (если есть)
 
         Returns:
-            1: Логирование прошло успешно
-            0: Ошибка
+            1: Запись поставлена в очередь
+            0: Запись отброшена (очередь переполнена)
     """
 
-    log = Log()
-    log.write(level=level, message=message, reason=reason)
+    return 1 if get_sink().put(level=level, message=message, reason=reason) else 0
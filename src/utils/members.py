@@ -0,0 +1,180 @@
+import asyncio
+import threading
+import interactions
+
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+
+
+class MemberIndex:
+    """Индекс участников серверов в памяти: роль → участники и id → участник
+
+    Строится один раз на сервер (build: guild.chunk() и обход участников),
+    дальше обновляется событиями шлюза (MemberAdd/MemberUpdate/MemberRemove,
+    RoleDelete). Выборка участников роли и поиск по списку id стоят
+    O(размер результата), а не O(участников сервера).
+
+    Все методы вызываются из event loop бота.
+    """
+
+    def __init__(self) -> None:
+        # {guild_id: {member_id: member}}
+        self._members: Dict[int, Dict[int, Any]] = {}
+        # {guild_id: {role_id: {member_id}}}
+        self._roles: Dict[int, Dict[int, Set[int]]] = {}
+        # {guild_id: {member_id: {role_id}}} — для разницы при обновлении
+        self._member_roles: Dict[int, Dict[int, Set[int]]] = {}
+        self._building: Dict[int, asyncio.Task] = {}
+
+
+
+    def ready(self, guild_id: int) -> bool:
+        return int(guild_id) in self._members
+
+
+
+    async def build(self, guild: interactions.Guild) -> None:
+        """Строит индекс сервера (один раз; повторные вызовы ждут первый)"""
+        gid = int(guild.id)
+        if gid in self._members:
+            return
+        task = self._building.get(gid)
+        if task is None:
+            task = self._building[gid] = asyncio.get_running_loop().create_task(self._build(guild))
+            task.add_done_callback(lambda _: self._building.pop(gid, None))
+        await asyncio.shield(task)
+
+
+
+    async def _build(self, guild: interactions.Guild) -> None:
+        gid = int(guild.id)
+        await guild.chunk()
+        self._members[gid] = {}
+        self._roles[gid] = {}
+        self._member_roles[gid] = {}
+        for member in guild.members:
+            self.add(gid, member)
+
+
+
+    def _role_ids(self, member: Any) -> Set[int]:
+        return {int(r.id) for r in member.roles}
+
+
+
+    def add(self, guild_id: int, member: Any) -> None:
+        """Участник пришёл на сервер (или изменился)"""
+        gid = int(guild_id)
+        members = self._members.get(gid)
+        # Индекс сервера ещё не построен: build возьмёт участника из кэша сервера
+        if members is None:
+            return
+        mid = int(member.id)
+        members[mid] = member
+
+        new = self._role_ids(member)
+        old = self._member_roles[gid].get(mid, set())
+        roles = self._roles[gid]
+        for rid in old - new:
+            holders = roles.get(rid)
+            if holders is not None:
+                holders.discard(mid)
+                if not holders:
+                    del roles[rid]
+        for rid in new - old:
+            roles.setdefault(rid, set()).add(mid)
+        self._member_roles[gid][mid] = new
+
+
+
+    def update(self, guild_id: int, member: Any) -> None:
+        """Участник изменился (роли, ник): индекс ролей обновляется по разнице"""
+        self.add(guild_id, member)
+
+
+
+    def remove(self, guild_id: int, member_id: int) -> None:
+        """Участник ушёл с сервера (вышел, кикнут, забанен)"""
+        gid, mid = int(guild_id), int(member_id)
+        members = self._members.get(gid)
+        if members is None:
+            return
+        members.pop(mid, None)
+        roles = self._roles[gid]
+        for rid in self._member_roles[gid].pop(mid, set()):
+            holders = roles.get(rid)
+            if holders is not None:
+                holders.discard(mid)
+                if not holders:
+                    del roles[rid]
+
+
+
+    def remove_role(self, guild_id: int, role_id: int) -> None:
+        """Роль удалена с сервера"""
+        gid, rid = int(guild_id), int(role_id)
+        if gid not in self._members:
+            return
+        for mid in self._roles[gid].pop(rid, set()):
+            self._member_roles[gid].get(mid, set()).discard(rid)
+
+
+
+    def get_member(self, guild_id: int, member_id: int) -> Optional[Any]:
+        members = self._members.get(int(guild_id))
+        return members.get(int(member_id)) if members is not None else None
+
+
+
+    def members_with_role(self, guild_id: int, role_id: int) -> List[Any]:
+        """Участники с ролью role_id (индекс сервера должен быть построен)"""
+        gid = int(guild_id)
+        members = self._members.get(gid, {})
+        return [members[mid] for mid in self._roles.get(gid, {}).get(int(role_id), ()) if mid in members]
+
+
+
+    def joined_since(self, guild_id: int, since_ts: float) -> List[Any]:
+        """Участники, пришедшие на сервер не раньше since_ts (UTC epoch), от новых к старым"""
+        members = self._members.get(int(guild_id), {})
+        joined = [(m.joined_at.timestamp(), m) for m in members.values()
+                  if getattr(m, "joined_at", None) is not None and m.joined_at.timestamp() >= since_ts]
+        return [m for _, m in sorted(joined, key=lambda x: x[0], reverse=True)]
+
+
+
+    def resolve(self, guild_id: int, member_ids: Iterable[int]) -> Tuple[List[Any], List[int]]:
+        """Участники по списку id: (найденные, id не найденных)"""
+        members = self._members.get(int(guild_id), {})
+        found: List[Any] = []
+        missing: List[int] = []
+        for mid in dict.fromkeys(int(x) for x in member_ids):
+            member = members.get(mid)
+            if member is not None:
+                found.append(member)
+            else:
+                missing.append(mid)
+        return found, missing
+
+
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "guilds": len(self._members),
+            "members": sum(len(m) for m in self._members.values()),
+            "roles": sum(len(r) for r in self._roles.values()),
+        }
+
+
+
+_index: Optional[MemberIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_members() -> MemberIndex:
+    """Возвращает общий MemberIndex (создаётся при первом обращении)"""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = MemberIndex()
+        return _index
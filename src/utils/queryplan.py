@@ -0,0 +1,179 @@
+"""Проверка планов запросов репозиториев (EXPLAIN QUERY PLAN)
+
+Запуск из каталога src:
+
+    python -m utils.queryplan
+
+Каждый «горячий» метод репозитория вызывается на временной БД, все
+выполненные им запросы прогоняются через EXPLAIN QUERY PLAN. Если хоть
+один из них читает таблицу полным сканированием (SCAN <table> без
+индекса), проверка завершается с кодом 1.
+"""
+
+import os
+import re
+import sys
+import tempfile
+from typing import Any, List, Tuple, Type
+
+from utils.db import DB, Users, Events, MoviePolls, Jobs, RoleJobs, Mutes
+
+
+# Полное сканирование таблицы: "SCAN users", но не "SCAN users USING INDEX ..."
+_FULL_SCAN = re.compile(r"^SCAN (\w+)$")
+
+
+class _RecordingCursor:
+    """Обёртка курсора, запоминающая выполненные запросы"""
+
+    def __init__(self, cursor, log: List[Tuple[str, Any]]) -> None:
+        self._cursor = cursor
+        self._log = log
+
+    def execute(self, sql: str, params: Any = ()):
+        self._log.append((sql, params))
+        return self._cursor.execute(sql, params)
+
+    def executemany(self, sql: str, rows: Any):
+        rows = list(rows)
+        if rows:
+            self._log.append((sql, rows[0]))
+        return self._cursor.executemany(sql, rows)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._cursor, name)
+
+
+
+# (репозиторий, метод, аргументы) — в порядке вызова, т.к. часть методов пишет данные
+HOT_QUERIES: List[Tuple[Type[DB], str, tuple]] = [
+    (Users, "increment_messages", (1,)),
+    (Users, "flush_messages", ()),
+    (Users, "get_user", (1,)),
+    (Users, "add_warn", (1, 1)),
+    (Users, "remove_warn", (1, 1)),
+    (Users, "clear_warns", (1,)),
+    (Users, "add_warn", (1, 1, 2, "r", 1_900_000_000)),
+    (Users, "remove_warn", (1, 1, 2, "r")),
+    (Users, "clear_warns", (1, 2, "r")),
+    (Users, "decay_warns", (1_900_000_000,)),
+    (Users, "warn_history", (1, 10)),
+    (Users, "warn_history", (1, 10, (1_900_000_000, 5))),
+    (Users, "update_birthday", (1, "01.01")),
+    (Users, "get_birthday_users_by_date", ("01.01",)),
+    (Users, "get_all_users_with_birthday", ()),
+    (Users, "get_leaderboard", (10,)),
+
+    (Events, "add_event", (1, "t", "", 10, "planned", 1_900_000_000)),
+    (Events, "get_event", (1,)),
+    (Events, "list_events", (200,)),
+    (Events, "list_events_between", (1_899_990_000, 1_900_040_000)),
+    (Events, "add_participant", (1, 2)),
+    (Events, "is_participant", (1, 2)),
+    (Events, "list_participants", (1,)),
+    (Events, "remove_participant", (1, 2)),
+    (Events, "list_need_notification", (1_899_999_760, 1_900_000_360)),
+    (Events, "list_planned", (1_899_990_000,)),
+    (Events, "set_status", (1, "notified")),
+
+    (MoviePolls, "add_poll", (1, "t", "", 1_900_000_000)),
+    (MoviePolls, "add_option", (1, "a", None, 1)),
+    (MoviePolls, "add_option", (1, "b", None, 1)),
+    (MoviePolls, "get_poll", (1,)),
+    (MoviePolls, "get_latest_open_poll", ()),
+    (MoviePolls, "list_polls_overdue", (1_900_000_060,)),
+    (MoviePolls, "list_open_polls", ()),
+    (MoviePolls, "list_options", (1,)),
+    (MoviePolls, "upsert_vote", (1, 1, 1)),
+    (MoviePolls, "upsert_vote", (1, 2, 2)),
+    (MoviePolls, "get_user_vote", (1, 1)),
+    (MoviePolls, "count_votes_by_option", (1,)),
+    (MoviePolls, "top_tied_options", (1,)),
+    (MoviePolls, "pick_winner", (1,)),
+    (MoviePolls, "keep_only_options", (1, [1, 2])),
+    (MoviePolls, "reset_votes", (1,)),
+    (MoviePolls, "set_poll_end", (1, 1_900_000_600)),
+    (MoviePolls, "set_poll_status", (1, "closed")),
+
+    (Jobs, "enqueue", ("poll_close:1:1900000000", "poll_close", "poll_close:1", {"id": 1}, 1_900_000_000)),
+    (Jobs, "enqueue", ("poll_close:1:1900000600", "poll_close", "poll_close:1", {"id": 1}, 1_900_000_600)),
+    (Jobs, "list_pending", ()),
+    (Jobs, "list_pending", ("poll_close",)),
+    (Jobs, "claim", ("poll_close:1", 1_900_000_600)),
+    (Jobs, "claim", ("poll_close:1", 1_900_000_600, 1_899_999_400)),
+    (Jobs, "list_running", ("poll_close",)),
+    (Jobs, "retry", (2, 1_900_000_700, "err")),
+    (Jobs, "claim", ("poll_close:1", 1_900_000_700)),
+    (Jobs, "finish", (2,)),
+    (Jobs, "reset_running", (1_900_000_000,)),
+    (Jobs, "cancel", ("poll_close:1",)),
+
+    (RoleJobs, "create_job", (1, 2, "add", [10, 11, 12], "r", 3)),
+    (RoleJobs, "set_results", (1, [(10, "done", None), (11, "failed", "err")])),
+    (RoleJobs, "get_job", (1,)),
+    (RoleJobs, "list_unfinished", ()),
+    (RoleJobs, "list_targets", (1,)),
+    (RoleJobs, "list_targets", (1, "pending")),
+    (RoleJobs, "count_by_status", (1,)),
+    (RoleJobs, "finish_job", (1,)),
+
+    (Mutes, "set_mute", (1, 10, 5, 1_900_000_000, 3, "r")),
+    (Mutes, "get_mute", (1, 10)),
+    (Mutes, "list_expired", (1_900_000_000,)),
+    (Mutes, "list_active", (1_900_000_000,)),
+    (Mutes, "remove_mutes", ([(1, 10), (1, 11)],)),
+]
+
+
+
+def check_query_plans() -> List[str]:
+    """Возвращает список найденных полных сканирований ("Класс.метод: SQL -> план")"""
+    failures: List[str] = []
+
+    with tempfile.TemporaryDirectory() as tmp:
+        repos = {}
+        for cls in {cls for cls, _, _ in HOT_QUERIES}:
+            path = os.path.join(tmp, os.path.basename(cls.DB_PATH))
+            sub = type(cls.__name__, (cls,), {"DB_PATH": path})
+            repos[cls] = sub()
+
+        for cls, name, args in HOT_QUERIES:
+            db = repos[cls]
+            log: List[Tuple[str, Any]] = []
+            # Кэш сущностей иначе отвечал бы без запросов к БД
+            if db.cache is not None:
+                db.cache.clear()
+            plain = db.cursor
+            db.cursor = _RecordingCursor(plain, log)
+            try:
+                getattr(db, name)(*args)
+            finally:
+                db.cursor = plain
+
+            for sql, params in log:
+                if sql.lstrip().upper().startswith(("CREATE", "PRAGMA")):
+                    continue
+                plan = db.conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+                for row in plan:
+                    detail = row[3]
+                    if _FULL_SCAN.match(detail):
+                        failures.append(f"{cls.__name__}.{name}: {' '.join(sql.split())} -> {detail}")
+
+        for db in repos.values():
+            db.conn.close()
+
+    return failures
+
+
+
+def main() -> int:
+    failures = check_query_plans()
+    for f in failures:
+        print(f"FULL SCAN  {f}")
+    print(f"{len(HOT_QUERIES)} методов проверено, полных сканирований: {len(failures)}")
+    return 1 if failures else 0
+
+
+
+if __name__ == "__main__":
+    sys.exit(main())
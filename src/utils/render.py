@@ -0,0 +1,242 @@
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from utils.dispatch import SUPERSEDED
+from utils.log import log_db
+
+
+def _plain(obj: Any) -> Any:
+    """Embed/компоненты interactions → обычные dict/list (для хэша)"""
+    if hasattr(obj, "to_dict"):
+        return _plain(obj.to_dict())
+    if isinstance(obj, dict):
+        return {str(k): _plain(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_plain(x) for x in obj]
+    return obj
+
+
+def _digest(value: Any) -> str:
+    data = json.dumps(_plain(value), sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+
+
+class RenderRegistry:
+    """Последний отправленный payload сообщений (хэши по полям), чтобы не
+    отправлять правки, которые ничего не меняют
+
+    Хранится хэш каждого поля правки (embed, components, content, ...).
+    Правка отправляется, если хоть одно переданное поле отличается от
+    последнего отправленного.
+
+    Args:
+        max_entries (int): Сколько сообщений помнить (самые старые забываются)
+    """
+
+    def __init__(self, max_entries: int = 1000) -> None:
+        self.max_entries = max_entries
+        self._sent: "OrderedDict[int, Dict[str, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.sent = 0
+        self.skipped = 0
+
+
+
+    def _diff(self, message_id: int, payload: Dict[str, Any]) -> Optional[Dict[str, str]]:
+        """Хэши полей payload, если хоть одно изменилось, иначе None"""
+        digests = {field: _digest(value) for field, value in payload.items()}
+        with self._lock:
+            last = self._sent.get(message_id)
+            if last is not None and all(last.get(f) == d for f, d in digests.items()):
+                self._sent.move_to_end(message_id)
+                return None
+        return digests
+
+
+
+    def _remember(self, message_id: int, digests: Dict[str, str]) -> None:
+        with self._lock:
+            last = self._sent.setdefault(message_id, {})
+            last.update(digests)
+            self._sent.move_to_end(message_id)
+            while len(self._sent) > self.max_entries:
+                self._sent.popitem(last=False)
+
+
+
+    def forget(self, message_id: int) -> None:
+        """Состояние сообщения неизвестно (правка упала, сообщение удалено)"""
+        with self._lock:
+            self._sent.pop(int(message_id), None)
+
+
+
+    def remember(self, message_id: int, **payload: Any) -> None:
+        """Запоминает payload, отправленный в обход registry (например, при создании сообщения)"""
+        self._remember(int(message_id), {field: _digest(value) for field, value in payload.items()})
+
+
+
+    async def edit(self, message: Any, **payload: Any) -> bool:
+        """message.edit(**payload), если payload изменился. Возвращает True, если правка отправлена"""
+        mid = int(message.id)
+        digests = self._diff(mid, payload)
+        if digests is None:
+            self.skipped += 1
+            return False
+        try:
+            await message.edit(**payload)
+        except Exception:
+            self.forget(mid)
+            raise
+        self._remember(mid, digests)
+        self.sent += 1
+        return True
+
+
+
+    async def edit_by_id(self,
+                         message_id: int,
+                         edit: Callable[..., Awaitable[Any]],
+                         **payload: Any) -> bool:
+        """Как edit, но по id сообщения: правка отправляется через await edit(**payload)
+        (например, ChannelCache.edit_message без запроса сообщения)"""
+        mid = int(message_id)
+        digests = self._diff(mid, payload)
+        if digests is None:
+            self.skipped += 1
+            return False
+        try:
+            result = await edit(**payload)
+        except Exception:
+            self.forget(mid)
+            raise
+        # Правку заменила более новая в очереди Dispatcher: запомнит та
+        if result is SUPERSEDED:
+            self.skipped += 1
+            return False
+        self._remember(mid, digests)
+        self.sent += 1
+        return True
+
+
+
+    async def edit_origin(self, ctx: Any, **payload: Any) -> bool:
+        """ctx.edit_origin(**payload) для компонента; без изменений — только подтверждение
+        взаимодействия (defer). Возвращает True, если правка отправлена"""
+        mid = int(ctx.message.id)
+        digests = self._diff(mid, payload)
+        if digests is None:
+            self.skipped += 1
+            await ctx.defer(edit_origin=True)
+            return False
+        try:
+            await ctx.edit_origin(**payload)
+        except Exception:
+            self.forget(mid)
+            raise
+        self._remember(mid, digests)
+        self.sent += 1
+        return True
+
+
+
+    def stats(self) -> Dict[str, Any]:
+        """Счётчики отправленных и пропущенных (ничего не менявших) правок"""
+        total = self.sent + self.skipped
+        return {
+            "sent": self.sent,
+            "skipped": self.skipped,
+            "skip_rate": (self.skipped / total) if total else 0.0,
+            "messages": len(self._sent),
+        }
+
+
+
+_renders: Optional[RenderRegistry] = None
+_renders_lock = threading.Lock()
+
+
+def get_renders() -> RenderRegistry:
+    """Возвращает общий RenderRegistry (создаётся при первом обращении)"""
+    global _renders
+    with _renders_lock:
+        if _renders is None:
+            _renders = RenderRegistry()
+        return _renders
+
+
+
+class RenderCoalescer:
+    """Объединяет частые перерисовки одного сообщения
+
+    mark(key, render) помечает сообщение «грязным». Перерисовка (await render())
+    выполняется не чаще раза в window секунд: первая — сразу, следующие —
+    в конце окна, один раз за все пометки, накопившиеся за окно, и уже с
+    актуальными данными. N пометок за окно стоят O(1) правок.
+
+    Args:
+        window (float): Минимальный интервал между перерисовками одного ключа, сек
+    """
+
+    def __init__(self, window: float = 2.0) -> None:
+        self.window = window
+        self._last: Dict[Any, float] = {}
+        self._tasks: Dict[Any, asyncio.Task] = {}
+        self._dirty: Dict[Any, Callable[[], Awaitable[Any]]] = {}
+
+        self.marks = 0
+        self.renders = 0
+
+
+
+    def mark(self, key: Any, render: Callable[[], Awaitable[Any]]) -> None:
+        """Помечает key для перерисовки (вызывать из event loop)"""
+        self.marks += 1
+        self._dirty[key] = render
+        if key not in self._tasks:
+            self._tasks[key] = asyncio.get_running_loop().create_task(self._flush(key))
+
+
+
+    def discard(self, key: Any) -> None:
+        """Снимает ожидающую перерисовку key (например, сообщение больше не должно меняться)"""
+        self._dirty.pop(key, None)
+
+
+
+    async def _flush(self, key: Any) -> None:
+        try:
+            while True:
+                delay = self._last.get(key, 0.0) + self.window - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+                # За окно пометок не было или их снял discard — задача и ключ забываются
+                render = self._dirty.pop(key, None)
+                if render is None:
+                    break
+
+                # Пометки во время перерисовки запустят ещё одну, уже после окна
+                self._last[key] = time.monotonic()
+                self.renders += 1
+                try:
+                    await render()
+                except Exception as e:
+                    log_db("ERROR", f"render: перерисовка {key} не удалась", str(e))
+        finally:
+            self._tasks.pop(key, None)
+            self._last.pop(key, None)
+
+
+
+    def stats(self) -> Dict[str, Any]:
+        """Пометок против фактических перерисовок"""
+        return {"marks": self.marks, "renders": self.renders, "pending": len(self._dirty)}
@@ -0,0 +1,197 @@
+import asyncio
+import heapq
+import threading
+import time
+
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Set, Tuple
+
+from utils.log import log_db
+from config import admin
+
+
+# Ключ дедлайна: (вид, id), например ("poll_close", message_id)
+Key = Tuple[str, Hashable]
+
+
+
+class DeadlineScheduler:
+    """Планировщик дедлайнов на min-heap
+
+    Хранит по одному дедлайну (UTC epoch, сек) на ключ и спит до ближайшего,
+    вместо того чтобы раз в минуту опрашивать БД. Когда дедлайн наступает,
+    вызывается обработчик вида ключа: handler(id). Повторный schedule того же
+    ключа переносит дедлайн, cancel — снимает его (старые записи кучи
+    отбрасываются лениво).
+
+    schedule/cancel можно вызывать из любого потока (например, из потока
+    писателя AsyncDB): изменения передаются в event loop планировщика.
+
+    Args:
+        lag_warn (float): Опоздание срабатывания (сек), после которого пишется WARN-лог
+    """
+
+    def __init__(self, lag_warn: float = 5.0) -> None:
+        self.lag_warn = lag_warn
+
+        self._heap: List[Tuple[float, int, Key]] = []
+        self._deadlines: Dict[Key, float] = {}
+        self._seq = 0
+        self._handlers: Dict[str, Callable[[Any], Awaitable[Any]]] = {}
+        self._lock = threading.Lock()
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._runner: Optional[asyncio.Task] = None
+        self._running: Set[asyncio.Task] = set()
+
+        self.fired = 0
+        self.lag_last = 0.0
+        self.lag_max = 0.0
+        self._lag_total = 0.0
+
+
+
+    def on(self, kind: str, handler: Callable[[Any], Awaitable[Any]]) -> None:
+        """Регистрирует обработчик дедлайнов вида kind: await handler(id)"""
+        self._handlers[kind] = handler
+
+
+
+    def schedule(self, key: Key, ts: float) -> None:
+        """Ставит (или переносит) дедлайн ключа на ts"""
+        with self._lock:
+            self._deadlines[key] = ts
+            self._seq += 1
+            heapq.heappush(self._heap, (ts, self._seq, key))
+        self._notify()
+
+
+
+    def cancel(self, key: Key) -> None:
+        """Снимает дедлайн ключа (если он был)"""
+        with self._lock:
+            self._deadlines.pop(key, None)
+        self._notify()
+
+
+
+    def deadline(self, key: Key) -> Optional[float]:
+        with self._lock:
+            return self._deadlines.get(key)
+
+
+
+    def _notify(self) -> None:
+        """Будит цикл: ближайший дедлайн мог измениться"""
+        loop, wake = self._loop, self._wake
+        if loop is None or wake is None or loop.is_closed():
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            wake.set()
+        else:
+            loop.call_soon_threadsafe(wake.set)
+
+
+
+    def start(self) -> None:
+        """Запускает цикл в текущем event loop (одиночный старт)"""
+        if self._runner is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._runner = self._loop.create_task(self._run())
+
+
+
+    def _pop_due(self, now: float) -> Tuple[List[Tuple[Key, float]], Optional[float]]:
+        """Снимает с кучи наступившие дедлайны. Возвращает их и время следующего"""
+        due: List[Tuple[Key, float]] = []
+        with self._lock:
+            while self._heap:
+                ts, _, key = self._heap[0]
+                # Перенесённый или снятый дедлайн — устаревшая запись кучи
+                if self._deadlines.get(key) != ts:
+                    heapq.heappop(self._heap)
+                    continue
+                if ts > now:
+                    return due, ts
+                heapq.heappop(self._heap)
+                del self._deadlines[key]
+                due.append((key, ts))
+        return due, None
+
+
+
+    async def _run(self) -> None:
+        while True:
+            due, next_ts = self._pop_due(time.time())
+            for key, ts in due:
+                self._fire(key, ts)
+
+            self._wake.clear()
+            timeout = None if next_ts is None else max(0.0, next_ts - time.time())
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+
+
+    def _fire(self, key: Key, ts: float) -> None:
+        lag = max(0.0, time.time() - ts)
+        self.fired += 1
+        self.lag_last = lag
+        self.lag_max = max(self.lag_max, lag)
+        self._lag_total += lag
+        if lag > self.lag_warn:
+            log_db("WARN", f"scheduler: {key[0]}:{key[1]} сработал с опозданием {lag:.1f} с")
+
+        handler = self._handlers.get(key[0])
+        if handler is None:
+            return
+        # Обработчики не задерживают остальные дедлайны
+        task = asyncio.get_running_loop().create_task(self._call(handler, key))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+
+
+    async def _call(self, handler: Callable[[Any], Awaitable[Any]], key: Key) -> None:
+        try:
+            await handler(key[1])
+        except Exception as e:
+            log_db("ERROR", f"scheduler: обработчик {key[0]}:{key[1]} упал", str(e))
+
+
+
+    def stats(self) -> Dict[str, Any]:
+        """Количество дедлайнов и опоздание срабатываний, сек"""
+        with self._lock:
+            pending = len(self._deadlines)
+            next_ts = min(self._deadlines.values()) if self._deadlines else None
+        return {
+            "pending": pending,
+            "next_ts": next_ts,
+            "fired": self.fired,
+            "lag_last": self.lag_last,
+            "lag_max": self.lag_max,
+            "lag_avg": (self._lag_total / self.fired) if self.fired else 0.0,
+        }
+
+
+
+_scheduler: Optional[DeadlineScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> DeadlineScheduler:
+    """Возвращает общий DeadlineScheduler (создаётся при первом обращении)"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = DeadlineScheduler(lag_warn=float(admin.get("scheduler.lag_warn", 5.0)))
+        return _scheduler
@@ -0,0 +1,25 @@
+from typing import Any, Dict
+
+from utils.db import Users, Events, MoviePolls
+from utils.dispatch import get_dispatcher
+from utils.scheduler import get_scheduler
+from utils.jobs import get_queue
+from utils.render import get_renders
+from utils.channels import get_channels
+from utils.members import get_members
+from utils.log import get_sink
+
+
+
+def snapshot() -> Dict[str, Dict[str, Any]]:
+    """Текущие счётчики общих компонентов бота: {компонент: stats()}"""
+    return {
+        "dispatch": get_dispatcher().stats(),
+        "scheduler": get_scheduler().stats(),
+        "jobs": get_queue().stats(),
+        "renders": get_renders().stats(),
+        "channels": get_channels().stats(),
+        "members": get_members().stats(),
+        "log": get_sink().stats(),
+        "cache": {repo.cache.name: repo.cache.stats() for repo in (Users, Events, MoviePolls)},
+    }
@@ -1,27 +1,50 @@
+import copy
 import os
 import tomllib
 import tomli_w
 
-from typing import Dict, Any
+from typing import Dict, Any, Optional, Tuple
 
 class TomlIO:
 
     def __init__(self, path: str) -> None:
         self.path = os.path.abspath(path)
+        # Разобранный файл и его (mtime, size): перечитывается только после изменения
+        self._cache: Optional[Tuple[Tuple[int, int], Dict[str, Any]]] = None
 
 
-    def _read(self) -> Dict[str, Any]:
-        """Возвращает всё содержимое файла как dict"""
+    def version(self) -> Optional[Tuple[int, int]]:
+        """(mtime_ns, size) файла или None, если файла нет — меняется при каждом изменении конфига"""
         try:
-            with open(self.path, "rb") as f:
-                return tomllib.load(f)
-        except (FileNotFoundError, OSError):
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+
+    def _load(self) -> Dict[str, Any]:
+        """Разобранный файл из кэша (не изменять!)"""
+        stamp = self.version()
+        if stamp is None:
             return {}
+        if self._cache is None or self._cache[0] != stamp:
+            try:
+                with open(self.path, "rb") as f:
+                    self._cache = (stamp, tomllib.load(f))
+            except (FileNotFoundError, OSError):
+                return {}
+        return self._cache[1]
+
+    def _read(self) -> Dict[str, Any]:
+        """Возвращает всё содержимое файла как dict"""
+        # Копия: set/delete меняют полученный dict
+        return copy.deepcopy(self._load())
 
     def _write(self, data: Dict[str, Any]) -> None:
         """Перезаписывает файл целиком"""
         with open(self.path, "wb") as f:
             tomli_w.dump(data, f)
+        self._cache = None
 
 
     @staticmethod
@@ -45,10 +68,10 @@ class TomlIO:
     def get(self, key: str, default: Any = None) -> Any:
         """Получить значение. Если ключ не найден - вернёт default"""
         try:
-            data = self._read()
-            return self._nested_get(data, key)
+            value = self._nested_get(self._load(), key)
         except KeyError:
             return default
+        return copy.deepcopy(value) if isinstance(value, (dict, list)) else value
 
     def set(self, key: str, value: Any) -> None:
         """Установить значение по ключу и сохранить файл"""